@@ -0,0 +1,288 @@
+"""Историческое тестирование рекомендаций оптимизатора
+
+Портфель ежемесячно пересматривается на исторические даты - к нему применяются все сделки, рекомендуемые
+оптимизатором, а полученные между пересмотрами дивиденды после уплаты налогов зачисляются в кэш. Стоимость портфеля
+сравнивается с индексом полной доходности MCFTRR
+"""
+import concurrent.futures
+import contextlib
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+import frontier
+import optimizer
+import settings
+from local import moex, dividends
+from metrics import Portfolio, CASH, dividends_metrics, returns_metrics
+from ml.manager_ml import MLDataManager
+from settings import AFTER_TAX, T_SCORE, MAX_TRADE
+
+# Шаг между пересмотрами портфеля в месяцах
+STEP_MONTHS = 1
+# Количество месяцев, в течение которых ML-модели обучаются без повторной кросс-валидации
+CV_MONTHS = 6
+# Количество процессов для независимых вариантов тестирования
+MAX_WORKERS = 4
+# Модули, использующие параметры оптимизации
+T_SCORE_MODULES = (optimizer, frontier, dividends_metrics, returns_metrics)
+# Окончание названий файлов ML-моделей тестирования - дополняется номером процесса
+ML_NAME_SUFFIX = '_backtest'
+
+# Названия столбцов результатов тестирования
+VALUE = 'VALUE'
+DIVIDENDS = 'DIVIDENDS'
+INDEX = 'INDEX'
+TRADES = 'TRADES'
+# Названия столбцов сводки по вариантам тестирования
+TOTAL_RETURN = 'TOTAL_RETURN'
+INDEX_RETURN = 'INDEX_RETURN'
+TOTAL_DIVIDENDS = 'TOTAL_DIVIDENDS'
+MAX_DRAW_DOWN = 'MAX_DRAW_DOWN'
+
+LOGGER = logging.getLogger(__name__)
+
+
+def step_dates(calendar: pd.DatetimeIndex, start, end=None):
+    """Торговые даты пересмотра портфеля - последний торговый день не позже начала каждого шага
+
+    Parameters
+    ----------
+    calendar
+        Возрастающий индекс торговых дней
+    start
+        Дата начала тестирования
+    end
+        Дата окончания тестирования - по умолчанию последний торговый день
+
+    Returns
+    -------
+    pd.DatetimeIndex
+        Уникальные торговые даты пересмотра портфеля
+    """
+    start = pd.Timestamp(start)
+    end = calendar[-1] if end is None else min(pd.Timestamp(end), calendar[-1])
+    dates = []
+    step = 0
+    date = start
+    while date <= end:
+        position = calendar.searchsorted(date, side='right') - 1
+        if position >= 0:
+            dates.append(calendar[position])
+        step += 1
+        # Смещение отсчитывается от начала, чтобы конец месяца не сдвигался после коротких месяцев
+        date = start + pd.DateOffset(months=step * STEP_MONTHS)
+    return pd.DatetimeIndex(dates).unique()
+
+
+def apply_trades(lots: pd.Series, trades: pd.DataFrame, lot_value: pd.Series):
+    """Количество лотов и денежных средств после выполнения сделок оптимизатора
+
+    Parameters
+    ----------
+    lots
+        Количество лотов для тикеров и денежных средств для CASH
+    trades
+        Сделки в формате Optimizer.trades
+    lot_value
+        Стоимость лота тикеров
+
+    Returns
+    -------
+    pd.Series
+        Количество лотов и денежных средств после сделок
+    """
+    lots = lots.astype(float)
+    for sell, sell_lots, buy, buy_lots in trades[['SELL', 'SELL_LOTS', 'BUY', 'BUY_LOTS']].itertuples(index=False):
+        lots[sell] -= sell_lots
+        lots[buy] += buy_lots
+        lots[CASH] += sell_lots * lot_value[sell] - buy_lots * lot_value[buy]
+    return lots
+
+
+def received_dividends(dividends_panel: pd.DataFrame, shares: pd.Series, start, end):
+    """Дивиденды после уплаты налогов по акциям, которые находились в портфеле с start до end
+
+    Учитываются выплаты с датой закрытия реестра после start и не позже end
+    """
+    dividends_panel = dividends_panel.loc[pd.Timestamp(start) + pd.Timedelta(days=1):pd.Timestamp(end)]
+    per_share = dividends_panel.reindex(columns=shares.index).fillna(0).sum(axis='index')
+    return float(per_share @ shares) * AFTER_TAX
+
+
+@contextlib.contextmanager
+def _optimization_params(t_score: float, max_trade: float, cv_months: int):
+    """Временная установка параметров оптимизации и обучения ML-моделей
+
+    ML-модели сохраняются в отдельные для процесса файлы, которые удаляются после тестирования
+    """
+    saved_t_score = [module.T_SCORE for module in T_SCORE_MODULES]
+    saved_max_trade = optimizer.MAX_TRADE
+    saved_cv_months = MLDataManager.cv_months
+    saved_name_suffix = MLDataManager.name_suffix
+    name_suffix = f'{ML_NAME_SUFFIX}_{os.getpid()}'
+    for module in T_SCORE_MODULES:
+        module.T_SCORE = t_score
+    optimizer.MAX_TRADE = max_trade
+    MLDataManager.cv_months = cv_months
+    MLDataManager.name_suffix = name_suffix
+    try:
+        yield
+    finally:
+        for module, value in zip(T_SCORE_MODULES, saved_t_score):
+            module.T_SCORE = value
+        optimizer.MAX_TRADE = saved_max_trade
+        MLDataManager.cv_months = saved_cv_months
+        MLDataManager.name_suffix = saved_name_suffix
+        for path in settings.DATA_PATH.glob(f'*{name_suffix}*'):
+            path.unlink()
+
+
+class Backtest:
+    """Историческое тестирование ежемесячного применения рекомендаций оптимизатора
+
+    Котировки, дивиденды и индекс загружаются один раз для всего периода и используются для оценки портфеля на все
+    даты, а метрики портфеля получают данные из общих кэшей, не зависящих от даты. В течение CV_MONTHS месяцев после
+    кросс-валидации ML-модели на следующие даты используют ее результаты - параметры и количество итераций, поэтому
+    кросс-валидация не повторяется, но сама модель каждый раз обучается заново на данных до новой даты
+
+    ML-модели тестирования хранятся в отдельных для каждого процесса файлах, которые удаляются после тестирования, чтобы
+    не заменять рабочие модели историческими и не мешать параллельным тестированиям
+    """
+
+    def __init__(self, positions: dict, cash: float, start, end=None,
+                 t_score: float = T_SCORE, max_trade: float = MAX_TRADE, max_steps: int = optimizer.MAX_STEPS,
+                 cv_months: int = CV_MONTHS):
+        """
+        Parameters
+        ----------
+        positions
+            Словарь с начальным количеством лотов для тикеров
+        cash
+            Начальное количество денежных средств
+        start
+            Дата начала тестирования
+        end
+            Дата окончания тестирования - по умолчанию последний торговый день
+        t_score
+            Критический уровень t-статистики для проведения сделок
+        max_trade
+            Максимальный объем сделки в долях портфеля
+        max_steps
+            Максимальное количество сделок при каждом пересмотре портфеля
+        cv_months
+            Количество месяцев, в течение которых ML-модели обучаются без повторной кросс-валидации
+        """
+        self._tickers = tuple(sorted(positions))
+        self._positions = dict(positions)
+        self._cash = cash
+        self._t_score = t_score
+        self._max_trade = max_trade
+        self._max_steps = max_steps
+        self._cv_months = cv_months
+        self._index = moex.index()
+        self._dates = step_dates(self._index.index, start, end)
+        if len(self._dates) < 2:
+            raise ValueError(f'Период тестирования c {start} по {end} короче одного шага')
+        self._prices = moex.prices(self._tickers).fillna(method='ffill', axis='index')
+        self._dividends = dividends.dividends(self._tickers)
+        self._lot_size = moex.lot_size(self._tickers)
+
+    @property
+    def dates(self):
+        """Даты пересмотра портфеля"""
+        return self._dates
+
+    def _shares(self, lots: pd.Series):
+        """Количество акций для тикеров"""
+        return lots[list(self._tickers)] * self._lot_size
+
+    def _value(self, lots: pd.Series, date):
+        """Стоимость портфеля на дату по общей панели цен"""
+        price = self._prices.loc[:date].iloc[-1].fillna(0)
+        return float(self._shares(lots) @ price) + lots[CASH]
+
+    def run(self):
+        """Результаты тестирования
+
+        Returns
+        -------
+        pd.DataFrame
+            В строках даты пересмотра портфеля. В столбцах стоимость портфеля до пересмотра, полученные с
+            предыдущей даты дивиденды, стоимость индекса MCFTRR при вложении в него начальной стоимости портфеля и
+            количество сделок - на последнюю дату портфель только оценивается
+        """
+        lots = pd.Series(self._positions).reindex(self._tickers).astype(float)
+        lots[CASH] = self._cash
+        initial_value = self._value(lots, self._dates[0])
+        index = self._index / self._index.loc[self._dates[0]] * initial_value
+        rows = []
+        received = 0.0
+        with _optimization_params(self._t_score, self._max_trade, self._cv_months):
+            for date, next_date in zip(self._dates[:-1], self._dates[1:]):
+                value = self._value(lots, date)
+                portfolio = Portfolio(date=date,
+                                      cash=lots[CASH],
+                                      positions={ticker: lots[ticker] for ticker in self._tickers})
+                trades = optimizer.Optimizer(portfolio).trades(self._max_steps)
+                rows.append([value, received, index.loc[date], len(trades)])
+                LOGGER.info(f'{date:%Y-%m-%d}: стоимость {value:.0f}, сделок {len(trades)}')
+                lots = apply_trades(lots, trades, portfolio.lot_size * portfolio.price)
+                received = received_dividends(self._dividends, self._shares(lots), date, next_date)
+                lots[CASH] += received
+        last_date = self._dates[-1]
+        rows.append([self._value(lots, last_date), received, index.loc[last_date], 0])
+        return pd.DataFrame(rows, index=self._dates, columns=[VALUE, DIVIDENDS, INDEX, TRADES])
+
+
+def summary(result: pd.DataFrame):
+    """Сводные показатели результатов тестирования - доходности портфеля и индекса, дивиденды и максимальная просадка"""
+    value = result[VALUE]
+    return pd.Series({TOTAL_RETURN: value.iloc[-1] / value.iloc[0] - 1,
+                      INDEX_RETURN: result[INDEX].iloc[-1] / result[INDEX].iloc[0] - 1,
+                      TOTAL_DIVIDENDS: result[DIVIDENDS].sum(),
+                      MAX_DRAW_DOWN: (value / value.cummax()).min() - 1})
+
+
+def _run_case(kwargs: dict):
+    """Результаты тестирования одного варианта параметров"""
+    return Backtest(**kwargs).run()
+
+
+def sweep(cases: list, max_workers: int = MAX_WORKERS):
+    """Параллельное тестирование независимых вариантов параметров в отдельных процессах
+
+    Параметры оптимизации задаются в каждом процессе отдельно, поэтому варианты не влияют друг на друга. Данные
+    загружаются каждым процессом из общего локального хранилища, запись в которое защищена блокировками
+
+    Parameters
+    ----------
+    cases
+        Список словарей с параметрами Backtest
+    max_workers
+        Количество процессов
+
+    Returns
+    -------
+    tuple
+        Список результатов тестирования вариантов в исходном порядке и DataFrame со сводными показателями вариантов
+    """
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(_run_case, cases))
+    report = pd.DataFrame([summary(result) for result in results])
+    return results, report
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    POSITIONS = dict(CHMF=173,
+                     LSRG=1341,
+                     MTSS=1264,
+                     MVID=141,
+                     UPRO=1272)
+    CASES = [dict(positions=POSITIONS, cash=2_262, start='2017-01-01', t_score=t_score)
+             for t_score in np.linspace(1.0, 3.0, 5)]
+    _, report_ = sweep(CASES)
+    print(report_)
@@ -0,0 +1,203 @@
+"""Граница Парето между нижней границей дивидендов и просадкой портфеля
+
+В отличие от оптимизатора, который выбирает одну сделку по направлению градиента, веса позиций подбираются напрямую.
+Нижняя граница дивидендов вогнута по весам, поэтому ограничение на нее задает выпуклое множество, а просадка при
+положительной доходности портфеля - отношение выпуклой дисперсии к линейной доходности - квазивыпукла, поэтому
+минимизация просадки при ограничении на нижнюю границу дивидендов имеет единственный локальный минимум
+
+Ограничение на объем сделки задается границами весов позиций. Целочисленность лотов в непрерывной оптимизации не
+учитывается - веса точек границы переводятся в лоты округлением с помощью rebalancing.lot_plan
+"""
+import logging
+
+import numpy as np
+import pandas as pd
+from scipy import optimize
+
+import rebalancing
+from metrics import Portfolio
+from settings import T_SCORE
+
+# Количество точек границы
+POINTS = 20
+# Точность и максимальное количество итераций оптимизации
+FTOL = 1e-9
+MAX_ITER = 500
+# Допустимое нарушение ограничений, при котором решение несошедшейся оптимизации считается допустимым
+FEASIBILITY_TOL = 1e-6
+# Минимальная ожидаемая доходность портфеля, при которой определена просадка
+MIN_MEAN = 1e-6
+
+LOGGER = logging.getLogger(__name__)
+
+
+class Frontier:
+    """Граница Парето между нижней границей дивидендной доходности и ожидаемой просадкой
+
+    Статистики отдельных позиций берутся из рассчитанных метрик портфеля. Веса позиций неотрицательны, а доли бумаг с
+    нулевым понижающим коэффициентом оборота не могут быть увеличены. Граница строится одним проходом по уровням
+    ограничения на нижнюю границу дивидендов от портфеля с минимальной просадкой до максимально достижимой нижней
+    границы, а решение для каждого уровня начинается с решения для предыдущего
+    """
+
+    def __init__(self, portfolio: Portfolio, dividends_metrics, returns_metrics, points: int = POINTS,
+                 max_trade: float = None):
+        """
+        Parameters
+        ----------
+        portfolio
+            Текущий портфель
+        dividends_metrics
+            Метрики дивидендов портфеля
+        returns_metrics
+            Метрики доходности портфеля
+        points
+            Количество точек границы
+        max_trade
+            Максимальное изменение веса каждой позиции относительно текущего - по умолчанию не ограничено
+        """
+        self._portfolio = portfolio
+        self._index = pd.Index(portfolio.positions[:-1])
+        self._dividends_mean = dividends_metrics.mean.reindex(self._index).values
+        self._dividends_var = dividends_metrics.std.reindex(self._index).values ** 2
+        self._returns_mean = returns_metrics.mean.reindex(self._index).values
+        self._returns_cov = returns_metrics.cov.reindex(index=self._index, columns=self._index).values
+        weight = portfolio.weight.reindex(self._index).values
+        volume_factor = portfolio.volume_factor.reindex(self._index).values
+        upper = np.where(volume_factor <= 0, weight, 1)
+        lower = np.zeros_like(weight)
+        if max_trade is not None:
+            upper = np.minimum(upper, weight + max_trade)
+            lower = np.maximum(lower, weight - max_trade)
+        self._bounds = list(zip(lower, upper))
+        self._max_trade = max_trade
+        self._weight = weight
+        self._weights = self._sweep(points)
+
+    def _lower_bound(self, weight):
+        """Нижняя граница дивидендной доходности портфеля и ее градиент"""
+        std = (weight ** 2 @ self._dividends_var) ** 0.5
+        value = weight @ self._dividends_mean - T_SCORE * std
+        gradient = self._dividends_mean - T_SCORE * weight * self._dividends_var / std
+        return value, gradient
+
+    def _draw_down(self, weight):
+        """Ожидаемая просадка портфеля"""
+        mean = weight @ self._returns_mean
+        return - T_SCORE ** 2 * (weight @ self._returns_cov @ weight) / (4 * mean)
+
+    def _feasible(self, weight, constraints):
+        """Удовлетворяют ли веса границам и ограничениям с точностью FEASIBILITY_TOL"""
+        lower, upper = np.array(self._bounds).T
+        if (weight < lower - FEASIBILITY_TOL).any() or (weight > upper + FEASIBILITY_TOL).any():
+            return False
+        for constraint in constraints:
+            value = constraint['fun'](weight)
+            if constraint['type'] == 'eq' and abs(value) > FEASIBILITY_TOL:
+                return False
+            if constraint['type'] == 'ineq' and value < -FEASIBILITY_TOL:
+                return False
+        return True
+
+    def _minimize(self, func, start, constraints):
+        """Оптимизация SLSQP при условии, что сумма весов равна 1
+
+        Если оптимизация не сошлась, то выдается предупреждение и используется последняя допустимая точка - решение
+        оптимизатора или начальная точка
+        """
+        constraints = [dict(type='eq', fun=lambda w: w.sum() - 1, jac=lambda w: np.ones_like(w))] + constraints
+        result = optimize.minimize(func, start,
+                                   jac=True,
+                                   method='SLSQP',
+                                   bounds=self._bounds,
+                                   constraints=constraints,
+                                   options=dict(ftol=FTOL, maxiter=MAX_ITER))
+        if not result.success:
+            feasible = self._feasible(result.x, constraints)
+            LOGGER.warning(f'Оптимизация не сошлась: {result.message} - используется '
+                           f'{"решение оптимизатора" if feasible else "начальная точка"}')
+            if not feasible:
+                return start
+        return np.clip(result.x, 0, None)
+
+    def _mean_constraint(self):
+        """Ограничение на положительность ожидаемой доходности портфеля, при которой определена просадка"""
+        return dict(type='ineq',
+                    fun=lambda w: w @ self._returns_mean - MIN_MEAN,
+                    jac=lambda w: self._returns_mean)
+
+    def _max_lower_bound(self, start):
+        """Веса с максимальной нижней границей дивидендов"""
+        def func(weight):
+            value, gradient = self._lower_bound(weight)
+            return -value, -gradient
+
+        return self._minimize(func, start, [self._mean_constraint()])
+
+    def _min_draw_down(self, start, lower_bound=None):
+        """Веса с минимальной ожидаемой просадкой при ограничении на нижнюю границу дивидендов"""
+        def func(weight):
+            mean = weight @ self._returns_mean
+            cov = self._returns_cov @ weight
+            var = weight @ cov
+            value = T_SCORE ** 2 * var / (4 * mean)
+            gradient = T_SCORE ** 2 * (2 * cov * mean - var * self._returns_mean) / (4 * mean ** 2)
+            return value, gradient
+
+        constraints = [self._mean_constraint()]
+        if lower_bound is not None:
+            constraints.append(dict(type='ineq',
+                                    fun=lambda w: self._lower_bound(w)[0] - lower_bound,
+                                    jac=lambda w: self._lower_bound(w)[1]))
+        return self._minimize(func, start, constraints)
+
+    def _sweep(self, points):
+        """Веса для всех точек границы
+
+        Уровни ограничения на нижнюю границу дивидендов равномерно распределяются между значениями для портфеля с
+        минимальной просадкой и портфеля с максимальной нижней границей
+        """
+        start = self._weight
+        if self._max_trade is None and not start @ self._returns_mean > MIN_MEAN:
+            start = np.full_like(start, 1 / len(start))
+        best_lower_bound = self._max_lower_bound(start)
+        weights = [self._min_draw_down(start)]
+        levels = np.linspace(self._lower_bound(weights[0])[0], self._lower_bound(best_lower_bound)[0], points)
+        # Для максимальной нижней границы множество допустимых весов вырождено, поэтому последняя точка берется готовой
+        for level in levels[1:-1]:
+            weights.append(self._min_draw_down(weights[-1], level))
+        weights.append(best_lower_bound)
+        return pd.DataFrame(weights, columns=self._index)
+
+    @property
+    def weights(self):
+        """Веса позиций в точках границы - в строках точки, в столбцах позиции"""
+        return self._weights.copy()
+
+    @property
+    def metrics(self):
+        """Нижняя граница дивидендной доходности и ожидаемая просадка в точках границы"""
+        weights = self._weights.values
+        lower_bound = [self._lower_bound(weight)[0] for weight in weights]
+        draw_down = [self._draw_down(weight) for weight in weights]
+        return pd.DataFrame(dict(LOWER_BOUND=lower_bound, DRAW_DOWN=draw_down))
+
+    def lots(self, point: int):
+        """Целое количество лотов, наиболее близкое к весам в точке границы, и остаток денежных средств"""
+        return rebalancing.lot_plan(self._portfolio, self._weights.iloc[point])
+
+
+if __name__ == '__main__':
+    from optimizer import Optimizer
+
+    POSITIONS = dict(CHMF=173,
+                     LSRG=1341,
+                     MTSS=1264,
+                     MVID=141,
+                     UPRO=1272)
+    port = Portfolio(date='2018-09-04',
+                     cash=2_262,
+                     positions=POSITIONS)
+    frontier = Optimizer(port).frontier()
+    print(frontier.metrics)
+    print(frontier.weights)
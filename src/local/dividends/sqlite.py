@@ -1,19 +1,155 @@
 """Реализация менеджера данных для дивидендов и вспомогательные функции"""
-import functools
+import hashlib
+import logging
+import os
 import sqlite3
+import threading
+from urllib.request import pathname2url
 
 import pandas as pd
-from pandas.io.sql import DatabaseError
 
 from settings import DATA_PATH
-from utils.aggregation import monthly_aggregation_func
+from utils.aggregation import monthly_aggregation_index
 from utils.data_manager import AbstractDataManager
-from web.labels import DATE, TICKER
+from utils.tickers_cache import tickers_cache
+from web.labels import DATE, DIVIDENDS, TICKER
 
 DIVIDENDS_CATEGORY = 'dividends'
 STATISTICS_START = '2010-01-01'
 DATABASE = str(DATA_PATH / 'dividends.db')
 
+# Общая таблица с дивидендами всех тикеров - если есть в базе и актуальна, то используется вместо таблиц отдельных
+# тикеров
+NORMALIZED_TABLE = 'TICKERS_DIVIDENDS'
+# Таблица с отпечатком таблиц тикеров на момент построения общей таблицы
+STAMP_TABLE = 'TICKERS_DIVIDENDS_STAMP'
+# Использовать ли для сводных данных по дивидендам локальные копии данных отдельных тикеров в формате DataManager
+PICKLE_MIRROR = False
+
+# Открытые соединения с базами данных в разрезе потоков
+_CONNECTIONS = threading.local()
+# Результаты проверки актуальности общей таблицы в разрезе баз данных и времени их изменения
+_FRESHNESS = {}
+
+LOGGER = logging.getLogger(__name__)
+
+
+def connection(database: str = DATABASE):
+    """Соединение с базой данных только для чтения - одно для каждой базы данных в каждом потоке"""
+    connections = _CONNECTIONS.__dict__.setdefault('connections', {})
+    if database not in connections:
+        connections[database] = sqlite3.connect(f'file:{pathname2url(database)}?mode=ro', uri=True)
+    return connections[database]
+
+
+def _tables(database: str):
+    """Множество таблиц в базе данных - пустое при отсутствии базы"""
+    try:
+        cursor = connection(database).execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+    except sqlite3.OperationalError:
+        return set()
+    return {name for name, in cursor}
+
+
+def _ticker_tables(tables: set):
+    """Таблицы отдельных тикеров"""
+    return tables - {NORMALIZED_TABLE, STAMP_TABLE}
+
+
+def _stamp(connection: sqlite3.Connection, tickers: tuple):
+    """Отпечаток таблиц тикеров - меняется при добавлении, удалении и изменении строк"""
+    query = ' UNION ALL '.join(f"SELECT '{ticker}', COUNT(*), MAX(rowid), TOTAL(DIVIDENDS), GROUP_CONCAT(DATE) "
+                               f"FROM {ticker}" for ticker in tickers)
+    rows = connection.execute(query).fetchall() if query else []
+    return hashlib.sha1(repr(rows).encode()).hexdigest()
+
+
+def _normalized_fresh(database: str, tables: set):
+    """Актуальна ли общая таблица - совпадает ли отпечаток таблиц тикеров с сохраненным при ее построении
+
+    Проверка повторяется только при изменении файла базы данных
+    """
+    key = (database, os.stat(database).st_mtime_ns)
+    if key not in _FRESHNESS:
+        fresh = False
+        if STAMP_TABLE in tables:
+            stored = connection(database).execute(f'SELECT STAMP FROM {STAMP_TABLE}').fetchone()
+            tickers = tuple(sorted(_ticker_tables(tables)))
+            fresh = stored is not None and stored[0] == _stamp(connection(database), tickers)
+        if not fresh:
+            LOGGER.warning(f'Общая таблица {NORMALIZED_TABLE} в {database} устарела - используются таблицы тикеров, '
+                           f'перестройте ее с помощью normalize_database')
+        _FRESHNESS[key] = fresh
+    return _FRESHNESS[key]
+
+
+def load_dividends(tickers: tuple, database: str = DATABASE):
+    """Дивиденды для набора тикеров одним запросом к базе данных
+
+    Используется общая таблица NORMALIZED_TABLE, а при ее отсутствии или изменении таблиц тикеров после ее построения -
+    объединение таблиц отдельных тикеров
+    Несколько выплат в одну дату объединяются
+
+    Parameters
+    ----------
+    tickers
+        Кортеж тикеров
+    database
+        Путь к базе данных
+
+    Returns
+    -------
+    pandas.DataFrame
+        В строках даты выплат хотя бы одного из тикеров, начиная с STATISTICS_START
+        В столбцах тикеры - при отсутствии данных по тикеру столбец пустой
+    """
+    tables = _tables(database)
+    if NORMALIZED_TABLE in tables and _normalized_fresh(database, tables):
+        placeholders = ', '.join('?' * len(tickers))
+        query = f'SELECT TICKER, DATE, DIVIDENDS FROM {NORMALIZED_TABLE} WHERE TICKER IN ({placeholders})'
+        params = list(tickers)
+    else:
+        query = ' UNION ALL '.join(f"SELECT '{ticker}' AS TICKER, DATE, DIVIDENDS FROM {ticker}"
+                                   for ticker in dict.fromkeys(tickers) if ticker in tables)
+        params = []
+    if query:
+        df = pd.read_sql_query(query, connection(database), params=params, parse_dates=[DATE])
+    else:
+        df = pd.DataFrame(columns=[TICKER, DATE, DIVIDENDS])
+    df = df[pd.to_datetime(df[DATE]) >= pd.Timestamp(STATISTICS_START)]
+    df = df.astype({DIVIDENDS: float}).groupby([DATE, TICKER])[DIVIDENDS].sum().unstack(TICKER)
+    df = df.reindex(columns=list(tickers))
+    df.index = pd.DatetimeIndex(df.index, name=DATE)
+    df.columns.name = TICKER
+    return df
+
+
+def normalize_database(database: str = DATABASE):
+    """Создает или перестраивает общую таблицу с дивидендами всех тикеров с индексом по тикеру и дате
+
+    Общая таблица не обновляется автоматически, поэтому ее нужно перестраивать после изменения таблиц тикеров. До
+    перестройки вместо нее используются таблицы тикеров, изменение которых определяется по сохраненному отпечатку
+
+    Returns
+    -------
+    tuple
+        Тикеры, данные которых перенесены в общую таблицу
+    """
+    tickers = tuple(sorted(_ticker_tables(_tables(database))))
+    with sqlite3.connect(database) as write_connection:
+        write_connection.execute(f'DROP TABLE IF EXISTS {NORMALIZED_TABLE}')
+        write_connection.execute(f'CREATE TABLE {NORMALIZED_TABLE} '
+                                 f'(TICKER TEXT NOT NULL, DATE datetime NOT NULL, DIVIDENDS REAL NOT NULL, COMMENTS TEXT)')
+        for ticker in tickers:
+            write_connection.execute(f"INSERT INTO {NORMALIZED_TABLE} "
+                                     f"SELECT '{ticker}', DATE, DIVIDENDS, COMMENTS FROM {ticker}")
+        write_connection.execute(f'CREATE INDEX {NORMALIZED_TABLE}_INDEX ON {NORMALIZED_TABLE} (TICKER, DATE)')
+        write_connection.execute(f'DROP TABLE IF EXISTS {STAMP_TABLE}')
+        write_connection.execute(f'CREATE TABLE {STAMP_TABLE} (STAMP TEXT NOT NULL)')
+        write_connection.execute(f'INSERT INTO {STAMP_TABLE} VALUES (?)', (_stamp(write_connection, tickers),))
+    write_connection.close()
+    return tickers
+
 
 class DividendsDataManager(AbstractDataManager):
     """Организация создания, обновления и предоставления локальных DataFrame
@@ -30,26 +166,20 @@ class DividendsDataManager(AbstractDataManager):
         Берется колонка с дивидендами и отбрасывается с комментариями
         В случае отсутствия данных возвращается пустая Series
         """
-        connection = sqlite3.connect(DATABASE)
-        query = f'SELECT DATE, DIVIDENDS FROM {self.data_name}'
-        try:
-            df = pd.read_sql_query(query, connection, index_col=DATE, parse_dates=[DATE])
-        except DatabaseError:
-            return pd.Series(name=self.data_name, index=pd.DatetimeIndex([], name=DATE))
-        else:
-            df = df[df.index >= pd.Timestamp(STATISTICS_START)]
-            # Несколько выплат в одну дату объединяются
-            df = df.groupby(DATE).sum()
-            df.columns = [self.data_name]
-            return df[self.data_name]
+        return load_dividends((self.data_name,))[self.data_name]
 
     def download_update(self):
         super().download_update()
 
 
-@functools.lru_cache(maxsize=1)
+@tickers_cache(batch=True)
 def tickers_dividends(tickers: tuple):
-    """Сводная информация по дивидендам для заданных тикеров"""
+    """Сводная информация по дивидендам для заданных тикеров
+
+    Данные загружаются из базы данных одним запросом, а при PICKLE_MIRROR - из локальных копий отдельных тикеров
+    """
+    if not PICKLE_MIRROR:
+        return load_dividends(tickers)
     frames = (DividendsDataManager(ticker).value for ticker in tickers)
     df = pd.concat(frames, axis='columns')
     df.columns.name = TICKER
@@ -76,7 +206,7 @@ def monthly_dividends(tickers: tuple, last_date: pd.Timestamp):
     month_end_day = last_date.day
     crop_date = pd.Timestamp(STATISTICS_START) + pd.DateOffset(day=month_end_day, days=1)
     df = df.loc[crop_date:, :]
-    df = df.groupby(by=monthly_aggregation_func(last_date)).sum()
+    df = df.groupby(by=monthly_aggregation_index(df.index, last_date)).sum()
     start_date = pd.Timestamp(STATISTICS_START) + pd.DateOffset(months=1, day=month_end_day)
     offset = pd.DateOffset(months=1, day=month_end_day)
     index = pd.DatetimeIndex(start=start_date, end=last_date, freq=offset)
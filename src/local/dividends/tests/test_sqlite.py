@@ -1,3 +1,4 @@
+import sqlite3
 from pathlib import Path
 
 import pandas as pd
@@ -6,6 +7,7 @@ import pytest
 import local.dividends.sqlite as local_dividends
 import settings
 from local.dividends.sqlite import DividendsDataManager
+from web.labels import TICKER
 
 
 @pytest.fixture(scope='module', autouse=True)
@@ -44,3 +46,62 @@ def test_no_data_in_data_base():
     assert df.name == 'TEST'
     assert len(df) == 0
     assert isinstance(df.index, pd.DatetimeIndex)
+
+
+@pytest.fixture(name='database')
+def make_database(tmpdir):
+    database = str(Path(tmpdir) / 'dividends.db')
+    with sqlite3.connect(database) as connection:
+        for ticker, rows in [('AKRN', [('2009-05-01', 1.0), ('2018-04-09', 2.0), ('2018-04-09', 3.0)]),
+                             ('GMKN', [('2017-10-10', 4.0)]),
+                             ('CBOM', [])]:
+            connection.execute(f'CREATE TABLE {ticker} (DATE datetime, DIVIDENDS REAL, COMMENTS TEXT)')
+            connection.executemany(f"INSERT INTO {ticker} VALUES (?, ?, '')", rows)
+    connection.close()
+    return database
+
+
+def check_dividends(df):
+    assert df.columns.tolist() == ['GMKN', 'AKRN', 'CBOM', 'TEST']
+    assert df.columns.name == TICKER
+    assert df.index.tolist() == [pd.Timestamp('2017-10-10'), pd.Timestamp('2018-04-09')]
+    assert df['AKRN'].tolist()[1] == 5.0
+    assert df['GMKN'].tolist()[0] == 4.0
+    assert df[['CBOM', 'TEST']].isna().all().all()
+
+
+def test_load_dividends(database):
+    check_dividends(local_dividends.load_dividends(('GMKN', 'AKRN', 'CBOM', 'TEST'), database))
+
+
+def test_load_dividends_normalized(database):
+    assert local_dividends.normalize_database(database) == ('AKRN', 'CBOM', 'GMKN')
+    check_dividends(local_dividends.load_dividends(('GMKN', 'AKRN', 'CBOM', 'TEST'), database))
+
+
+def test_load_dividends_stale_normalized(database, caplog):
+    local_dividends.normalize_database(database)
+    with sqlite3.connect(database) as connection:
+        connection.execute("INSERT INTO GMKN VALUES ('2018-04-09', 6.0, '')")
+    connection.close()
+    df = local_dividends.load_dividends(('GMKN', 'AKRN'), database)
+    assert df.loc['2018-04-09', 'GMKN'] == 6.0
+    assert local_dividends.NORMALIZED_TABLE in caplog.text
+    caplog.clear()
+    local_dividends.normalize_database(database)
+    df = local_dividends.load_dividends(('GMKN', 'AKRN'), database)
+    assert df.loc['2018-04-09', 'GMKN'] == 6.0
+    assert not caplog.text
+
+
+def test_read_only_connection(database):
+    connection = local_dividends.connection(database)
+    assert local_dividends.connection(database) is connection
+    with pytest.raises(sqlite3.OperationalError):
+        connection.execute('DROP TABLE AKRN')
+
+
+def test_no_database(tmpdir):
+    df = local_dividends.load_dividends(('AKRN',), str(Path(tmpdir) / 'no.db'))
+    assert df.empty
+    assert isinstance(df.index, pd.DatetimeIndex)
@@ -0,0 +1,172 @@
+"""Первоначальное создание локальных данных по котировкам для множества тикеров с параллельной загрузкой"""
+import itertools
+
+import arrow
+import pandas as pd
+
+from local.moex import iss_quotes, iss_quotes_t2
+from local.moex.iss_securities_info import securities_info
+from utils import data_manager
+from utils.columnar_file import columnar_store
+from web.labels import CLOSE_PRICE, DATE, REG_NUMBER, TICKER, VOLUME
+from web.moex import iss_quotes as web_quotes, iss_quotes_t2 as web_quotes_t2
+from web.moex.iss_bulk import BulkDownloader, MAX_WORKERS
+
+# Максимальное отставание последней даты данных тикера в днях, при котором он обновляется загрузкой по датам -
+# более отстающие тикеры обновляются обычным образом
+MAX_DAYS = 30
+
+
+def tickers_aliases(downloader: BulkDownloader, tickers: tuple):
+    """Словарь с кортежами тикеров аналогов для каждого тикера - аналог local.moex.aliases"""
+    reg_numbers = securities_info(tickers)[REG_NUMBER]
+    reg_number_tickers = downloader.reg_number_tickers(tuple(set(reg_numbers)))
+    return {ticker: reg_number_tickers[reg_numbers[ticker]] for ticker in tickers}
+
+
+def _create(tickers: tuple, module, manager, download, max_workers: int):
+    """Загружает истории всех тикеров аналогов одновременно и создает локальные данные менеджером модуля"""
+    store = columnar_store(module.QUOTES_CATEGORY)
+    missing = tuple(ticker for ticker in dict.fromkeys(tickers) if store.last_update(ticker) is None)
+    if not missing:
+        return missing
+    with BulkDownloader(max_workers=max_workers) as downloader:
+        aliases = tickers_aliases(downloader, missing)
+        all_aliases = tuple(sorted(set(itertools.chain.from_iterable(aliases.values()))))
+        history = download(downloader, all_aliases)
+    for ticker in missing:
+        module.PREFETCHED_HISTORY[ticker] = [history[alias] for alias in aliases[ticker]]
+    try:
+        for ticker in missing:
+            manager(ticker)
+    finally:
+        module.PREFETCHED_HISTORY.clear()
+    return missing
+
+
+def create_quotes(tickers: tuple, max_workers: int = MAX_WORKERS):
+    """Создает локальные данные по котировкам для тикеров, по которым их нет, с параллельной загрузкой
+
+    Истории всех тикеров аналогов загружаются одновременно через пул соединений, а затем локальные данные создаются
+    обычным образом без дополнительных обращений к серверу
+
+    Parameters
+    ----------
+    tickers
+        Кортеж тикеров
+    max_workers
+        Максимальное количество одновременных запросов к серверу
+
+    Returns
+    -------
+    tuple
+        Тикеры, для которых созданы локальные данные
+    """
+    return _create(tickers, iss_quotes, iss_quotes.QuotesDataManager, BulkDownloader.quotes, max_workers)
+
+
+def create_quotes_t2(tickers: tuple, max_workers: int = MAX_WORKERS):
+    """Создает локальные данные по котировкам в режиме T+2 для тикеров, по которым их нет, с параллельной загрузкой
+
+    Parameters
+    ----------
+    tickers
+        Кортеж тикеров
+    max_workers
+        Максимальное количество одновременных запросов к серверу
+
+    Returns
+    -------
+    tuple
+        Тикеры, для которых созданы локальные данные
+    """
+    return _create(tickers, iss_quotes_t2, iss_quotes_t2.QuotesT2DataManager, BulkDownloader.quotes_t2, max_workers)
+
+
+def _stale_last_dates(store, today: pd.Timestamp):
+    """Словарь с последними датами котировок для тикеров, данные которых требуют обновления"""
+    now = arrow.now()
+    first_date = today - pd.Timedelta(days=MAX_DAYS)
+    last_dates = {}
+    for ticker in store.names:
+        last_date = store.last_index(ticker)
+        if last_date is None or last_date < first_date:
+            continue
+        if data_manager.next_update(store.last_update(ticker)) < now:
+            last_dates[ticker] = last_date
+    return last_dates
+
+
+def _refresh(module, manager, download, concat_blocks, max_workers: int):
+    """Загружает котировки всех бумаг по датам и обновляет ими данные тикеров менеджером модуля"""
+    store = columnar_store(module.QUOTES_CATEGORY)
+    today = pd.Timestamp(arrow.now().to(data_manager.MARKET_TIME_ZONE).date())
+    last_dates = _stale_last_dates(store, today)
+    if not last_dates:
+        return ()
+    dates = tuple(pd.date_range(min(last_dates.values()), today))
+    with BulkDownloader(max_workers=max_workers) as downloader:
+        df = download(downloader, dates)
+    df = df.astype({CLOSE_PRICE: float, VOLUME: float})
+    by_ticker = dict(tuple(df.groupby(TICKER)))
+    for ticker, last_date in last_dates.items():
+        ticker_df = by_ticker.get(ticker, df.iloc[:0])
+        ticker_df = ticker_df.loc[ticker_df[DATE] >= last_date, [DATE, CLOSE_PRICE, VOLUME]]
+        module.PREFETCHED_UPDATE[ticker] = concat_blocks([ticker_df])
+    try:
+        # Менеджеры создаются без обновления, а обновляются явно, чтобы заранее загруженные данные использовались в
+        # любом режиме обновления, а не откладывались в фоновую очередь или пропускались
+        with data_manager.update_mode('offline'):
+            managers = [manager(ticker) for ticker in last_dates]
+        for ticker_manager in managers:
+            ticker_manager.update()
+    finally:
+        module.PREFETCHED_UPDATE.clear()
+    module.cache_clear()
+    return tuple(last_dates)
+
+
+def refresh_quotes(max_workers: int = MAX_WORKERS):
+    """Обновляет локальные данные по котировкам всех тикеров, требующих обновления, загрузкой по датам
+
+    Вместо отдельного запроса для каждого тикера загружается история торгов всех бумаг за каждую дату с последней
+    имеющейся, которая распределяется по тикерам. Новые данные проверяются на совпадение с существующими и дописываются
+    в хранилище обычным образом. Тикеры, данные которых отстают более чем на MAX_DAYS дней, не обновляются
+
+    Parameters
+    ----------
+    max_workers
+        Максимальное количество одновременных запросов к серверу
+
+    Returns
+    -------
+    tuple
+        Обновленные тикеры
+    """
+    return _refresh(iss_quotes, iss_quotes.QuotesDataManager, BulkDownloader.quotes_by_date, web_quotes.concat_blocks,
+                    max_workers)
+
+
+def refresh_quotes_t2(max_workers: int = MAX_WORKERS):
+    """Обновляет локальные данные по котировкам в режиме T+2 всех тикеров, требующих обновления, загрузкой по датам
+
+    Parameters
+    ----------
+    max_workers
+        Максимальное количество одновременных запросов к серверу
+
+    Returns
+    -------
+    tuple
+        Обновленные тикеры
+    """
+    return _refresh(iss_quotes_t2, iss_quotes_t2.QuotesT2DataManager, BulkDownloader.quotes_t2_by_date,
+                    web_quotes_t2.concat_blocks, max_workers)
+
+
+if __name__ == '__main__':
+    from web import moex
+
+    print(create_quotes(tuple(moex.securities_info().dropna(subset=[REG_NUMBER]).index)))
+    print(refresh_quotes())
+    print(refresh_quotes_t2())
@@ -3,16 +3,29 @@ import functools
 
 import pandas as pd
 
+import settings
 from local.moex.iss_securities_info import aliases
+from local.moex.quotes_panel import quotes_panel
+from utils.columnar_file import ColumnarDataFile, columnar_store
 from utils.data_manager import AbstractDataManager
+from utils.tickers_cache import tickers_cache
 from web import moex
 from web.labels import DATE, VOLUME, CLOSE_PRICE
 
 QUOTES_CATEGORY = 'quotes'
 
+# Заранее загруженные истории котировок тикеров аналогов - используются при создании данных вместо загрузки
+PREFETCHED_HISTORY = {}
+# Заранее загруженные обновления котировок - используются при обновлении данных вместо загрузки
+PREFETCHED_UPDATE = {}
+
 
 class QuotesDataManager(AbstractDataManager):
-    """Реализует особенность загрузки и хранения 'длинной' истории котировок"""
+    """Реализует особенность загрузки и хранения 'длинной' истории котировок
+
+    Котировки всех тикеров хранятся в общем колоночном хранилище
+    """
+    data_file_class = ColumnarDataFile
 
     def __init__(self, ticker):
         super().__init__(QUOTES_CATEGORY, ticker)
@@ -29,12 +42,17 @@ class QuotesDataManager(AbstractDataManager):
     def _yield_aliases_quotes_history(self):
         """Генерирует истории котировок для все тикеров аналогов заданного тикера"""
         ticker = self.data_name
+        if ticker in PREFETCHED_HISTORY:
+            yield from PREFETCHED_HISTORY[ticker]
+            return
         aliases_tickers = aliases(ticker)
         for ticker in aliases_tickers:
             yield moex.quotes(ticker)
 
     def download_update(self):
         ticker = self.data_name
+        if ticker in PREFETCHED_UPDATE:
+            return PREFETCHED_UPDATE[ticker]
         last_date = self.value.index[-1]
         return moex.quotes(ticker, last_date)
 
@@ -62,7 +80,24 @@ def quotes(ticker: str):
     return data.value
 
 
-@functools.lru_cache(maxsize=1)
+def _store_version():
+    """Версия хранилища котировок в текущем каталоге данных - при ее изменении кэши цен и объемов очищаются"""
+    return settings.DATA_PATH, columnar_store(QUOTES_CATEGORY).version
+
+
+def _split_rows(result, ticker):
+    """Данные тикера из результата для многих тикеров - строки, на которые у тикера есть котировки в панели"""
+    return result.loc[quotes_panel(QUOTES_CATEGORY, (ticker,)).dates(ticker), [ticker]]
+
+
+def _panel(tickers: tuple):
+    """Общая панель котировок, содержащая актуальные данные для всех тикеров из набора"""
+    for ticker in tickers:
+        quotes(ticker)
+    return quotes_panel(QUOTES_CATEGORY, tickers)
+
+
+@tickers_cache(batch=True, version=_store_version, split=_split_rows)
 def prices(tickers: tuple):
     """
     Возвращает историю цен закрытия по набору тикеров из локальных данных, при необходимости обновляя их
@@ -77,12 +112,10 @@ def prices(tickers: tuple):
     pandas.DataFrame
         В строках даты торгов
     """
-    df = pd.concat([quotes(ticker)[CLOSE_PRICE] for ticker in tickers], axis=1)
-    df.columns = tickers
-    return df
+    return _panel(tickers).frame(CLOSE_PRICE, tickers)
 
 
-@functools.lru_cache(maxsize=1)
+@tickers_cache(batch=True, version=_store_version, split=_split_rows)
 def volumes(tickers: tuple):
     """
     Возвращает историю объемов торгов по набору тикеров из локальных данных, при необходимости обновляя их.
@@ -97,9 +130,14 @@ def volumes(tickers: tuple):
     pandas.DataFrame
         В строках даты торгов
     """
-    df = pd.concat([quotes(ticker)[VOLUME] for ticker in tickers], axis=1)
-    df.columns = tickers
-    return df
+    return _panel(tickers).frame(VOLUME, tickers)
+
+
+def cache_clear():
+    """Очищает кэши загруженных котировок, например, после обновления локальных данных"""
+    quotes.cache_clear()
+    prices.cache_clear()
+    volumes.cache_clear()
 
 
 if __name__ == '__main__':
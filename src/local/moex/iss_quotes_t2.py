@@ -6,19 +6,33 @@ import pandas as pd
 from pandas.tseries import offsets
 
 import local
+import settings
 from local import moex, dividends
+from local.moex.quotes_panel import quotes_panel
 from utils import data_manager, aggregation
+from utils.columnar_file import ColumnarDataFile, columnar_store
+from utils.tickers_cache import tickers_cache
 from web import moex
 from web.labels import VOLUME, CLOSE_PRICE, DATE, TICKER
 
 QUOTES_CATEGORY = 'quotes_t2'
 
+# Заранее загруженные истории котировок тикеров аналогов - используются при создании данных вместо загрузки
+PREFETCHED_HISTORY = {}
+# Заранее загруженные обновления котировок - используются при обновлении данных вместо загрузки
+PREFETCHED_UPDATE = {}
+
 # Количество дней между отсечкой и эксдивидендной датой
 T2 = 1
 
 
 class QuotesT2DataManager(data_manager.AbstractDataManager):
-    """Реализует особенность загрузки и хранения истории котировок в режиме T+2"""
+    """Реализует особенность загрузки и хранения истории котировок в режиме T+2
+
+    Котировки всех тикеров хранятся в общем колоночном хранилище
+    """
+    data_file_class = ColumnarDataFile
+
     def __init__(self, ticker):
         super().__init__(QUOTES_CATEGORY, ticker)
 
@@ -34,6 +48,9 @@ class QuotesT2DataManager(data_manager.AbstractDataManager):
     def _yield_aliases_quotes_history(self):
         """Генерирует истории котировок для все тикеров аналогов заданного тикера"""
         ticker = self.data_name
+        if ticker in PREFETCHED_HISTORY:
+            yield from PREFETCHED_HISTORY[ticker]
+            return
         aliases_tickers = local.moex.aliases(ticker)
         for ticker in aliases_tickers:
             yield moex.quotes_t2(ticker)
@@ -41,6 +58,8 @@ class QuotesT2DataManager(data_manager.AbstractDataManager):
     def download_update(self):
         """Загружает историю котировок в режиме T+2 начиная с последней имеющейся даты"""
         ticker = self.data_name
+        if ticker in PREFETCHED_UPDATE:
+            return PREFETCHED_UPDATE[ticker]
         last_date = self.value.index[-1]
         return moex.quotes_t2(ticker, last_date)
 
@@ -64,7 +83,24 @@ def quotes_t2(ticker: str):
     return data.value
 
 
-@functools.lru_cache(maxsize=1)
+def _store_version():
+    """Версия хранилища котировок в текущем каталоге данных - при ее изменении кэши цен и объемов очищаются"""
+    return settings.DATA_PATH, columnar_store(QUOTES_CATEGORY).version
+
+
+def _split_rows(result, ticker):
+    """Данные тикера из результата для многих тикеров - строки, на которые у тикера есть котировки в панели"""
+    return result.loc[quotes_panel(QUOTES_CATEGORY, (ticker,)).dates(ticker), [ticker]]
+
+
+def _panel(tickers: tuple):
+    """Общая панель котировок в режиме T+2, содержащая актуальные данные для всех тикеров из набора"""
+    for ticker in tickers:
+        quotes_t2(ticker)
+    return quotes_panel(QUOTES_CATEGORY, tickers)
+
+
+@tickers_cache(batch=True, version=_store_version, split=_split_rows)
 def prices_t2(tickers: tuple):
     """Возвращает историю цен закрытия в режиме T+2 по набору тикеров из локальных данных, при необходимости обновляя их
 
@@ -78,13 +114,12 @@ def prices_t2(tickers: tuple):
     pandas.DataFrame
         В строках даты торгов
     """
-    df = pd.concat([quotes_t2(ticker)[CLOSE_PRICE] for ticker in tickers], axis=1)
-    df.columns = tickers
+    df = _panel(tickers).frame(CLOSE_PRICE, tickers)
     df.columns.name = TICKER
     return df
 
 
-@functools.lru_cache(maxsize=1)
+@tickers_cache(batch=True, version=_store_version, split=_split_rows)
 def volumes_t2(tickers: tuple):
     """Возвращает историю объемов торгов в режиме T+2 для тикеров из локальных данных, при необходимости обновляя их
 
@@ -98,9 +133,14 @@ def volumes_t2(tickers: tuple):
     pandas.DataFrame
         В строках даты торгов
     """
-    df = pd.concat([quotes_t2(ticker)[VOLUME] for ticker in tickers], axis=1)
-    df.columns = tickers
-    return df
+    return _panel(tickers).frame(VOLUME, tickers)
+
+
+def cache_clear():
+    """Очищает кэши загруженных котировок, например, после обновления локальных данных"""
+    quotes_t2.cache_clear()
+    prices_t2.cache_clear()
+    volumes_t2.cache_clear()
 
 
 def t2_shift(date, index):
@@ -135,11 +175,11 @@ def log_returns_with_div(tickers: tuple, last_date: pd.Timestamp):
         Строки - логарифмы месячных доходностей с учетом дивидендов
     """
     prices = prices_t2(tickers).fillna(method='ffill', axis='index')
-    monthly_prices = prices.groupby(by=aggregation.monthly_aggregation_func(last_date)).last()
+    monthly_prices = prices.groupby(by=aggregation.monthly_aggregation_index(prices.index, last_date)).last()
     monthly_prices = monthly_prices.loc[:last_date]
     div = dividends.dividends(tickers).loc[monthly_prices.index[0]:, :]
     div.index = div.index.map(functools.partial(t2_shift, index=prices.index))
-    monthly_dividends = div.groupby(by=aggregation.monthly_aggregation_func(last_date)).sum()
+    monthly_dividends = div.groupby(by=aggregation.monthly_aggregation_index(div.index, last_date)).sum()
     # В некоторые месяцы не платятся дивиденды - без этого буду NaN при расчете доходностей
     monthly_dividends = monthly_dividends.reindex(index=monthly_prices.index, fill_value=0)
     returns = (monthly_prices + monthly_dividends) / monthly_prices.shift(1)
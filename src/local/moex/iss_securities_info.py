@@ -1,7 +1,6 @@
 """Сохраняет, обновляет и загружает локальную версию информации об акциях"""
-from functools import lru_cache
-
 from utils.data_manager import AbstractDataManager
+from utils.tickers_cache import tickers_cache
 from web import moex
 from web.labels import COMPANY_NAME, REG_NUMBER, LOT_SIZE
 
@@ -45,7 +44,7 @@ def securities_info(tickers: tuple):
     return data.value.loc[tickers, :]
 
 
-@lru_cache(maxsize=1)
+@tickers_cache(axis='index')
 def lot_size(tickers: tuple):
     """Возвращает размеры лотов для тикеров
 
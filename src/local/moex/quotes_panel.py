@@ -0,0 +1,119 @@
+"""Выровненная по общему календарю торгов панель котировок всех тикеров"""
+import numpy as np
+import pandas as pd
+
+import settings
+from utils.columnar_file import columnar_store, INDEX_FILE
+
+
+class QuotesPanel:
+    """Плотные массивы дата x тикер для всех колонок котировок из колоночного хранилища
+
+    Календарь торгов является объединением дат всех тикеров хранилища. Дополнительно хранится маска наличия строки
+    тикера на дату, чтобы выборка по набору тикеров содержала те же даты, что и объединение их индивидуальных историй
+    Панель строится одной операцией размещения строк хранилища в массивах и используется всеми наборами тикеров
+    """
+
+    def __init__(self, data_category: str):
+        """
+        Parameters
+        ----------
+        data_category
+            Категория данных колоночного хранилища
+        """
+        store = columnar_store(data_category)
+        self._data_category = data_category
+        self._version = store.version
+        names = store.names
+        self._positions = {name: number for number, name in enumerate(names)}
+        rows, tickers = self._rows_positions(store, names)
+        arrays = store.arrays()
+        columns = store.columns or []
+        if len(rows):
+            dates = arrays[INDEX_FILE][rows].view('datetime64[ns]')
+        else:
+            dates = np.array([], dtype='datetime64[ns]')
+        calendar, dates_positions = np.unique(dates, return_inverse=True)
+        index_names = [store.index_name(name) for name in names]
+        self._calendar = pd.DatetimeIndex(calendar, name=next(filter(None, index_names), None))
+        shape = (len(calendar), len(names))
+        self._present = np.zeros(shape, dtype=bool, order='F')
+        self._present[dates_positions, tickers] = True
+        self._values = {}
+        for column in columns:
+            values = np.full(shape, np.nan, order='F')
+            values[dates_positions, tickers] = arrays[column][rows]
+            self._values[column] = values
+
+    @staticmethod
+    def _rows_positions(store, names):
+        """Номера строк хранилища для всех серий и соответствующие им номера тикеров"""
+        rows = [np.arange(start, stop) for name in names for start, stop in store.segments(name)]
+        tickers = [np.full(stop - start, number) for number, name in enumerate(names)
+                   for start, stop in store.segments(name)]
+        if not rows:
+            return np.array([], dtype=int), np.array([], dtype=int)
+        return np.concatenate(rows), np.concatenate(tickers)
+
+    @property
+    def version(self):
+        """Версия данных хранилища, по которой построена панель"""
+        return self._version
+
+    @property
+    def calendar(self):
+        """Общий календарь торгов"""
+        return self._calendar
+
+    def __contains__(self, ticker):
+        return ticker in self._positions
+
+    def dates(self, ticker: str):
+        """Даты, на которые у тикера есть котировки"""
+        return self._calendar[self._present[:, self._positions[ticker]]]
+
+    def frame(self, column: str, tickers: tuple):
+        """DataFrame с колонкой котировок для набора тикеров
+
+        Parameters
+        ----------
+        column
+            Колонка котировок
+        tickers
+            Кортеж тикеров - все тикеры должны присутствовать в панели
+
+        Returns
+        -------
+        pandas.DataFrame
+            В строках даты торгов хотя бы одного из тикеров
+            В столбцах тикеры
+        """
+        positions = [self._positions[ticker] for ticker in tickers]
+        present = self._present[:, positions].any(axis=1)
+        values = self._values[column]
+        if len(positions) == 1 or positions == list(range(positions[0], positions[-1] + 1)):
+            # Последовательные тикеры выбираются срезом без копирования столбцов
+            values = values[:, positions[0]:positions[-1] + 1]
+        else:
+            values = values[:, positions]
+        if not present.all():
+            values = values[present]
+        return pd.DataFrame(values, index=self._calendar[present], columns=list(tickers), copy=False)
+
+
+# Панели в разрезе каталогов данных и категорий
+_PANELS = {}
+
+
+def quotes_panel(data_category: str, tickers: tuple):
+    """Возвращает панель котировок, содержащую все тикеры из набора
+
+    Панель перестраивается, если строки хранилища изменились или отсутствует какой-либо из тикеров
+    """
+    key = (settings.DATA_PATH, data_category)
+    panel = _PANELS.get(key)
+    store = columnar_store(data_category)
+    if panel is None or panel.version != store.version or not all(ticker in panel for ticker in tickers):
+        panel = QuotesPanel(data_category)
+        _PANELS[key] = panel
+    return panel
@@ -0,0 +1,96 @@
+import time
+from pathlib import Path
+
+import arrow
+import pandas as pd
+import pytest
+
+import settings
+from local.moex import iss_bulk, iss_quotes
+from utils.columnar_file import columnar_store
+from utils.data_manager import MARKET_TIME_ZONE
+from utils.refresher import background_refresher
+from web.labels import CLOSE_PRICE, DATE, TICKER, VOLUME
+
+TODAY = pd.Timestamp(arrow.now().to(MARKET_TIME_ZONE).date())
+OLD_UPDATE = time.time() - 7 * 24 * 60 * 60
+
+
+def make_df(dates, close, volume):
+    return pd.DataFrame({CLOSE_PRICE: close, VOLUME: volume}, index=pd.DatetimeIndex(dates, name=DATE))
+
+
+@pytest.fixture(autouse=True)
+def make_store(tmpdir):
+    saved_path = settings.DATA_PATH
+    settings.DATA_PATH = Path(tmpdir)
+    store = columnar_store(iss_quotes.QUOTES_CATEGORY)
+    day = pd.Timedelta(days=1)
+    store.write('AKRN', make_df([TODAY - 3 * day, TODAY - 2 * day], [1.0, 2.0], [10, 20]), OLD_UPDATE)
+    store.write('KUNF', make_df([TODAY - 2 * day], [5.0], [50]), OLD_UPDATE)
+    store.write('GMKN', make_df([TODAY - 2 * day], [3.0], [30]))
+    store.write('MTSS', make_df([TODAY - 100 * day], [4.0], [40]), OLD_UPDATE)
+    iss_quotes.cache_clear()
+    yield
+    settings.DATA_PATH = saved_path
+
+
+def fake_download(akrn_close):
+    day = pd.Timedelta(days=1)
+    rows = [['AKRN', TODAY - 2 * day, akrn_close, 20],
+            ['AKRN', TODAY - day, 3.0, 30],
+            ['AKRN', TODAY - day, 30.0, 1],
+            ['GMKN', TODAY - day, 6.0, 60],
+            ['AKRN', TODAY, 4.0, 40]]
+    requests = []
+
+    def quotes_by_date(self, dates):
+        requests.append(dates)
+        return pd.DataFrame(rows, columns=[TICKER, DATE, CLOSE_PRICE, VOLUME])
+
+    return quotes_by_date, requests
+
+
+def test_refresh_quotes(monkeypatch):
+    quotes_by_date, requests = fake_download(2.0)
+    monkeypatch.setattr(iss_bulk.BulkDownloader, 'quotes_by_date', quotes_by_date)
+    assert iss_bulk.refresh_quotes() == ('AKRN', 'KUNF')
+    assert requests == [tuple(pd.date_range(TODAY - pd.Timedelta(days=2), TODAY))]
+    store = columnar_store(iss_quotes.QUOTES_CATEGORY)
+    df = store.read('AKRN')
+    assert df[CLOSE_PRICE].tolist() == [1.0, 2.0, 3.0, 4.0]
+    assert df[VOLUME].tolist() == [10, 20, 30, 40]
+    assert len(store.read('KUNF')) == 1
+    assert store.last_update('KUNF') > OLD_UPDATE
+    assert len(store.read('GMKN')) == 1
+    assert store.last_update('MTSS') == OLD_UPDATE
+    assert iss_quotes.PREFETCHED_UPDATE == {}
+
+
+def test_refresh_quotes_mismatch(monkeypatch):
+    quotes_by_date, _ = fake_download(2.5)
+    monkeypatch.setattr(iss_bulk.BulkDownloader, 'quotes_by_date', quotes_by_date)
+    with pytest.raises(ValueError) as error:
+        iss_bulk.refresh_quotes()
+    assert 'AKRN' in str(error.value)
+    assert len(columnar_store(iss_quotes.QUOTES_CATEGORY).read('AKRN')) == 2
+    assert iss_quotes.PREFETCHED_UPDATE == {}
+
+
+@pytest.mark.parametrize('mode', ['offline', 'background'])
+def test_refresh_quotes_update_mode(monkeypatch, mode):
+    quotes_by_date, _ = fake_download(2.0)
+    monkeypatch.setattr(iss_bulk.BulkDownloader, 'quotes_by_date', quotes_by_date)
+    monkeypatch.setattr(settings, 'UPDATE_MODE', mode)
+
+    def no_download(*_):
+        raise AssertionError('Котировки тикера не должны загружаться отдельно')
+
+    monkeypatch.setattr(iss_quotes.moex, 'quotes', no_download)
+    assert iss_bulk.refresh_quotes() == ('AKRN', 'KUNF')
+    background_refresher().join()
+    assert background_refresher().pending == ()
+    store = columnar_store(iss_quotes.QUOTES_CATEGORY)
+    assert store.read('AKRN')[CLOSE_PRICE].tolist() == [1.0, 2.0, 3.0, 4.0]
+    assert store.last_update('KUNF') > OLD_UPDATE
+    assert settings.UPDATE_MODE == mode
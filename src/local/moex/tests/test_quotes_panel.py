@@ -0,0 +1,74 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import settings
+from local.moex import iss_quotes, quotes_panel
+from utils.columnar_file import ColumnarDataFile
+from web.labels import CLOSE_PRICE, DATE, VOLUME
+
+QUOTES = {'AKRN': (['2018-03-05', '2018-03-06', '2018-03-09'], [1.0, np.nan, 3.0], [10, 0, 30]),
+          'GMKN': (['2018-03-06', '2018-03-07'], [5.0, 6.0], [50, 60]),
+          'MTSS': (['2018-03-12'], [7.0], [70]),
+          'KUNF': ([], [], [])}
+
+
+@pytest.fixture(autouse=True)
+def make_store(tmpdir):
+    saved_path = settings.DATA_PATH
+    settings.DATA_PATH = Path(tmpdir)
+    for ticker, (dates, close, volume) in QUOTES.items():
+        df = pd.DataFrame({CLOSE_PRICE: close, VOLUME: volume},
+                          index=pd.DatetimeIndex(dates, name=DATE),
+                          columns=[CLOSE_PRICE, VOLUME])
+        ColumnarDataFile('quotes', ticker).value = df
+    yield
+    settings.DATA_PATH = saved_path
+
+
+def concat_quotes(column, tickers):
+    df = pd.concat([ColumnarDataFile('quotes', ticker).value[column] for ticker in tickers], axis=1)
+    df.columns = tickers
+    return df
+
+
+@pytest.mark.parametrize('tickers', [('AKRN', 'GMKN'), ('GMKN', 'AKRN'), ('AKRN', 'MTSS', 'AKRN'), ('MTSS',),
+                                     ('KUNF', 'GMKN')])
+@pytest.mark.parametrize('column', [CLOSE_PRICE, VOLUME])
+def test_frame_equals_concat(tickers, column):
+    panel = quotes_panel.quotes_panel('quotes', tickers)
+    pd.testing.assert_frame_equal(panel.frame(column, tickers), concat_quotes(column, tickers), check_dtype=False)
+
+
+def test_calendar():
+    panel = quotes_panel.quotes_panel('quotes', ('AKRN',))
+    assert panel.calendar.name == DATE
+    assert len(panel.calendar) == 5
+    assert panel.calendar[-1] == pd.Timestamp('2018-03-12')
+
+
+def test_panel_reused_and_rebuilt():
+    panel = quotes_panel.quotes_panel('quotes', ('AKRN', 'GMKN'))
+    assert quotes_panel.quotes_panel('quotes', ('MTSS',)) is panel
+    new_row = pd.DataFrame({CLOSE_PRICE: [8.0], VOLUME: [80]}, index=pd.DatetimeIndex(['2018-03-13'], name=DATE))
+    ColumnarDataFile('quotes', 'MTSS').append(new_row)
+    new_panel = quotes_panel.quotes_panel('quotes', ('MTSS',))
+    assert new_panel is not panel
+    assert new_panel.frame(CLOSE_PRICE, ('MTSS',))['MTSS'].tolist() == [7.0, 8.0]
+
+
+def test_cached_prices_and_volumes(monkeypatch):
+    monkeypatch.setattr(settings, 'UPDATE_MODE', 'offline')
+    iss_quotes.cache_clear()
+    for tickers in [('AKRN', 'GMKN'), ('AKRN', 'MTSS'), ('MTSS', 'GMKN', 'AKRN')]:
+        pd.testing.assert_frame_equal(iss_quotes.prices(tickers), concat_quotes(CLOSE_PRICE, tickers),
+                                      check_dtype=False)
+        pd.testing.assert_frame_equal(iss_quotes.volumes(tickers), concat_quotes(VOLUME, tickers),
+                                      check_dtype=False)
+    assert iss_quotes.prices.cache_info().column_misses == 3
+    new_row = pd.DataFrame({CLOSE_PRICE: [8.0], VOLUME: [80]}, index=pd.DatetimeIndex(['2018-03-13'], name=DATE))
+    ColumnarDataFile('quotes', 'MTSS').append(new_row)
+    assert iss_quotes.prices(('AKRN', 'MTSS'))['MTSS'].dropna().tolist() == [7.0, 8.0]
+    iss_quotes.cache_clear()
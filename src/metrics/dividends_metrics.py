@@ -5,6 +5,7 @@ import pandas as pd
 
 from metrics.portfolio import Portfolio, CASH, PORTFOLIO
 from settings import T_SCORE
+from utils.versioned_cache import versioned_property
 
 DIVIDENDS_YEARS = 5
 DIVIDENDS_MONTHS = DIVIDENDS_YEARS * 12
@@ -16,6 +17,11 @@ class AbstractDividendsMetrics(ABC):
     def __init__(self, portfolio: Portfolio):
         self._portfolio = portfolio
 
+    @property
+    def version(self):
+        """Версия метрик совпадает с версией портфеля"""
+        return self._portfolio.version
+
     def __str__(self):
         frames = [self.mean,
                   self.std,
@@ -37,7 +43,7 @@ class AbstractDividendsMetrics(ABC):
         """Series матожидание реальной посленалоговой дивидендной доходности только для тикеров без CASH и PORTFOLIO"""
         raise NotImplementedError
 
-    @property
+    @versioned_property
     def mean(self):
         """Матожидание дивидендной доходности по всем позициям портфеля"""
         mean = self._tickers_real_after_tax_mean
@@ -52,7 +58,7 @@ class AbstractDividendsMetrics(ABC):
         """Series СКО реальной посленалоговой дивидендной доходности только для тикеров без CASH и PORTFOLIO"""
         raise NotImplementedError
 
-    @property
+    @versioned_property
     def std(self):
         """СКО дивидендной доходности по всем позициям портфеля
 
@@ -66,7 +72,7 @@ class AbstractDividendsMetrics(ABC):
         std[PORTFOLIO] = (weighted_std ** 2).sum(axis='index') ** 0.5
         return std
 
-    @property
+    @versioned_property
     def beta(self):
         """Беты дивидендных доходностей
 
@@ -79,7 +85,7 @@ class AbstractDividendsMetrics(ABC):
         var = self.std ** 2
         return (self._portfolio.weight * var) / (var[PORTFOLIO])
 
-    @property
+    @versioned_property
     def lower_bound(self):
         """Рассчитывает нижнюю границу доверительного интервала для дивидендной доходности
 
@@ -91,7 +97,7 @@ class AbstractDividendsMetrics(ABC):
         lower_bound[lower_bound < 0] = 0
         return lower_bound
 
-    @property
+    @versioned_property
     def gradient(self):
         """Рассчитывает производную нижней границы по доле актива в портфеле
 
@@ -1,14 +1,13 @@
 """Реализация основных метрик дивидендного потока классической схеме"""
 
-from functools import lru_cache
-
 import local
 from local import dividends
 from metrics.dividends_metrics import AbstractDividendsMetrics
 from metrics.portfolio import Portfolio
 from settings import AFTER_TAX
 # Период, который является источником для статистики
-from utils.aggregation import yearly_aggregation_func
+from utils.aggregation import yearly_aggregation_index
+from utils.versioned_cache import versioned_property
 
 DIVIDENDS_YEARS = 5
 DIVIDENDS_MONTHS = DIVIDENDS_YEARS * 12
@@ -29,7 +28,7 @@ class BaseDividendsMetrics(AbstractDividendsMetrics):
         df.reindex(index=positions)
         return df
 
-    @property
+    @versioned_property
     def real_after_tax_monthly(self):
         """Дивиденды после уплаты налогов в реальном выражении по месяцам (в ценах последнего месяца)
 
@@ -51,10 +50,9 @@ class BaseDividendsMetrics(AbstractDividendsMetrics):
         1 - ставка налога = AFTER_TAX указывается в модуле настроек
         """
         real_after_tax = self.real_after_tax_monthly
-        return real_after_tax.groupby(by=yearly_aggregation_func(self._portfolio.date)).sum()
+        return real_after_tax.groupby(by=yearly_aggregation_index(real_after_tax.index, self._portfolio.date)).sum()
 
-    @property
-    @lru_cache(maxsize=1)
+    @versioned_property
     def yields(self):
         """Дивидендная доходность"""
         dividends = self.real_after_tax
@@ -4,6 +4,7 @@ import pandas as pd
 import ml.dividends.manager
 from metrics.dividends_metrics import AbstractDividendsMetrics
 from metrics.portfolio import Portfolio
+from utils.versioned_cache import versioned_property
 
 
 class MLDividendsMetrics(AbstractDividendsMetrics):
@@ -13,14 +14,14 @@ class MLDividendsMetrics(AbstractDividendsMetrics):
     категориальной переменной на основе тикеров. СКО прогноза вычисляется с помощью кросс-валидации
     """
 
-    @property
+    @versioned_property
     def _tickers_real_after_tax_mean(self):
         portfolio = self._portfolio
         manager = ml.dividends.manager.DividendsMLDataManager(portfolio.positions[:-2],
                                                               pd.Timestamp(portfolio.date))
         return manager.value.prediction_mean
 
-    @property
+    @versioned_property
     def _tickers_real_after_tax_std(self):
         portfolio = self._portfolio
         manager = ml.dividends.manager.DividendsMLDataManager(portfolio.positions[:-2],
@@ -0,0 +1,139 @@
+"""Экспоненциально сглаженные моменты доходностей на последнюю дату"""
+import collections
+import copy
+
+import numpy as np
+import pandas as pd
+
+# Количество наборов моментов, хранящихся в кэше
+MAX_CACHED = 16
+
+
+class EWMMoments:
+    """Экспоненциально сглаженные среднее, СКО и ковариационная матрица на последнюю дату
+
+    Совпадают с результатами pandas ewm(alpha=1 - decay) с поправкой на смещение для рядов без пропусков, но
+    вычисляются за один проход по массиву без расчета промежуточных значений для всех дат. Новые строки учитываются
+    без пересчета по всей истории - веса накопленных данных умножаются на константу сглаживания, а среднее и сумма
+    попарных произведений отклонений обновляются по формулам Уэлфорда
+    """
+
+    def __init__(self, columns, decay: float):
+        """
+        Parameters
+        ----------
+        columns
+            Названия рядов
+        decay
+            Константа сглаживания
+        """
+        self._columns = pd.Index(columns)
+        self._decay = decay
+        # Сумма весов, сумма квадратов весов, среднее и сумма взвешенных произведений отклонений от среднего
+        self._weight = 0.0
+        self._weight_squared = 0.0
+        self._mean = np.zeros(len(columns))
+        self._product = np.zeros((len(columns), len(columns)))
+        self._rows = 0
+
+    @property
+    def decay(self):
+        """Константа сглаживания"""
+        return self._decay
+
+    @property
+    def rows(self):
+        """Количество учтенных строк"""
+        return self._rows
+
+    def fit(self, values: np.ndarray):
+        """Учитывает строки массива - в строках периоды, в столбцах ряды"""
+        values = np.asarray(values, dtype=float)
+        if not len(values):
+            return self
+        weights = self._decay ** np.arange(len(values) - 1, -1, -1)
+        old_weight = self._weight * self._decay ** len(values)
+        weight = old_weight + weights.sum()
+        mean = (old_weight * self._mean + weights @ values) / weight
+        deviation = values - mean
+        shift = self._mean - mean
+        self._product = (self._product * self._decay ** len(values)
+                         + old_weight * np.outer(shift, shift)
+                         + (deviation * weights[:, np.newaxis]).T @ deviation)
+        self._weight_squared = self._weight_squared * self._decay ** (2 * len(values)) + (weights ** 2).sum()
+        self._weight = weight
+        self._mean = mean
+        self._rows += len(values)
+        return self
+
+    def update(self, row):
+        """Учитывает одну новую строку"""
+        row = np.asarray(row, dtype=float)
+        old_weight = self._weight * self._decay
+        weight = old_weight + 1
+        deviation = row - self._mean
+        mean = self._mean + deviation / weight
+        self._product = self._product * self._decay + np.outer(deviation, row - mean)
+        self._weight_squared = self._weight_squared * self._decay ** 2 + 1
+        self._weight = weight
+        self._mean = mean
+        self._rows += 1
+        return self
+
+    @property
+    def mean(self):
+        """Среднее"""
+        return pd.Series(self._mean, index=self._columns)
+
+    @property
+    def cov(self):
+        """Ковариационная матрица с поправкой на смещение"""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cov = self._product * self._weight / (self._weight ** 2 - self._weight_squared)
+        return pd.DataFrame(cov, index=self._columns, columns=self._columns)
+
+    @property
+    def std(self):
+        """СКО с поправкой на смещение"""
+        return pd.Series(np.diag(self.cov.values) ** 0.5, index=self._columns)
+
+
+_CACHE = collections.OrderedDict()
+
+
+def ewm_moments(returns: pd.DataFrame, decay: float):
+    """Моменты доходностей на последнюю дату с кэшированием для пары доходности и константа сглаживания
+
+    Если доходности отличаются от кэшированных только новыми строками в конце, то учитываются только они
+
+    Parameters
+    ----------
+    returns
+        Доходности без пропусков - в строках периоды, в столбцах ряды
+    decay
+        Константа сглаживания
+
+    Returns
+    -------
+    EWMMoments
+        Моменты доходностей на последнюю дату
+    """
+    key = tuple(returns.columns), decay
+    values = returns.values
+    if key in _CACHE:
+        index, cached_values, moments = _CACHE[key]
+        rows = len(cached_values)
+        if (returns.index[:rows].equals(index) and len(values) >= rows
+                and np.array_equal(values[:rows], cached_values)):
+            if len(values) > rows:
+                moments = copy.deepcopy(moments)
+                for row in values[rows:]:
+                    moments.update(row)
+                _CACHE[key] = returns.index, values.copy(), moments
+            _CACHE.move_to_end(key)
+            return moments
+    moments = EWMMoments(returns.columns, decay).fit(values)
+    _CACHE[key] = returns.index, values.copy(), moments
+    if len(_CACHE) > MAX_CACHED:
+        _CACHE.popitem(last=False)
+    return moments
@@ -1,12 +1,11 @@
 """Реализация класса портфеля"""
 
-from functools import lru_cache
-
 import numpy as np
 import pandas as pd
 
 from local import moex
 from settings import VOLUME_CUT_OFF
+from utils.versioned_cache import versioned_property
 from web.labels import LOT_SIZE
 
 CASH = 'CASH'
@@ -25,12 +24,16 @@ class Portfolio:
     Для проверки может быть передана стоимость портфеля, которая не должна сильно отличаться от расчетной стоимости, на
     основе котировок на отчетную дату
     Отчетная дата должна быть торговым днем
+
+    Производные характеристики портфеля кэшируются и пересчитываются только после изменения количества лотов, при
+    котором увеличивается версия портфеля
     """
     def __init__(self, date: str, cash: float, positions: dict, value: float = None):
         self._date = pd.to_datetime(date).date()
         self._positions = tuple(sorted(positions.keys())) + (CASH, PORTFOLIO)
         data = [positions[ticker] for ticker in self._positions[:-2]] + [cash, 1]
         self._lots = pd.Series(data=data, index=self._positions, name=LOTS)
+        self._version = 0
         if value:
             if not np.isclose(self.value[PORTFOLIO], value):
                 raise ValueError(f'Введенная стоимость портфеля {value} '
@@ -64,6 +67,36 @@ class Portfolio:
         return self._positions
 
     @property
+    def version(self):
+        """Версия портфеля - увеличивается при каждом изменении количества лотов"""
+        return self._version
+
+    def change_lots(self, positions: dict = None, cash: float = None):
+        """Изменяет количество лотов по части позиций и количество денежных средств
+
+        Состав позиций портфеля не меняется. Кэшированные характеристики портфеля и зависящих от него метрик
+        пересчитываются при следующем обращении
+
+        Parameters
+        ----------
+        positions
+            Словарь с новым количеством лотов для тикеров портфеля
+        cash
+            Новое количество денежных средств
+        """
+        positions = dict(positions or {})
+        unknown = set(positions) - set(self._positions[:-2])
+        if unknown:
+            raise ValueError(f'Тикеры {sorted(unknown)} отсутствуют в портфеле')
+        if cash is not None:
+            positions[CASH] = cash
+        lots = self._lots.copy()
+        for ticker, value in positions.items():
+            lots[ticker] = value
+        self._lots = lots
+        self._version += 1
+
+    @versioned_property
     def lot_size(self):
         """Размер лотов отдельных позиций
 
@@ -79,9 +112,9 @@ class Portfolio:
         """Количество лотов для отдельных позиций
 
         Количество лотов для CASH и PORTFOLIO количество денег и 1"""
-        return self._lots
+        return self._lots.copy()
 
-    @property
+    @versioned_property
     def shares(self):
         """Количество акций для отдельных позиций"""
         return self.lot_size * self._lots
@@ -95,8 +128,7 @@ class Portfolio:
         else:
             return 0
 
-    @property
-    @lru_cache(maxsize=1)
+    @versioned_property
     def price(self):
         """Цены акций на дату портфеля для отдельных позиций"""
         tickers = self._positions[:-2]
@@ -107,31 +139,50 @@ class Portfolio:
         price[PORTFOLIO] = (self.shares[:-1] * price).sum(axis='index')
         return price
 
-    @property
-    @lru_cache(maxsize=1)
+    @versioned_property
     def value(self):
         """Стоимость отдельных позиций"""
         df = self.shares * self.price
         return df
 
-    @property
+    @versioned_property
     def weight(self):
         """Вес отдельных позиций в стоимости портфеля"""
         value = self.value
         df = value / value[PORTFOLIO]
         return df
 
-    @property
+    @versioned_property
     def volume_factor(self):
         """Понижающий коэффициент для акций с малым объемом оборотов
 
         Ликвидность в первом приближении убывает пропорционально квадрату оборота, что отражено в формулах расчета
         """
-        last_volume = moex.volumes(self.positions[:-2]).loc[self.date]
-        volume_share_of_portfolio = last_volume * self.price[:-2] / self.value[PORTFOLIO]
+        volume_factor = self.tickers_volume_factor(self.positions[:-2], self.price[:-2])
+        return volume_factor.reindex(index=self.positions, fill_value=1)
+
+    def tickers_volume_factor(self, tickers: tuple, price: pd.Series = None):
+        """Понижающий коэффициент для произвольных тикеров, в том числе не входящих в портфель
+
+        Parameters
+        ----------
+        tickers
+            Кортеж тикеров
+        price
+            Цены тикеров на дату портфеля - если не указаны, то загружаются
+
+        Returns
+        -------
+        pd.Series
+            Понижающие коэффициенты для тикеров
+        """
+        if price is None:
+            price = moex.prices(tickers).loc[:self._date].apply(self._last_price)
+        last_volume = moex.volumes(tickers).loc[self.date]
+        volume_share_of_portfolio = last_volume * price / self.value[PORTFOLIO]
         volume_factor = 1 - (VOLUME_CUT_OFF / volume_share_of_portfolio) ** 2
         volume_factor[volume_factor < 0] = 0
-        return volume_factor.reindex(index=self.positions, fill_value=1)
+        return volume_factor
 
 
 if __name__ == '__main__':
@@ -4,8 +4,41 @@ from abc import ABC, abstractmethod
 import numpy as np
 import pandas as pd
 
+from metrics.ewm_moments import ewm_moments
 from metrics.portfolio import Portfolio, CASH, PORTFOLIO
 from settings import T_SCORE
+from utils.versioned_cache import versioned_property
+
+
+def ewm_last_moments(returns: np.ndarray, portfolio_returns: np.ndarray, decay: float):
+    """Экспоненциально сглаженные моменты доходностей на последнюю дату
+
+    Веса и поправка на смещение совпадают с pandas ewm(alpha=1 - decay) для рядов без пропусков, но вычисляются только
+    для последней даты и сразу для всех столбцов
+
+    Parameters
+    ----------
+    returns
+        Матрица доходностей - в строках периоды, в столбцах бумаги
+    portfolio_returns
+        Доходности портфеля
+    decay
+        Константа сглаживания
+
+    Returns
+    -------
+    tuple
+        Средние и дисперсии бумаг, ковариации бумаг с портфелем, среднее и дисперсия портфеля
+    """
+    weights = decay ** np.arange(len(portfolio_returns) - 1, -1, -1)
+    weights = weights / weights.sum()
+    bias = 1 / (1 - (weights ** 2).sum())
+    mean = weights @ returns
+    mean_p = weights @ portfolio_returns
+    var = (weights @ returns ** 2 - mean ** 2) * bias
+    cov = (weights @ (returns * portfolio_returns[:, np.newaxis]) - mean * mean_p) * bias
+    var_p = (weights @ portfolio_returns ** 2 - mean_p ** 2) * bias
+    return mean, var, cov, mean_p, var_p
 
 
 class AbstractReturnsMetrics(ABC):
@@ -14,6 +47,16 @@ class AbstractReturnsMetrics(ABC):
     def __init__(self, portfolio: Portfolio):
         self._portfolio = portfolio
 
+    @property
+    def version(self):
+        """Версия метрик - версия портфеля и константа сглаживания"""
+        return self._portfolio.version, self.decay
+
+    @property
+    def portfolio_version(self):
+        """Версия портфеля - для свойств, не зависящих от константы сглаживания"""
+        return self._portfolio.version
+
     def __str__(self):
         frames = [self.mean,
                   self.std,
@@ -36,38 +79,80 @@ class AbstractReturnsMetrics(ABC):
         """Доходности составляющих портфеля и самого портфеля"""
         raise NotImplementedError
 
+    @abstractmethod
+    def tickers_returns(self, tickers: tuple):
+        """Доходности произвольных тикеров за те же периоды, что и доходности портфеля
+
+        Пропущенные значения заменяются нулями
+        """
+        raise NotImplementedError
+
     @property
     @abstractmethod
     def decay(self):
         """Константа сглаживания"""
         raise NotImplementedError
 
-    @property
+    @versioned_property
+    def moments(self):
+        """Экспоненциально сглаженные моменты доходностей на последнюю дату
+
+        Рассчитываются за один проход и кэшируются для пары доходности и константа сглаживания. Для доходностей с
+        пропусками возвращается None, и моменты рассчитываются стандартными средствами pandas
+        """
+        returns = self.returns
+        if returns.isna().values.any():
+            return None
+        return ewm_moments(returns, self.decay)
+
+    @versioned_property
     def mean(self):
         """Ожидаемая доходность отдельных позиций и портфеля
         Используется простой процесс экспоненциального сглаживания
         """
-        return self.returns.ewm(alpha=1 - self.decay).mean().iloc[-1]
+        moments = self.moments
+        if moments is None:
+            return self.returns.ewm(alpha=1 - self.decay).mean().iloc[-1]
+        return moments.mean.rename(self.returns.index[-1])
 
-    @property
+    @versioned_property
     def std(self):
         """СКО отдельных позиций и портфеля
         Используется простой процесс экспоненциального сглаживания
         """
-        return self.returns.ewm(alpha=1 - self.decay).std().iloc[-1]
+        moments = self.moments
+        if moments is None:
+            return self.returns.ewm(alpha=1 - self.decay).std().iloc[-1]
+        return moments.std.rename(self.returns.index[-1])
 
-    @property
+    @versioned_property
     def beta(self):
         """Беты отдельных позиций и портфеля
 
         При расчете беты используется классическая формула cov(r,rp) / var(rp), где r и rp - доходность актива и
         портфеля, соответственно, при этом используется простой процесс экспоненциального сглаживания
         """
-        ewm = self.returns.ewm(alpha=1 - self.decay)
-        ewm_cov = ewm.cov(self.returns[PORTFOLIO])
-        return ewm_cov.multiply(1 / ewm_cov[PORTFOLIO], axis='index').iloc[-1]
+        moments = self.moments
+        if moments is None:
+            ewm = self.returns.ewm(alpha=1 - self.decay)
+            ewm_cov = ewm.cov(self.returns[PORTFOLIO])
+            return ewm_cov.multiply(1 / ewm_cov[PORTFOLIO], axis='index').iloc[-1]
+        cov = moments.cov[PORTFOLIO]
+        return (cov / cov[PORTFOLIO]).rename(self.returns.index[-1])
+
+    @versioned_property
+    def cov(self):
+        """Ковариационная матрица доходностей отдельных позиций без портфеля
+
+        Используется для расчета метрик портфеля при изменении весов позиций без пересчета доходностей
+        """
+        moments = self.moments
+        if moments is None:
+            returns = self.returns.iloc[:, :-1]
+            return returns.ewm(alpha=1 - self.decay).cov().loc[returns.index[-1]]
+        return moments.cov.iloc[:-1, :-1]
 
-    @property
+    @versioned_property
     def draw_down(self):
         """Ожидаемый draw down
 
@@ -88,7 +173,7 @@ class AbstractReturnsMetrics(ABC):
         draw_down[CASH] = 0
         return draw_down
 
-    @property
+    @versioned_property
     def gradient(self):
         """Производная нижней границы портфеля по доле актива в портфеле
 
@@ -120,3 +205,51 @@ class AbstractReturnsMetrics(ABC):
         S = s * (t ** 0.5) = s * ((t_score * s) / (2 * m)) = (t_score / 2) * (s ** 2 / m)
         """
         return (T_SCORE / 2) * (self.std[PORTFOLIO] ** 2 / self.mean[PORTFOLIO])
+
+    def what_if(self, tickers: tuple, weights=0.0):
+        """Метрики для набора кандидатов на изменение портфеля, рассчитанные за один проход
+
+        Для каждого кандидата рассматривается портфель, в котором доля weights переведена из кэша в бумагу. Доходность
+        такого портфеля отличается от текущей на weights * r, поэтому его моменты получаются обновлением первого ранга
+        моментов текущего портфеля без создания новых портфелей и метрик. Кандидатами могут быть как новые тикеры, так и
+        позиции портфеля. Используются экспоненциально сглаженные моменты с текущей константой сглаживания - при
+        нулевом изменении доли результаты для новых тикеров совпадают с метриками доходности портфеля, в который они
+        добавлены с нулевым количеством лотов
+
+        Parameters
+        ----------
+        tickers
+            Кортеж тикеров кандидатов
+        weights
+            Изменение доли кандидатов - одно значение для всех или по значению для каждого тикера
+
+        Returns
+        -------
+        pd.DataFrame
+            В строках тикеры кандидатов. В столбцах ожидаемая доходность, СКО, бета и градиент кандидата, ожидаемая
+            просадка и СКО в момент наибольшей просадки измененного портфеля и понижающий коэффициент для оборота
+        """
+        tickers = tuple(tickers)
+        returns = self.tickers_returns(tickers).reindex(columns=list(tickers)).values
+        portfolio_returns = self.returns[PORTFOLIO].values
+        mean, var, cov, mean_p, var_p = ewm_last_moments(returns, portfolio_returns, self.decay)
+        weights = np.broadcast_to(np.asarray(weights, dtype=float), mean.shape)
+        mean_p = mean_p + weights * mean
+        var_p = var_p + 2 * weights * cov + weights ** 2 * var
+        cov = cov + weights * var
+        return self._what_if_frame(tickers, mean, var ** 0.5, cov / var_p, mean_p, var_p)
+
+    def _what_if_frame(self, tickers: tuple, mean, std, beta, mean_p, var_p):
+        """Отчет what_if по метрикам кандидатов и ожидаемой доходности и дисперсии измененных портфелей"""
+        gradient = (T_SCORE / 2) ** 2 * (var_p / mean_p ** 2) * (mean - mean_p - 2 * mean_p * (beta - 1))
+        draw_down = - T_SCORE ** 2 * var_p / (4 * mean_p)
+        draw_down[mean_p < 0] = np.nan
+        df = pd.DataFrame(dict(MEAN=mean,
+                               STD=std,
+                               BETA=beta,
+                               GRADIENT=gradient,
+                               DRAW_DOWN=draw_down,
+                               STD_AT_DRAW_DOWN=(T_SCORE / 2) * (var_p / mean_p)),
+                          index=pd.Index(tickers))
+        df['VOLUME_FACTOR'] = self._portfolio.tickers_volume_factor(tickers)
+        return df
@@ -1,20 +1,61 @@
 """Реализация основных метрик доходности"""
 
-from functools import lru_cache
-
-import pandas as pd
-from scipy import optimize, stats
+import numpy as np
 
 from local import moex
 from metrics.portfolio import Portfolio, PORTFOLIO
 # Интервал поиска константы сглаживания
 from metrics.returns_metrics import AbstractReturnsMetrics
+from utils.aggregation import monthly_aggregation_index
+from utils.versioned_cache import versioned_property
 
 BOUNDS = (0.0, 1.0)
 # Интервал обычного расположения константы сглаживания - при необходимости можно расширить
 BRACKET = (0.84, 0.91)
 # Сколько процентов данных отбрасывается при оптимизации llh, чтобы экспоненциальное сглаживание стабилизировалось
 SAMPLE_DROP_OUT = 0.20
+# Количество значений константы сглаживания в начальной сетке и при каждом сужении сетки
+GRID_SIZE = 32
+ZOOM_SIZE = 8
+# Шаг сетки, при котором константа сглаживания уточняется по параболе
+XTOL = 1e-4
+
+
+def ewm_llh(returns: np.ndarray, decays: np.ndarray, start: int):
+    """-llh доходностей для набора констант сглаживания
+
+    Экспоненциально сглаженные среднее и СКО с поправкой на смещение совпадают с результатами pandas ewm, но
+    вычисляются сразу для всех периодов и констант сглаживания с помощью накопленных сумм. Веса отсчитываются от
+    последнего периода, чтобы не было переполнения, а общий для всех слагаемых множитель сокращается в отношениях сумм.
+    Для каждого периода, начиная со start, рассчитывается llh доходности следующего периода в предположении нормальности
+
+    Parameters
+    ----------
+    returns
+        Доходности без пропусков
+    decays
+        Массив констант сглаживания
+    start
+        Номер первого периода, для которого считается llh
+
+    Returns
+    -------
+    np.ndarray
+        -llh для каждой константы сглаживания
+    """
+    size = len(returns)
+    with np.errstate(divide='ignore', invalid='ignore', under='ignore', over='ignore'):
+        weights = np.exp(np.log(decays)[:, np.newaxis] * np.arange(size - 1, -1, -1))
+        weight = weights.cumsum(axis=1)
+        weight_squared = (weights ** 2).cumsum(axis=1)
+        mean = (weights * returns).cumsum(axis=1) / weight
+        var = (weights * returns ** 2).cumsum(axis=1) / weight - mean ** 2
+        var = var * weight ** 2 / (weight ** 2 - weight_squared)
+        # Первые значения отбрасываются для стабилизации сглаживания, а для последнего значения нет llh
+        mean = mean[:, start:-1]
+        var = var[:, start:-1]
+        llh = np.log(2 * np.pi * var) / 2 + (returns[start + 1:] - mean) ** 2 / (2 * var)
+    return llh.sum(axis=1)
 
 
 class BaseReturnsMetrics(AbstractReturnsMetrics):
@@ -25,29 +66,22 @@ class BaseReturnsMetrics(AbstractReturnsMetrics):
         self._decay = None
         self.fit()
 
-    @property
+    @versioned_property(version='portfolio_version')
     def monthly_prices(self):
         """Формирует DataFrame цен с шагом в месяц
 
         Эти ряды цен служат для расчета всех дальнейших показателей
         """
-        prices = moex.prices(self._portfolio.positions[:-2])
-        prices = prices[:self._portfolio.date].fillna(method='ffill')
-        return prices.groupby(by=self._monthly_aggregation).last()
+        return self._monthly_prices(self._portfolio.positions[:-2])
 
-    def _monthly_aggregation(self, x: pd.Timestamp):
-        """Приводит все даты к отчетному дню портфеля в месяце - используется для месячной агригации
-
-        Если день больше отчетного, то день относится к следующему месяцу
-        """
-        portfolio_day = self._portfolio.date.day
-        if x.day <= portfolio_day:
-            return x + pd.DateOffset(day=portfolio_day)
-        else:
-            return x + pd.DateOffset(months=1, day=portfolio_day)
+    def _monthly_prices(self, tickers: tuple):
+        """Цены с шагом в месяц для произвольного набора тикеров"""
+        prices = moex.prices(tickers)
+        prices = prices[:self._portfolio.date].fillna(method='ffill')
+        # Все даты приводятся к отчетному дню портфеля в месяце, а если день больше отчетного, то к следующему месяцу
+        return prices.groupby(by=monthly_aggregation_index(prices.index, self._portfolio.date)).last()
 
-    @property
-    @lru_cache(maxsize=1)
+    @versioned_property(version='portfolio_version')
     def returns(self):
         """Доходности составляющих портфеля и самого портфеля
 
@@ -63,20 +97,43 @@ class BaseReturnsMetrics(AbstractReturnsMetrics):
         returns[PORTFOLIO] = returns.iloc[:, :-2].multiply(weight).sum(axis=1)
         return returns
 
+    def tickers_returns(self, tickers: tuple):
+        """Месячные доходности произвольных тикеров за те же периоды, что и доходности портфеля"""
+        returns = self._monthly_prices(tickers).pct_change()
+        return returns.reindex(index=self.returns.index).fillna(0)
+
     def fit(self):
-        """Осуществляет поиск константы сглаживания методом максимального правдоподобия"""
-        result = optimize.minimize_scalar(self._llh,
-                                          bracket=BRACKET,
-                                          bounds=BOUNDS,
-                                          method='Bounded')
-        if result.success:
-            decay = result.x
-            if BRACKET[0] < decay < BRACKET[1]:
-                self._decay = decay
-            else:
-                raise ValueError(f'Константа сглаживания {decay} вне интервала {BRACKET}')
+        """Осуществляет поиск константы сглаживания методом максимального правдоподобия
+
+        Сначала llh вычисляется сразу для сетки значений на всем интервале BOUNDS, затем сетка последовательно сужается
+        вокруг лучшего значения до шага XTOL, а окончательное значение уточняется по параболе, проходящей через лучшую
+        точку сетки и ее соседей
+        """
+        returns = self.returns[PORTFOLIO].values
+        start = int(len(returns) * SAMPLE_DROP_OUT)
+        decays = np.linspace(*BOUNDS, GRID_SIZE + 2)[1:-1]
+        while True:
+            llh = ewm_llh(returns, decays, start)
+            llh[~np.isfinite(llh)] = np.inf
+            best = int(np.argmin(llh))
+            if not np.isfinite(llh[best]):
+                raise ValueError('Оптимальная константа сглаживания не найдена')
+            step = decays[1] - decays[0]
+            if step < XTOL:
+                break
+            low = max(decays[best] - step, BOUNDS[0])
+            high = min(decays[best] + step, BOUNDS[1])
+            decays = np.linspace(low, high, ZOOM_SIZE + 2)[1:-1]
+        decay = decays[best]
+        if 0 < best < len(decays) - 1:
+            left, center, right = llh[best - 1:best + 2]
+            curvature = left - 2 * center + right
+            if curvature > 0:
+                decay += step * (left - right) / (2 * curvature)
+        if BRACKET[0] < decay < BRACKET[1]:
+            self._decay = decay
         else:
-            raise ValueError('Оптимальная константа сглаживания не найдена')
+            raise ValueError(f'Константа сглаживания {decay} вне интервала {BRACKET}')
 
     def _llh_start(self):
         """Значение с которого считается llh"""
@@ -87,16 +144,7 @@ class BaseReturnsMetrics(AbstractReturnsMetrics):
 
         Используется экспоненциальное сглаживание и предположение нормальности
         """
-        ewm = self.returns[PORTFOLIO].ewm(alpha=1 - decay)
-        std = ewm.std()
-        mean = ewm.mean()
-        x = self.returns[PORTFOLIO].shift(periods=-1)
-        start = self._llh_start()
-        # Первые значения отбрасываются для стабилизации сглаживания, а для последнего значения нет llh
-        llh = stats.norm.logpdf(x.iloc[start:-1],
-                                mean.iloc[start:-1],
-                                std.iloc[start:-1])
-        return - llh.sum()
+        return ewm_llh(self.returns[PORTFOLIO].values, np.array([decay]), self._llh_start())[0]
 
     @property
     def decay(self):
@@ -1,13 +1,12 @@
 """Основные метрики доходности на базе ML-модели"""
-from functools import lru_cache
-
 import numpy as np
 import pandas as pd
 
 from local import moex
 from metrics.portfolio import CASH, PORTFOLIO, Portfolio
-from metrics.returns_metrics import AbstractReturnsMetrics
+from metrics.returns_metrics import AbstractReturnsMetrics, ewm_last_moments
 from ml.returns.manager import ReturnsMLDataManager
+from utils.versioned_cache import versioned_property
 
 
 class MLReturnsMetrics(AbstractReturnsMetrics):
@@ -19,8 +18,7 @@ class MLReturnsMetrics(AbstractReturnsMetrics):
     def __str__(self):
         return super().__str__() + f'\n\nСредняя корреляция - {self._mean_corr:.2%}'
 
-    @property
-    @lru_cache(maxsize=1)
+    @versioned_property(version='portfolio_version')
     def returns(self):
         """Доходности составляющих портфеля и самого портфеля"""
         portfolio = self._portfolio
@@ -31,12 +29,17 @@ class MLReturnsMetrics(AbstractReturnsMetrics):
         returns[PORTFOLIO] = returns.iloc[:, :-2].multiply(weight).sum(axis=1)
         return returns
 
+    def tickers_returns(self, tickers: tuple):
+        """Доходности произвольных тикеров за те же периоды, что и доходности портфеля"""
+        returns = moex.log_returns_with_div(tickers, pd.Timestamp(self._portfolio.date))
+        return returns.reindex(index=self.returns.index).fillna(0)
+
     @property
     def decay(self):
         """Константа сглаживания"""
         return 1 - 1 / self._ml_data.params['data']['ew_lags']
 
-    @property
+    @versioned_property
     def mean(self):
         """Series матожидания доходности"""
         mean = self._ml_data.prediction_mean
@@ -45,12 +48,19 @@ class MLReturnsMetrics(AbstractReturnsMetrics):
         mean[PORTFOLIO] = weighted_mean.sum(axis='index')
         return mean
 
-    @property
-    @lru_cache(maxsize=1)
+    @versioned_property
     def std(self):
         """Series СКО доходности"""
         return super().std * self._ml_data.std
 
+    @versioned_property
+    def cov(self):
+        """Ковариационная матрица доходностей отдельных позиций без портфеля на основе усредненной корреляции"""
+        std = self.std.iloc[:-1]
+        cov = np.outer(std.values, std.values) * self._mean_corr
+        np.fill_diagonal(cov, std.values ** 2)
+        return pd.DataFrame(cov, index=std.index, columns=std.index)
+
     @property
     def _mean_corr(self):
         """Усредненная корреляция между позициями"""
@@ -75,6 +85,46 @@ class MLReturnsMetrics(AbstractReturnsMetrics):
         beta[PORTFOLIO] = 1
         return beta
 
+    def what_if(self, tickers: tuple, weights=0.0):
+        """Метрики для набора кандидатов на изменение портфеля, рассчитанные за один проход
+
+        Метрики рассчитываются по тем же формулам, что и метрики доходности измененного портфеля: ожидаемая доходность
+        кандидатов прогнозируется текущей ML-моделью, СКО - экспоненциально сглаженные СКО с поправкой на СКО прогноза,
+        а бета - на основе усредненной корреляции измененного портфеля. Дисперсия портфеля получается обновлением
+        первого ранга экспоненциально сглаженных моментов. Модель для портфеля с кандидатом заново не обучается
+
+        Parameters
+        ----------
+        tickers
+            Кортеж тикеров кандидатов
+        weights
+            Изменение доли кандидатов - одно значение для всех или по значению для каждого тикера
+
+        Returns
+        -------
+        pd.DataFrame
+            В строках тикеры кандидатов. В столбцах ожидаемая доходность, СКО, бета и градиент кандидата, ожидаемая
+            просадка и СКО в момент наибольшей просадки измененного портфеля и понижающий коэффициент для оборота
+        """
+        tickers = tuple(tickers)
+        returns = self.tickers_returns(tickers).reindex(columns=list(tickers)).values
+        _, var, cov, _, var_p = ewm_last_moments(returns, self.returns[PORTFOLIO].values, self.decay)
+        weights = np.broadcast_to(np.asarray(weights, dtype=float), var.shape)
+        mean = self._ml_data.tickers_prediction_mean(tickers).values
+        std_scale = self._ml_data.std
+        std = var ** 0.5 * std_scale
+        mean_p = self.mean[PORTFOLIO] + weights * mean
+        var_p = (var_p + 2 * weights * cov + weights ** 2 * var) * std_scale ** 2
+        # Взвешенные СКО позиций измененного портфеля - их сумма и сумма квадратов для усредненной корреляции
+        weighted_std = (self.std * self._portfolio.weight).iloc[:-1]
+        weight = self._portfolio.weight.reindex(tickers, fill_value=0).values
+        new_weight = weight + weights
+        sum_std = weighted_std.sum() + weights * std
+        sum_var = (weighted_std ** 2).sum() + (new_weight ** 2 - weight ** 2) * std ** 2
+        mean_corr = (var_p - sum_var) / (sum_std ** 2 - sum_var)
+        beta = std * (mean_corr * (sum_std - new_weight * std) + new_weight * std) / var_p
+        return self._what_if_frame(tickers, mean, std, beta, mean_p, var_p)
+
 
 if __name__ == '__main__':
     import trading
@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from metrics import ewm_moments
+from metrics.ewm_moments import EWMMoments
+
+DECAY = 0.88
+
+
+@pytest.fixture(name='returns')
+def make_returns():
+    rng = np.random.RandomState(11)
+    index = pd.date_range('2010-01-31', periods=120, freq='M')
+    returns = pd.DataFrame(rng.normal(0.01, 0.05, size=(120, 4)), index=index, columns=['A', 'B', 'C', 'D'])
+    returns['CASH'] = 0.0
+    return returns
+
+
+def test_fit(returns):
+    moments = EWMMoments(returns.columns, DECAY).fit(returns.values)
+    ewm = returns.ewm(alpha=1 - DECAY)
+    pd.testing.assert_series_equal(moments.mean, ewm.mean().iloc[-1], check_names=False)
+    pd.testing.assert_series_equal(moments.std, ewm.std().iloc[-1], check_names=False)
+    expected_cov = ewm.cov().loc[returns.index[-1]]
+    pd.testing.assert_frame_equal(moments.cov, expected_cov, check_names=False)
+    assert moments.rows == 120
+
+
+def test_update(returns):
+    full = EWMMoments(returns.columns, DECAY).fit(returns.values)
+    incremental = EWMMoments(returns.columns, DECAY).fit(returns.values[:100])
+    for row in returns.values[100:110]:
+        incremental.update(row)
+    incremental.fit(returns.values[110:])
+    pd.testing.assert_series_equal(incremental.mean, full.mean)
+    pd.testing.assert_frame_equal(incremental.cov, full.cov)
+    assert incremental.rows == full.rows
+
+
+def test_cache_folds_new_rows(returns, monkeypatch):
+    monkeypatch.setattr(ewm_moments, '_CACHE', type(ewm_moments._CACHE)())
+    first = ewm_moments.ewm_moments(returns.iloc[:-1], DECAY)
+    assert ewm_moments.ewm_moments(returns.iloc[:-1], DECAY) is first
+    updates = []
+    monkeypatch.setattr(EWMMoments, 'fit', lambda *args: pytest.fail('Пересчет по всей истории'))
+    original_update = EWMMoments.update
+    monkeypatch.setattr(EWMMoments, 'update', lambda self, row: updates.append(row) or original_update(self, row))
+    second = ewm_moments.ewm_moments(returns, DECAY)
+    assert len(updates) == 1
+    assert first.rows == 119
+    assert second.rows == 120
+    pd.testing.assert_series_equal(second.mean, returns.ewm(alpha=1 - DECAY).mean().iloc[-1], check_names=False)
+
+
+def test_cache_changed_history(returns, monkeypatch):
+    monkeypatch.setattr(ewm_moments, '_CACHE', type(ewm_moments._CACHE)())
+    first = ewm_moments.ewm_moments(returns, DECAY)
+    changed = returns.copy()
+    changed.iloc[0, 0] += 1
+    second = ewm_moments.ewm_moments(changed, DECAY)
+    assert second is not first
+    pd.testing.assert_series_equal(second.mean, changed.ewm(alpha=1 - DECAY).mean().iloc[-1], check_names=False)
+    assert ewm_moments.ewm_moments(returns, 0.9) is not first
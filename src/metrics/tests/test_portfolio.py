@@ -1,7 +1,7 @@
 import pandas as pd
 import pytest
 
-from metrics.portfolio import Portfolio, PORTFOLIO
+from metrics.portfolio import Portfolio, PORTFOLIO, CASH
 
 
 def test_portfolio():
@@ -32,3 +32,20 @@ def test_ticker_with_empty_history():
                      cash=1000.21,
                      positions=dict(GAZP=682, VSMO=145, KUNF=123))
     assert port.price['KUNF'] == 0
+
+
+def test_change_lots():
+    port = Portfolio(date='2018-03-19',
+                     cash=1000.21,
+                     positions=dict(GAZP=682, VSMO=145, TTLK=123))
+    lots = port.lots
+    port.change_lots(dict(VSMO=100), cash=10.0)
+    assert port.version == 1
+    assert port.lots['VSMO'] == 100
+    assert port.lots[CASH] == 10.0
+    assert port.lots['GAZP'] == 682
+    assert lots['VSMO'] == 145
+    with pytest.raises(ValueError) as error:
+        port.change_lots(dict(KUNF=1))
+    assert 'KUNF' in str(error.value)
+    assert port.version == 1
@@ -0,0 +1,101 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from metrics.portfolio import CASH, PORTFOLIO
+from metrics.returns_metrics import AbstractReturnsMetrics
+
+DECAY = 0.87
+CANDIDATES = ('NEW1', 'NEW2', 'NEW3')
+
+
+class FakePortfolio:
+    version = 0
+
+    @staticmethod
+    def tickers_volume_factor(tickers):
+        return pd.Series(0.5, index=tickers)
+
+
+class FakeReturnsMetrics(AbstractReturnsMetrics):
+    def __init__(self, returns, candidates):
+        super().__init__(FakePortfolio())
+        self._returns = returns
+        self._candidates = candidates
+
+    @property
+    def returns(self):
+        return self._returns
+
+    def tickers_returns(self, tickers):
+        return self._candidates[list(tickers)]
+
+    @property
+    def decay(self):
+        return DECAY
+
+
+def returns_data():
+    rng = np.random.RandomState(7)
+    index = pd.date_range('2010-01-31', periods=100, freq='M')
+    tickers = pd.DataFrame(rng.normal(0.01, 0.05, size=(100, 3)), index=index, columns=['AKRN', 'GMKN', 'MTSS'])
+    weight = pd.Series([0.2, 0.3, 0.4], index=tickers.columns)
+    candidates = pd.DataFrame(rng.normal(0.015, 0.08, size=(100, 3)), index=index, columns=list(CANDIDATES))
+    return tickers, weight, candidates
+
+
+@pytest.fixture(name='data')
+def make_data():
+    return returns_data()
+
+
+def portfolio_returns(tickers, weight, extra=None):
+    returns = tickers.copy()
+    portfolio = returns.multiply(weight).sum(axis=1)
+    if extra is not None:
+        returns[extra.name] = extra
+        portfolio = portfolio + extra * weight.get(extra.name, 0)
+    returns[CASH] = 0
+    returns[PORTFOLIO] = portfolio
+    return returns
+
+
+@pytest.mark.parametrize('shift', [0.0, 0.05])
+def test_what_if(data, shift):
+    tickers, weight, candidates = data
+    metrics = FakeReturnsMetrics(portfolio_returns(tickers, weight), candidates)
+    result = metrics.what_if(CANDIDATES, shift)
+    assert list(result.index) == list(CANDIDATES)
+    assert (result['VOLUME_FACTOR'] == 0.5).all()
+    for ticker in CANDIDATES:
+        new_weight = pd.concat([weight, pd.Series({ticker: shift})])
+        expected = FakeReturnsMetrics(portfolio_returns(tickers, new_weight, candidates[ticker]), candidates)
+        assert result.loc[ticker, 'MEAN'] == pytest.approx(expected.mean[ticker])
+        assert result.loc[ticker, 'STD'] == pytest.approx(expected.std[ticker])
+        assert result.loc[ticker, 'BETA'] == pytest.approx(expected.beta[ticker])
+        assert result.loc[ticker, 'GRADIENT'] == pytest.approx(expected.gradient[ticker])
+        assert result.loc[ticker, 'DRAW_DOWN'] == pytest.approx(expected.draw_down[PORTFOLIO])
+        assert result.loc[ticker, 'STD_AT_DRAW_DOWN'] == pytest.approx(expected.std_at_draw_down)
+
+
+def test_what_if_weights(data):
+    tickers, weight, candidates = data
+    metrics = FakeReturnsMetrics(portfolio_returns(tickers, weight), candidates)
+    result = metrics.what_if(CANDIDATES, [0.0, 0.05, 0.1])
+    assert result.loc['NEW1', 'GRADIENT'] == pytest.approx(metrics.what_if(('NEW1',))['GRADIENT'].iloc[0])
+    assert result.loc['NEW3', 'GRADIENT'] == pytest.approx(metrics.what_if(('NEW3',), 0.1)['GRADIENT'].iloc[0])
+
+
+@pytest.mark.parametrize('missing', [False, True])
+def test_moments(data, missing):
+    tickers, weight, candidates = data
+    returns = portfolio_returns(tickers, weight)
+    if missing:
+        returns.iloc[:5, 0] = np.nan
+    metrics = FakeReturnsMetrics(returns, candidates)
+    assert (metrics.moments is None) == missing
+    ewm = returns.ewm(alpha=1 - DECAY)
+    pd.testing.assert_series_equal(metrics.mean, ewm.mean().iloc[-1])
+    pd.testing.assert_series_equal(metrics.std, ewm.std().iloc[-1])
+    ewm_cov = ewm.cov(returns[PORTFOLIO])
+    pd.testing.assert_series_equal(metrics.beta, ewm_cov.multiply(1 / ewm_cov[PORTFOLIO], axis='index').iloc[-1])
@@ -1,4 +1,7 @@
+import numpy as np
+import pandas as pd
 import pytest
+from scipy import optimize, stats
 
 from metrics import portfolio, returns_metrics_base
 from metrics.portfolio import CASH, PORTFOLIO
@@ -86,3 +89,55 @@ def test_time_to_draw_down(returns):
 
 def test_std_at_draw_down(returns):
     assert returns.std_at_draw_down == pytest.approx(0.0814183042618772)
+
+
+class SyntheticReturnsMetrics(returns_metrics_base.BaseReturnsMetrics):
+    def __init__(self, returns):
+        self._synthetic = returns
+        super().__init__(portfolio.Portfolio(date='2018-03-19', cash=1, positions=dict(AKRN=1)))
+
+    @property
+    def returns(self):
+        return self._synthetic
+
+
+def make_synthetic_returns(decay, seed):
+    rng = np.random.RandomState(seed)
+    size = 180
+    std = np.empty(size)
+    var = 0.0025
+    shocks = rng.normal(size=size)
+    for i in range(size):
+        std[i] = var ** 0.5
+        var = decay * var + (1 - decay) * (std[i] * shocks[i]) ** 2 + 0.00001
+    values = 0.01 + std * shocks
+    index = pd.date_range('2003-01-31', periods=size, freq='M')
+    return pd.DataFrame({'AKRN': values, CASH: 0.0, PORTFOLIO: values}, index=index)
+
+
+def legacy_llh(returns, decay, start):
+    ewm = returns.ewm(alpha=1 - decay)
+    x = returns.shift(periods=-1)
+    llh = stats.norm.logpdf(x.iloc[start:-1], ewm.mean().iloc[start:-1], ewm.std().iloc[start:-1])
+    return - llh.sum()
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_ewm_llh(seed):
+    returns = make_synthetic_returns(0.87, seed)[PORTFOLIO]
+    decays = np.array([0.1, 0.5, 0.84, 0.87, 0.9, 0.99])
+    llh = returns_metrics_base.ewm_llh(returns.values, decays, 36)
+    expected = [legacy_llh(returns, decay, 36) for decay in decays]
+    assert llh == pytest.approx(expected)
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_fit(monkeypatch, seed):
+    monkeypatch.setattr(returns_metrics_base, 'BRACKET', (0.0, 1.0))
+    returns = make_synthetic_returns(0.87, seed)
+    metrics = SyntheticReturnsMetrics(returns)
+    start = metrics._llh_start()
+    result = optimize.minimize_scalar(lambda decay: legacy_llh(returns[PORTFOLIO], decay, start),
+                                      bounds=(0.0, 1.0), method='Bounded', options=dict(xatol=1e-9))
+    assert metrics.decay == pytest.approx(result.x, abs=1e-6)
+    assert metrics._llh(metrics.decay) <= result.fun + 1e-9
@@ -4,6 +4,9 @@ import pytest
 
 import metrics
 from metrics import CASH, PORTFOLIO
+from metrics.returns_metrics import AbstractReturnsMetrics
+from metrics.returns_metrics_ml import MLReturnsMetrics
+from metrics.tests.test_returns_metrics import CANDIDATES, DECAY, portfolio_returns, returns_data
 from ml.returns import model
 from ml.returns.manager import ReturnsMLDataManager
 
@@ -88,3 +91,67 @@ def test_str(data, capsys):
     print(data)
     captured = capsys.readouterr()
     assert 'Средняя корреляция - 32.88%' in captured.out
+
+
+# Прогнозы фиктивной ML-модели и СКО ее прогноза
+PREDICTIONS = pd.Series([0.011, 0.008, 0.014, 0.02, -0.005, 0.012], index=['AKRN', 'GMKN', 'MTSS', *CANDIDATES])
+ML_STD = 1.3
+
+
+class FakeModel:
+    std = ML_STD
+    params = dict(data=dict(ew_lags=1 / (1 - DECAY)))
+
+    def __init__(self, positions):
+        self.prediction_mean = PREDICTIONS[list(positions)]
+
+    @staticmethod
+    def tickers_prediction_mean(tickers):
+        return PREDICTIONS[list(tickers)]
+
+
+class FakePortfolio:
+    version = 0
+
+    def __init__(self, weight):
+        self.positions = tuple(weight.index) + (CASH, PORTFOLIO)
+        self.weight = weight.append(pd.Series({CASH: 1 - weight.sum(), PORTFOLIO: 1.0}))
+
+    @staticmethod
+    def tickers_volume_factor(tickers):
+        return pd.Series(0.5, index=tickers)
+
+
+class FakeMLReturnsMetrics(MLReturnsMetrics):
+    def __init__(self, weight, returns, candidates):
+        AbstractReturnsMetrics.__init__(self, FakePortfolio(weight))
+        self._ml_data = FakeModel(weight.index)
+        self._returns = returns
+        self._candidates = candidates
+
+    @property
+    def returns(self):
+        return self._returns
+
+    def tickers_returns(self, tickers):
+        returns = pd.concat([self._returns, self._candidates], axis=1)
+        return returns[list(tickers)]
+
+
+@pytest.mark.parametrize('shift', [0.0, 0.05])
+def test_what_if(shift):
+    tickers, weight, candidates = returns_data()
+    metrics_ = FakeMLReturnsMetrics(weight, portfolio_returns(tickers, weight), candidates)
+    result = metrics_.what_if(CANDIDATES + ('GMKN',), shift)
+    for ticker in CANDIDATES + ('GMKN',):
+        new_weight = weight.copy()
+        new_weight[ticker] = weight.get(ticker, 0) + shift
+        extra = candidates[ticker] if ticker in CANDIDATES else None
+        new_returns = portfolio_returns(tickers, new_weight, extra)
+        expected = FakeMLReturnsMetrics(new_weight, new_returns, candidates)
+        assert result.loc[ticker, 'MEAN'] == pytest.approx(expected.mean[ticker])
+        assert result.loc[ticker, 'STD'] == pytest.approx(expected.std[ticker])
+        assert result.loc[ticker, 'BETA'] == pytest.approx(expected.beta[ticker])
+        assert result.loc[ticker, 'GRADIENT'] == pytest.approx(expected.gradient[ticker])
+        assert result.loc[ticker, 'DRAW_DOWN'] == pytest.approx(expected.draw_down[PORTFOLIO])
+        assert result.loc[ticker, 'STD_AT_DRAW_DOWN'] == pytest.approx(expected.std_at_draw_down)
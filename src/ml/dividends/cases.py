@@ -27,14 +27,59 @@ class DividendsCasesIterator:
         # Дорогая операция - вызывается один раз при создании итератора для ускорения
         self._prices = moex.prices(tickers).fillna(method='ffill', axis='index')
 
-    def __iter__(self):
+    def _dates(self):
+        """Даты кейсов для обучения"""
         date = pd.Timestamp(STATISTICS_START) + pd.DateOffset(years=self._years + 1)
         end_of_period_offset = self._freq.aggregation_func(self._last_date)
         date = end_of_period_offset(date)
         while date <= self._last_date:
-            yield self.cases(date)
+            yield date
             date = end_of_period_offset(date + pd.DateOffset(days=1))
 
+    def __iter__(self):
+        for date in self._dates():
+            yield self.cases(date)
+
+    def _columns(self):
+        """Названия столбцов кейсов"""
+        return [TICKER] + [f'lag - {i}' for i in range(self._years * self._freq.times_in_year, 0, -1)] + ['y']
+
+    def learn_cases(self):
+        """Все обучающие кейсы одной таблицей - совпадает с объединением кейсов по всем датам итератора
+
+        Посленалоговые месячные дивиденды и накопленная инфляция рассчитываются один раз на last_date. Дивиденды в
+        постоянных ценах базового месяца за любой период равны разности накопленных сумм дивидендов, деленных на
+        накопленную инфляцию, умноженной на накопленную инфляцию базового месяца. Поэтому доходности за все периоды
+        всех дат рассчитываются несколькими операциями с массивом даты x периоды x тикеры
+        """
+        dates = pd.DatetimeIndex(list(self._dates()))
+        monthly_dividends = dividends.monthly_dividends(self._tickers, self._last_date) * AFTER_TAX
+        cum_cpi = local.monthly_cpi(self._last_date).cumprod().reindex(monthly_dividends.index).values
+        cum_dividends = np.zeros((len(monthly_dividends) + 1, len(monthly_dividends.columns)))
+        np.cumsum(monthly_dividends.values / cum_cpi[:, np.newaxis], axis=0, out=cum_dividends[1:])
+        times_in_year = self._freq.times_in_year
+        months_in_period = MONTH_IN_YEAR // times_in_year
+        periods = times_in_year * (self._years + 1)
+        last_months = monthly_dividends.index.get_indexer(dates)
+        # Номера окончаний периодов в массиве накопленных сумм с нулевой первой строкой - даты x периоды
+        ends = last_months[:, np.newaxis] + 1 - months_in_period * np.arange(periods - 1, -1, -1)
+        agg_dividends = cum_dividends[ends] - cum_dividends[ends - months_in_period]
+        base_months = last_months - MONTH_IN_YEAR
+        price = self._prices.reindex(index=monthly_dividends.index[base_months], method='ffill')
+        price = price.reindex(columns=monthly_dividends.columns).values
+        yields = agg_dividends * (cum_cpi[base_months, np.newaxis] / price)[:, np.newaxis, :]
+        yields = yields.transpose(0, 2, 1)
+        mask = ~np.isnan(yields).any(axis=2)
+        data = np.concatenate([yields[:, :, :-times_in_year], yields[:, :, -times_in_year:].sum(axis=2, keepdims=True)],
+                              axis=2)
+        # Нумерация кейсов внутри каждой даты, как при объединении отдельных таблиц
+        index = (mask.cumsum(axis=1) - 1)[mask]
+        columns = self._columns()
+        cases = pd.DataFrame(data[mask], index=index, columns=columns[1:])
+        tickers = np.broadcast_to(monthly_dividends.columns.values, mask.shape)
+        cases.insert(0, columns[0], tickers[mask])
+        return cases
+
     def _real_dividends_yields(self, date: pd.Timestamp, labels: bool = True):
         """Возвращает посленалоговые дивидендные доходности в постоянных ценах для заданной даты
 
@@ -78,7 +123,8 @@ class DividendsCasesIterator:
         pre_tax_dividends = dividends.monthly_dividends(self._tickers, date).iloc[-months:, :]
         after_tax_dividends = pre_tax_dividends * AFTER_TAX
         real_after_tax_dividends = after_tax_dividends.mul(cpi_index, axis='index')
-        agg_dividends = real_after_tax_dividends.groupby(by=self._freq.aggregation_func(date)).sum()
+        periods = self._freq.aggregation_index(real_after_tax_dividends.index, date)
+        agg_dividends = real_after_tax_dividends.groupby(by=periods).sum()
         return agg_dividends
 
     def cases(self, date: pd.Timestamp, predicted: bool = True):
@@ -94,13 +140,13 @@ class DividendsCasesIterator:
             cases['y'] = y
         else:
             cases['y'] = np.nan
-        cases.columns = [TICKER] + [f'lag - {i}' for i in range(self._years * self._freq.times_in_year, 0, -1)] + ['y']
+        cases.columns = self._columns()
         return cases
 
 
 def learn_pool_params(tickers, last_date, freq, lags):
     """Параметры для создания catboost.Pool для обучения"""
-    learn_cases = pd.concat(DividendsCasesIterator(tickers, last_date, freq, lags))
+    learn_cases = DividendsCasesIterator(tickers, last_date, freq, lags).learn_cases()
     pool_params = dict(data=learn_cases.iloc[:, :-1],
                        label=learn_cases.iloc[:, -1],
                        cat_features=[0],
@@ -2,11 +2,14 @@ import catboost
 import collections
 import numpy as np
 import pandas as pd
+import pytest
 
 from metrics.dividends_metrics_base import BaseDividendsMetrics
 from metrics.portfolio import Portfolio
+from ml.dividends import cases
 from ml.dividends.cases import DividendsCasesIterator, learn_pool, predict_pool
 from utils.aggregation import Freq
+from web.labels import TICKER
 
 
 def test_iterable():
@@ -149,3 +152,32 @@ def test_monthly_quarterly_yearly():
             q_slice = slice(1 + year * 4, 1 + (year + 1) * 4)
             assert np.allclose(np.array(quarterly_data[i].get_features())[-3:, q_slice].sum(axis=1, keepdims=True),
                                np.array(yearly_data[i].get_features())[-3:, y_slice])
+
+
+@pytest.fixture(name='synthetic_data')
+def make_synthetic_data(monkeypatch):
+    rng = np.random.RandomState(0)
+    tickers = pd.Index(['AKRN', 'MTSS', 'PMSBP'], name=TICKER)
+    months = pd.date_range('2010-02-15', '2018-05-15', freq=pd.DateOffset(months=1))
+    monthly_dividends = pd.DataFrame(rng.uniform(size=(len(months), 3)) * (rng.uniform(size=(len(months), 3)) > 0.7),
+                                     index=months, columns=tickers)
+    cpi_months = pd.date_range('2005-01-15', '2018-05-15', freq=pd.DateOffset(months=1))
+    cpi = pd.Series(rng.uniform(1.0, 1.02, size=len(cpi_months)), index=cpi_months)
+    days = pd.bdate_range('2009-01-01', '2018-05-15')
+    prices = pd.DataFrame(rng.uniform(50, 150, size=(len(days), 3)), index=days, columns=tickers)
+    # Бумага с короткой историей котировок
+    prices.loc[:'2013-03-01', 'PMSBP'] = np.nan
+    monkeypatch.setattr(cases.dividends, 'monthly_dividends', lambda _, date: monthly_dividends.loc[:date])
+    monkeypatch.setattr(cases.local, 'monthly_cpi', lambda date: cpi.loc[:date])
+    monkeypatch.setattr(cases.moex, 'prices', lambda _: prices)
+    return tuple(tickers)
+
+
+@pytest.mark.parametrize('freq', [Freq.monthly, Freq.quarterly, Freq.yearly])
+@pytest.mark.parametrize('years', [2, 5])
+def test_learn_cases(synthetic_data, freq, years):
+    iterator = DividendsCasesIterator(synthetic_data, pd.Timestamp('2018-05-15'), freq, years)
+    expected = pd.concat(iterator)
+    result = iterator.learn_cases()
+    pd.testing.assert_frame_equal(result, expected)
+    assert set(result[TICKER]) == set(synthetic_data)
@@ -1,5 +1,9 @@
 """Кросс-валидация и оптимизация гиперпараметров ML-модели"""
+import collections
+import concurrent.futures
 import functools
+import os
+import time
 
 import catboost
 import hyperopt
@@ -9,6 +13,8 @@ import pandas as pd
 from hyperopt import hp
 from sklearn import model_selection
 
+from ml import trials_store
+
 # Размер графика с кривой обучения
 FIG_SIZE = 8
 
@@ -16,14 +22,25 @@ FIG_SIZE = 8
 MAX_ITERATIONS = 1000
 SEED = 284704
 FOLDS_COUNT = 20
-TECH_PARAMS = dict(iterations=MAX_ITERATIONS,
+TECH_PARAMS = dict(loss_function='RMSE',
+                   iterations=MAX_ITERATIONS,
                    random_state=SEED,
                    od_type='Iter',
                    verbose=False,
                    allow_writing_files=False)
 
+# Количество потоков catboost при кросс-валидации - по умолчанию все ядра процессора
+THREAD_COUNT = os.cpu_count() or 1
+
+# Максимальное количество наборов данных для обучения, хранящихся в кэше
+MAX_CACHED_POOLS = 16
+
 # Настройки hyperopt
 MAX_SEARCHES = 100
+# Количество новых вариантов при наличии сохраненных результатов предыдущих запусков
+WARM_SEARCHES = MAX_SEARCHES // 4
+# Количество процессов, в которых параллельно оцениваются варианты гиперпараметров
+MAX_WORKERS = 4
 
 # Диапазоны поиска ключевых гиперпараметров относительно базового значения параметров
 # Рекомендации Яндекс - https://tech.yandex.com/catboost/doc/dg/concepts/parameter-tuning-docpage/
@@ -111,7 +128,27 @@ def make_model_params(params):
     return model_params
 
 
-def cv_model(params: dict, positions: tuple, date: pd.Timestamp, data_pool_func):
+_POOLS = collections.OrderedDict()
+
+
+def cached_pool(data_pool_func, positions: tuple, date: pd.Timestamp, data_params: dict):
+    """catboost.Pool с данными для обучения с кэшированием по функции, тикерам, дате и параметрам данных
+
+    При поиске гиперпараметров различных вариантов параметров данных значительно меньше, чем оцениваемых вариантов,
+    поэтому данные для большинства вариантов берутся из кэша
+    """
+    key = data_pool_func, tuple(positions), pd.Timestamp(date), tuple(sorted(data_params.items()))
+    if key in _POOLS:
+        _POOLS.move_to_end(key)
+        return _POOLS[key]
+    pool = data_pool_func(positions, date, **data_params)
+    _POOLS[key] = pool
+    if len(_POOLS) > MAX_CACHED_POOLS:
+        _POOLS.popitem(last=False)
+    return pool
+
+
+def cv_model(params: dict, positions: tuple, date: pd.Timestamp, data_pool_func, thread_count: int = THREAD_COUNT):
     """Кросс-валидирует модель по RMSE, нормированному на СКО набора данных
     Осуществляется проверка, что не достигнут максимум итераций, возвращается RMSE, R2 и параметры модели с оптимальным
     количеством итераций в формате целевой функции hyperopt
@@ -125,6 +162,8 @@ def cv_model(params: dict, positions: tuple, date: pd.Timestamp, data_pool_func)
         Дата, для которой необходимо осуществить кросс-валидацию
     data_pool_func
         Функция для получения catboost.Pool с данными
+    thread_count
+        Количество потоков catboost
     Returns
     -------
     dict
@@ -135,14 +174,16 @@ def cv_model(params: dict, positions: tuple, date: pd.Timestamp, data_pool_func)
         ключ 'r2' - 1- нормированная RMSE на кросс-валидации в квадрате,
         ключ 'data' - параметры данных,
         ключ 'model' - параметры модели, в которые добавлено оптимальное количество итераций градиентного бустинга на
-        кросс-валидации и общие настройки
+        кросс-валидации и общие настройки,
+        ключ 'time' - время кросс-валидации в секундах
     """
+    start = time.perf_counter()
     data_params = params['data']
-    data = data_pool_func(positions, date, **data_params)
+    data = cached_pool(data_pool_func, positions, date, data_params)
     pool_std = np.array(data.get_label()).std()
     model_params = make_model_params(params)
     scores = catboost.cv(pool=data,
-                         params=model_params,
+                         params=dict(model_params, thread_count=thread_count),
                          fold_count=FOLDS_COUNT)
     if len(scores) == MAX_ITERATIONS:
         raise ValueError(f'Необходимо увеличить MAX_ITERATIONS = {MAX_ITERATIONS}')
@@ -153,7 +194,8 @@ def cv_model(params: dict, positions: tuple, date: pd.Timestamp, data_pool_func)
                 std=scores.loc[index, 'test-RMSE-mean'],
                 r2=1 - (scores.loc[index, 'test-RMSE-mean'] / pool_std) ** 2,
                 data=data_params,
-                model=model_params)
+                model=model_params,
+                time=time.perf_counter() - start)
 
 
 def learning_curve(params: dict, positions: tuple, date: pd.Timestamp, data_pool_params, fractions: tuple):
@@ -202,9 +244,40 @@ def learning_curve(params: dict, positions: tuple, date: pd.Timestamp, data_pool
     return train_sizes, train_scores_mean, test_scores_mean
 
 
-def optimize_hyper(base_params: dict, positions: tuple, date: pd.Timestamp, data_pool_func, data_space: dict):
+def _insert_prior_trials(trials: hyperopt.Trials, domain: hyperopt.Domain, prior: list):
+    """Добавляет в trials сохраненные результаты оценки вариантов в качестве завершенных испытаний"""
+    if not prior:
+        return
+    tids = trials.new_trial_ids(len(prior))
+    specs, results, miscs = [], [], []
+    for tid, (vals, result) in zip(tids, prior):
+        specs.append(None)
+        results.append(result)
+        miscs.append(dict(tid=tid,
+                          cmd=domain.cmd,
+                          workdir=domain.workdir,
+                          idxs={label: [tid] if values else [] for label, values in vals.items()},
+                          vals=vals))
+    docs = trials.new_trial_docs(tids, specs, results, miscs)
+    for doc in docs:
+        doc['state'] = hyperopt.JOB_STATE_DONE
+    trials.insert_trial_docs(docs)
+    trials.refresh()
+
+
+def optimize_hyper(base_params: dict, positions: tuple, date: pd.Timestamp, data_pool_func, data_space: dict,
+                   max_workers: int = MAX_WORKERS, trials: hyperopt.Trials = None, store_name: str = None):
     """Ищет и  возвращает лучший набор гиперпараметров без количества итераций в окрестности базового набора параметров
 
+    Варианты гиперпараметров предлагаются алгоритмом TPE партиями по max_workers штук и оцениваются параллельно в
+    отдельных процессах, а потоки процессора делятся между процессами поровну. Результаты оценки, включая время
+    кросс-валидации каждого варианта, сохраняются в trials
+
+    Если указано название хранилища, то результаты сохраняются между запусками. Сохраненные результаты для того же
+    пространства поиска используются как начальная история TPE, поэтому новых вариантов оценивается WARM_SEARCHES
+    вместо MAX_SEARCHES. Лучший набор выбирается среди вариантов, оцененных для текущих тикеров и даты, - новых и
+    сохраненных в предыдущих запусках
+
     Parameters
     ----------
     base_params
@@ -217,21 +290,66 @@ def optimize_hyper(base_params: dict, positions: tuple, date: pd.Timestamp, data
         Функция получения данных для тренировки модели
     data_space
         Функция для формирования пространства поиска вариантов данных для модели
+    max_workers
+        Количество процессов - при 1 варианты оцениваются в текущем процессе
+    trials
+        Хранилище результатов оценки вариантов hyperopt - если не указано, то создается новое
+    store_name
+        Название хранилища результатов между запусками - обычно название класса модели. Если не указано, то
+        результаты не сохраняются
     Returns
     -------
     dict
         ключ 'data' - параметры данных,
         ключ 'model' - параметры модели без количества итераций градиентного бустинга
     """
-    objective = functools.partial(cv_model, positions=positions, date=date, data_pool_func=data_pool_func)
     param_space = dict(data=data_space,
                        model=make_model_space(base_params))
-    best = hyperopt.fmin(objective,
-                         space=param_space,
-                         algo=hyperopt.tpe.suggest,
-                         max_evals=MAX_SEARCHES,
-                         rstate=np.random.RandomState(SEED))
-    # Преобразование из внутреннего представление в исходное пространство
-    best_params = hyperopt.space_eval(param_space, best)
+    trials = hyperopt.Trials() if trials is None else trials
+    domain = hyperopt.Domain(cv_model, param_space)
+    store = None
+    searches = MAX_SEARCHES
+    # Результаты и точки пространства поиска для вариантов, оцененных для текущих тикеров и даты
+    current = []
+    if store_name is not None:
+        store = trials_store.TrialsStore(trials_store.space_key(store_name, param_space))
+        prior = store.load()
+        _insert_prior_trials(trials, domain, prior)
+        if prior:
+            searches = WARM_SEARCHES
+        current = [(result['loss'], point) for point, result in store.select(positions, date)]
+    rng = np.random.default_rng(SEED)
+    thread_count = max(1, THREAD_COUNT // max_workers)
+    objective = functools.partial(cv_model,
+                                  positions=positions,
+                                  date=date,
+                                  data_pool_func=data_pool_func,
+                                  thread_count=thread_count)
+    suggested = 0
+    executor = concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) if max_workers > 1 else None
+    try:
+        while suggested < searches:
+            new_ids = trials.new_trial_ids(min(max_workers, searches - suggested))
+            suggested += len(new_ids)
+            trials.refresh()
+            docs = hyperopt.tpe.suggest(new_ids, domain, trials, rng.integers(2 ** 31 - 1))
+            vals = [doc['misc']['vals'] for doc in docs]
+            # Преобразование из внутреннего представление в исходное пространство
+            params = [hyperopt.space_eval(param_space, {key: value[0] for key, value in point.items() if value})
+                      for point in vals]
+            results = executor.map(objective, params) if executor else map(objective, params)
+            for doc, point, result in zip(docs, vals, results):
+                if store:
+                    store.save(positions, date, point, result)
+                doc['state'] = hyperopt.JOB_STATE_DONE
+                doc['result'] = result
+                current.append((result['loss'], point))
+            trials.insert_trial_docs(docs)
+            trials.refresh()
+    finally:
+        if executor:
+            executor.shutdown()
+    _, best_vals = min(current, key=lambda x: x[0])
+    best_params = hyperopt.space_eval(param_space, {key: value[0] for key, value in best_vals.items() if value})
     check_model_bounds(best_params, base_params)
     return best_params
@@ -25,15 +25,44 @@ class MLDataManager(AbstractDataManager):
     is_unique = False
     is_monotonic = False
     update_from_scratch = True
+    # Прогноз для другого набора тикеров, даты или параметров модели не может использоваться до обновления
+    deferred_update = False
+    # Количество месяцев после кросс-валидации, в течение которых при сдвиге даты вперед модель обучается заново с
+    # параметрами и количеством итераций предыдущей кросс-валидации - 0, если кросс-валидация проводится при каждом
+    # обучении
+    cv_months = 0
+    # Окончание названия файла модели - позволяет хранить модели, например, для исторического тестирования отдельно от
+    # рабочих
+    name_suffix = ''
 
     def __init__(self, positions: tuple, date: pd.Timestamp, model_class, file_name: str):
         self._positions = positions
         self._date = date
         self._model_class = model_class
-        super().__init__(None, file_name)
+        super().__init__(None, file_name + self.name_suffix)
 
     def download_all(self):
-        return self._model_class(self._positions, self._date)
+        return self._model_class(self._positions, self._date, self._cv_base())
+
+    def _cv_base(self):
+        """Сохраненная модель, результаты кросс-валидации которой можно использовать для новой даты, или None"""
+        if not self.cv_months or self._data.last_update is None:
+            return None
+        base = self.value
+        if base.positions != self._positions or self._params_changed(base):
+            return None
+        if base.date < self._date <= base.cv_date + pd.DateOffset(months=self.cv_months):
+            return base
+        return None
+
+    def _params_changed(self, model):
+        """Изменились ли параметры ML-модели по сравнению с сохраненной моделью"""
+        model_params = self._model_class.PARAMS
+        for outer_key in model_params:
+            for inner_key in model_params[outer_key]:
+                if model_params[outer_key][inner_key] != model.params[outer_key][inner_key]:
+                    return True
+        return False
 
     def download_update(self):
         super().download_update()
@@ -43,9 +72,6 @@ class MLDataManager(AbstractDataManager):
         """Время следующего планового обновления данных - arrow в часовом поясе MOEX"""
         if self._positions != self.value.positions or self._date != self.value.date:
             return arrow.now().shift(days=-1)
-        model_params = self._model_class.PARAMS
-        for outer_key in model_params:
-            for inner_key in model_params[outer_key]:
-                if model_params[outer_key][inner_key] != self.value.params[outer_key][inner_key]:
-                    return arrow.now().shift(days=-1)
+        if self._params_changed(self.value):
+            return arrow.now().shift(days=-1)
         return super().next_update
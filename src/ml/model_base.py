@@ -17,23 +17,49 @@ class AbstractModel(ABC):
         Кортеж тикеров, для которых необходимо составить прогноз
     date
         Дата, для которой необходимо составить прогноз
+    cv_base
+        Ранее обученная модель, результаты кросс-валидации которой используются вместо новой кросс-валидации.
+        Повторно используются только параметры и количество итераций - итоговая модель всегда обучается с нуля на
+        данных до новой даты
     """
     # Словарь с параметрами ML-модели данных
     PARAMS = None
 
-    def __init__(self, positions: tuple, date: pd.Timestamp):
+    def __init__(self, positions: tuple, date: pd.Timestamp, cv_base=None):
         self._positions = positions
         self._date = date
-        self._cv_result = hyper.cv_model(self.PARAMS, positions, date, self._learn_pool_func)
+        if cv_base is None:
+            self._cv_result = hyper.cv_model(self.PARAMS, positions, date, self._learn_pool_func)
+            self._cv_date = date
+        else:
+            self._cv_result = cv_base._cv_result
+            self._cv_date = cv_base.cv_date
+        self._clf = self._fit()
+        self._feature_importances = pd.Series(self._clf.feature_importances_, self._clf.feature_names_)
+        self._prediction, self._prediction_data = self._predict(positions)
+
+    def _fit(self):
+        """Обучает итоговую модель на данных для позиций с параметрами кросс-валидации"""
         clf = catboost.CatBoostRegressor(**self._cv_result['model'])
-        learn_data = self._learn_pool_func(tickers=positions, last_date=date, **self._cv_result['data'])
+        learn_data = hyper.cached_pool(self._learn_pool_func, self._positions, self._date, self._cv_result['data'])
         clf.fit(learn_data)
-        self._feature_importances = pd.Series(clf.feature_importances_, learn_data.get_feature_names())
-        predict_data = self._predict_pool_func(tickers=positions, last_date=date, **self._cv_result['data'])
-        self._prediction = pd.Series(clf.predict(predict_data), list(self.positions))
-        self._prediction_data = pd.DataFrame(predict_data.get_features(),
-                                             index=list(self.positions),
-                                             columns=predict_data.get_feature_names())
+        return clf
+
+    def _predict(self, tickers: tuple):
+        """Прогноз итоговой модели и данные, на основе которых он сделан, для произвольных тикеров на дату прогноза
+
+        Модели, сохраненные без итоговой модели, обучают ее заново с теми же параметрами
+        """
+        if '_clf' not in self.__dict__:
+            self._clf = self._fit()
+        predict_data = self._predict_pool_func(tickers=tickers, last_date=self._date, **self._cv_result['data'])
+        if predict_data.num_row() != len(tickers):
+            raise ValueError(f'Недостаточно данных для прогноза по тикерам {tickers}')
+        prediction = pd.Series(self._clf.predict(predict_data), list(tickers))
+        prediction_data = pd.DataFrame(predict_data.get_features(),
+                                       index=list(tickers),
+                                       columns=predict_data.get_feature_names())
+        return prediction, prediction_data
 
     def __str__(self):
         prediction = pd.concat([self.prediction_mean, self.prediction_std], axis=1)
@@ -50,10 +76,14 @@ class AbstractModel(ABC):
         """Параметры для создания catboost.Pool для обучения"""
         raise NotImplementedError
 
-    @property
-    def _learn_pool_func(self):
-        """catboost.Pool с данными для обучения"""
-        return lambda *args, **kwargs: catboost.Pool(**self._learn_pool_params(*args, **kwargs))
+    @classmethod
+    def _learn_pool_func(cls, *args, **kwargs):
+        """catboost.Pool с данными для обучения
+
+        Метод класса, а не функция, создаваемая при каждом обращении, чтобы служить ключом кэша данных и передаваться в
+        другие процессы
+        """
+        return catboost.Pool(**cls._learn_pool_params(*args, **kwargs))
 
     @staticmethod
     @abstractmethod
@@ -93,6 +123,14 @@ class AbstractModel(ABC):
         """Дата, для которой составлен прогноз"""
         return self._date
 
+    @property
+    def cv_date(self):
+        """Дата, на которую проводилась кросс-валидация модели
+
+        Для моделей, сохраненных до появления повторного использования кросс-валидации, совпадает с датой прогноза
+        """
+        return self.__dict__.get('_cv_date', self._date)
+
     @property
     def std(self):
         """СКО прогноза"""
@@ -115,7 +153,8 @@ class AbstractModel(ABC):
         date = self._date
         base_cv_results = self._cv_result
         find_params = hyper.optimize_hyper(self.PARAMS, positions, date,
-                                           self._learn_pool_func, self._make_data_space())
+                                           self._learn_pool_func, self._make_data_space(),
+                                           store_name=type(self).__name__)
         self._check_data_space_bounds(find_params)
         best_cv_results = hyper.cv_model(find_params, positions, date, self._learn_pool_func)
         if base_cv_results['loss'] < best_cv_results['loss']:
@@ -33,10 +33,48 @@ class ReturnsCasesIterator:
         self._ew_mean = ewm.mean()
         self._ew_std = ewm.std()
 
+    def _first_case(self):
+        """Номер строки доходностей с первым обучающим кейсом"""
+        return 1 + max(int(self._ew_lags), self._lags)
+
     def __iter__(self):
-        for date in self._returns.index[1 + max(int(self._ew_lags), self._lags):]:
+        for date in self._returns.index[self._first_case():]:
             yield self.cases(date)
 
+    def _columns(self):
+        """Названия столбцов кейсов кроме тикера"""
+        return ['std', 'mean'] + [f'lag - {i}' for i in range(self._lags, 0, -1)] + ['y']
+
+    def learn_cases(self):
+        """Все обучающие кейсы одной таблицей - совпадает с объединением кейсов по всем датам итератора
+
+        Окна доходностей для всех дат формируются скользящим представлением массива доходностей без копирования
+        данных в виде трехмерного массива даты x тикеры x лаги, поэтому память расходуется только на итоговую таблицу
+        """
+        lags = self._lags
+        first = self._first_case()
+        returns = self._returns.values
+        dates = len(returns) - first
+        tickers = returns.shape[1]
+        std = self._ew_std.values[first - 1:-1]
+        row_stride, ticker_stride = returns.strides
+        windows = np.lib.stride_tricks.as_strided(returns[first - lags:],
+                                                  shape=(dates, tickers, lags + 1),
+                                                  strides=(row_stride, ticker_stride, row_stride),
+                                                  writeable=False)
+        data = np.empty((dates, tickers, lags + 3))
+        data[:, :, 0] = std
+        np.divide(self._ew_mean.values[first - 1:-1], std, out=data[:, :, 1])
+        np.divide(windows, std[:, :, np.newaxis], out=data[:, :, 2:])
+        mask = ~np.isnan(data).any(axis=2)
+        # Нумерация кейсов внутри каждой даты, как при объединении отдельных таблиц
+        index = (mask.cumsum(axis=1) - 1)[mask]
+        cases = pd.DataFrame(data[mask], index=index, columns=self._columns())
+        name = self._returns.columns.name
+        cases.insert(0, 'index' if name is None else name,
+                     np.broadcast_to(self._returns.columns.values, (dates, tickers))[mask])
+        return cases
+
     def cases(self, date: pd.Timestamp, labels: bool = True):
         """Кейсы для заданной даты с возможностью отключения меток"""
         lags = self._lags
@@ -61,13 +99,13 @@ class ReturnsCasesIterator:
 
         if not labels:
             cases['y'] = np.nan
-        cases.columns = ['std', 'mean'] + [f'lag - {i}' for i in range(self._lags, 0, -1)] + ['y']
+        cases.columns = self._columns()
         return cases.reset_index()
 
 
 def learn_pool_params(tickers: tuple, last_date: pd.Timestamp, ew_lags: float, returns_lags: int):
     """Параметры для создания catboost.Pool для обучения"""
-    learn_cases = pd.concat(ReturnsCasesIterator(tickers, last_date, ew_lags, returns_lags))
+    learn_cases = ReturnsCasesIterator(tickers, last_date, ew_lags, returns_lags).learn_cases()
     pool_params = dict(data=learn_cases.iloc[:, :-1],
                        label=learn_cases.iloc[:, -1],
                        cat_features=[0],
@@ -81,6 +81,14 @@ class ReturnsModel(AbstractModel):
         """
         return self.std * self._prediction_data['std']
 
+    def tickers_prediction_mean(self, tickers: tuple):
+        """pd.Series с прогнозом доходности для произвольных тикеров, в том числе не входящих в позиции модели
+
+        Используется обученная для позиций модель, поэтому для позиций совпадает с prediction_mean
+        """
+        prediction, prediction_data = self._predict(tickers)
+        return prediction * prediction_data['std']
+
 
 if __name__ == '__main__':
     from trading import POSITIONS, DATE
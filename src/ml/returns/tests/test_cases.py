@@ -4,6 +4,7 @@ import numpy as np
 import pandas as pd
 import pytest
 
+from ml.returns import cases
 from ml.returns.cases import ReturnsCasesIterator, learn_pool, predict_pool
 from web.labels import TICKER
 
@@ -72,3 +73,27 @@ def test_pools():
     assert features[3][4] == pytest.approx(-0.17948931455612183)
     assert features[4][5] == pytest.approx(0.015230 / 0.047723)
     assert predict.get_label() is None
+
+
+@pytest.fixture(name='synthetic_returns')
+def make_synthetic_returns(monkeypatch):
+    rng = np.random.RandomState(0)
+    returns = pd.DataFrame(rng.normal(0.01, 0.1, size=(60, 4)),
+                           index=pd.date_range('2014-01-31', periods=60, freq='M'),
+                           columns=pd.Index(['AKRN', 'GMKN', 'MTSS', 'VSMO'], name=TICKER))
+    # Тикеры с историей разной длины и пропуском
+    returns.iloc[:15, 1] = np.nan
+    returns.iloc[:30, 3] = np.nan
+    returns.iloc[40, 2] = np.nan
+    monkeypatch.setattr(cases.moex, 'log_returns_with_div', lambda *_: returns)
+    return returns
+
+
+@pytest.mark.parametrize('ew_lags, returns_lags', [(9, 3), (10, 4), (3.5, 6)])
+def test_learn_cases(synthetic_returns, ew_lags, returns_lags):
+    iterator = ReturnsCasesIterator(tuple(synthetic_returns.columns), synthetic_returns.index[-1],
+                                    ew_lags, returns_lags)
+    expected = pd.concat(iterator)
+    result = iterator.learn_cases()
+    pd.testing.assert_frame_equal(result, expected)
+    assert not result.isna().any().any()
@@ -1,3 +1,6 @@
+import collections
+
+import catboost
 import hyperopt
 import numpy as np
 import pandas as pd
@@ -162,3 +165,87 @@ def test_learning_curve(monkeypatch):
     assert np.allclose(train_sizes, [16, 26, 33])
     assert np.allclose(train_scores, [0.05153206, 0.05238434, 0.05219597])
     assert np.allclose(test_scores, [0.06292444, 0.05833155, 0.05949058])
+
+
+POOL_CALLS = []
+
+
+def synthetic_pool(tickers, last_date, lags):
+    POOL_CALLS.append((tickers, last_date, lags))
+    rng = np.random.RandomState(lags)
+    data = rng.normal(size=(200, lags + 1))
+    label = data[:, 0] + rng.normal(size=200)
+    return catboost.Pool(data=data, label=label)
+
+
+SYNTHETIC_SPACE = {'data': {'lags': hyper.make_choice_space('lags', range(1, 3))}}
+SYNTHETIC_PARAMS = dict(data=dict(lags=1), model=dict(BASE_PARAMS['model'], depth=2))
+
+
+def test_cached_pool(monkeypatch):
+    monkeypatch.setattr(hyper, '_POOLS', collections.OrderedDict())
+    monkeypatch.setattr(hyper, 'MAX_CACHED_POOLS', 2)
+    POOL_CALLS.clear()
+    date = pd.Timestamp('2018-09-03')
+    pool = hyper.cached_pool(synthetic_pool, ('A', 'B'), date, dict(lags=1))
+    assert hyper.cached_pool(synthetic_pool, ('A', 'B'), date, dict(lags=1)) is pool
+    hyper.cached_pool(synthetic_pool, ('A', 'B'), date, dict(lags=2))
+    hyper.cached_pool(synthetic_pool, ('A', 'C'), date, dict(lags=1))
+    assert len(POOL_CALLS) == 3
+    hyper.cached_pool(synthetic_pool, ('A', 'B'), date, dict(lags=1))
+    assert len(POOL_CALLS) == 4
+
+
+def test_cv_model_synthetic(monkeypatch):
+    monkeypatch.setattr(hyper, 'FOLDS_COUNT', 3)
+    POOL_CALLS.clear()
+    date = pd.Timestamp('2018-09-03')
+    first = hyper.cv_model(SYNTHETIC_PARAMS, ('A',), date, synthetic_pool, thread_count=1)
+    second = hyper.cv_model(SYNTHETIC_PARAMS, ('A',), date, synthetic_pool)
+    assert len(POOL_CALLS) == 1
+    assert first['loss'] == pytest.approx(second['loss'])
+    assert first['time'] > 0
+    assert 'thread_count' not in first['model']
+
+
+@pytest.mark.parametrize('max_workers', [1, 2])
+def test_optimize_hyper_parallel(monkeypatch, max_workers):
+    monkeypatch.setattr(hyper, 'FOLDS_COUNT', 3)
+    monkeypatch.setattr(hyper, 'MAX_SEARCHES', 4)
+    trials = hyperopt.Trials()
+    result = hyper.optimize_hyper(SYNTHETIC_PARAMS, ('A',), pd.Timestamp('2018-09-03'), synthetic_pool,
+                                  SYNTHETIC_SPACE['data'], max_workers=max_workers, trials=trials)
+    assert len(trials) == 4
+    assert all(trial['result']['time'] > 0 for trial in trials.trials)
+    assert result['data']['lags'] in (1, 2)
+    best = min(trials.results, key=lambda x: x['loss'])
+    assert best['data'] == result['data']
+
+
+def test_optimize_hyper_warm_start(monkeypatch, tmp_path):
+    monkeypatch.setattr(hyper, 'FOLDS_COUNT', 3)
+    monkeypatch.setattr(hyper, 'MAX_SEARCHES', 4)
+    monkeypatch.setattr(hyper, 'WARM_SEARCHES', 2)
+    monkeypatch.setattr(hyper.trials_store, 'DATABASE', str(tmp_path / 'hyper.db'))
+    date = pd.Timestamp('2018-09-03')
+    first = hyper.optimize_hyper(SYNTHETIC_PARAMS, ('A',), date, synthetic_pool, SYNTHETIC_SPACE['data'],
+                                 max_workers=1, store_name='Synthetic')
+    calls = []
+    cv_model = hyper.cv_model
+
+    def counted_cv_model(*args, **kwargs):
+        calls.append(args)
+        return cv_model(*args, **kwargs)
+
+    monkeypatch.setattr(hyper, 'cv_model', counted_cv_model)
+    trials = hyperopt.Trials()
+    hyper.optimize_hyper(SYNTHETIC_PARAMS, ('A',), date + pd.Timedelta(days=7), synthetic_pool,
+                         SYNTHETIC_SPACE['data'], max_workers=1, trials=trials, store_name='Synthetic')
+    assert len(trials) == 6
+    assert len(calls) == 2
+    assert first['data']['lags'] in (1, 2)
+    # Варианты, сохраненные для тех же тикеров и даты, участвуют в выборе лучшего наравне с новыми
+    monkeypatch.setattr(hyper, 'cv_model', lambda *args, **kwargs: dict(loss=1e9, status='ok'))
+    second = hyper.optimize_hyper(SYNTHETIC_PARAMS, ('A',), date, synthetic_pool, SYNTHETIC_SPACE['data'],
+                                  max_workers=1, store_name='Synthetic')
+    assert second == first
@@ -0,0 +1,54 @@
+import pandas as pd
+import pytest
+
+import settings
+from ml import manager_ml
+
+ML_NAME = 'fake_ml'
+
+
+class FakeModel:
+    PARAMS = dict(data=dict(lags=1), model=dict(depth=2))
+    cv_count = 0
+
+    def __init__(self, positions, date, cv_base=None):
+        self.positions = positions
+        self.date = date
+        self.params = dict(data=dict(self.PARAMS['data']), model=dict(self.PARAMS['model']))
+        if cv_base is None:
+            type(self).cv_count += 1
+            self.cv_date = date
+        else:
+            self.cv_date = cv_base.cv_date
+
+
+class FakeManager(manager_ml.MLDataManager):
+    def __init__(self, positions, date):
+        super().__init__(positions, date, FakeModel, ML_NAME)
+
+
+@pytest.fixture(autouse=True)
+def clean(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, 'DATA_PATH', tmp_path)
+    monkeypatch.setattr(FakeModel, 'cv_count', 0)
+    FakeManager(('A',), pd.Timestamp('2000-01-01'))
+    yield
+
+
+def test_cv_every_date():
+    positions = ('A', 'B')
+    for date in pd.date_range('2018-01-31', periods=3, freq='M'):
+        assert FakeManager(positions, date).value.cv_date == date
+    assert FakeModel.cv_count == 4
+
+
+def test_reuse_cv(monkeypatch):
+    monkeypatch.setattr(manager_ml.MLDataManager, 'cv_months', 2)
+    positions = ('A', 'B')
+    dates = pd.date_range('2018-01-31', periods=4, freq='M')
+    cv_dates = [FakeManager(positions, date).value.cv_date for date in dates]
+    assert cv_dates == [dates[0], dates[0], dates[0], dates[3]]
+    assert FakeModel.cv_count == 3
+    # Сдвиг даты назад и изменение состава позиций требуют кросс-валидации
+    assert FakeManager(positions, dates[2]).value.cv_date == dates[2]
+    assert FakeManager(('A', 'C'), dates[3]).value.cv_date == dates[3]
@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+from hyperopt import hp
+
+from ml import trials_store
+
+SPACE = dict(data=dict(lags=hp.choice('lags', [1, 2])),
+             model=dict(depth=hp.choice('depth', [2, 3]), learning_rate=hp.uniform('learning_rate', 0.01, 0.1)))
+DATE = pd.Timestamp('2018-09-03')
+
+
+def test_space_key():
+    key = trials_store.space_key('Model', SPACE)
+    assert key.startswith('Model-')
+    assert key == trials_store.space_key('Model', dict(SPACE))
+    assert key != trials_store.space_key('Other', SPACE)
+    other = dict(SPACE, data=dict(lags=hp.choice('lags', [1, 2, 3])))
+    assert key != trials_store.space_key('Model', other)
+
+
+def test_store(tmp_path):
+    store = trials_store.TrialsStore('key', str(tmp_path / 'hyper.db'))
+    assert store.load() == []
+    vals = dict(lags=[np.int64(1)], depth=[0], learning_rate=[np.float64(0.05)])
+    store.save(('A', 'B'), DATE, vals, dict(loss=1.0))
+    store.save(('A', 'B'), DATE, dict(vals, depth=[1]), dict(loss=0.5))
+    store.save(('A', 'C'), DATE, vals, dict(loss=0.1))
+    assert store.select(('A', 'B'), DATE) == [(vals, dict(loss=1.0)), (dict(vals, depth=[1]), dict(loss=0.5))]
+    assert store.select(('A', 'B'), DATE + pd.Timedelta(days=1)) == []
+    prior = store.load()
+    assert [result['loss'] for _, result in prior] == [0.1, 0.5, 1.0]
+    assert prior[2][0] == vals
+    assert len(store.load(1)) == 1
+    assert trials_store.TrialsStore('other', str(tmp_path / 'hyper.db')).load() == []
@@ -0,0 +1,90 @@
+"""Хранение результатов поиска гиперпараметров между запусками"""
+import contextlib
+import hashlib
+import pickle
+import sqlite3
+import time
+from pathlib import Path
+
+import hyperopt
+import pandas as pd
+
+from settings import DATA_PATH
+
+DATABASE = str(DATA_PATH / 'hyper.db')
+TABLE = 'TRIALS'
+# Максимальное количество сохраненных результатов, используемых для начала нового поиска
+MAX_PRIOR_TRIALS = 200
+
+
+def space_key(name: str, space: dict):
+    """Ключ пространства поиска - название модели и хэш текстового представления пространства
+
+    Текстовое представление включает границы интервалов и варианты выбора, поэтому при их изменении сохраненные
+    результаты не используются
+    """
+    description = str(hyperopt.pyll.as_apply(space))
+    return f'{name}-{hashlib.sha1(description.encode()).hexdigest()}'
+
+
+class TrialsStore:
+    """Результаты оценки вариантов гиперпараметров для одного пространства поиска в базе SQLite
+
+    Для каждого варианта хранятся тикеры и дата, для которых он оценивался, точка пространства поиска во внутреннем
+    формате hyperopt и результат кросс-валидации. Все результаты служат начальной историей нового поиска, а результаты
+    для тех же тикеров и даты участвуют в выборе лучшего варианта наравне с новыми
+    """
+
+    def __init__(self, key: str, database: str = None):
+        """
+        Parameters
+        ----------
+        key
+            Ключ пространства поиска
+        database
+            Путь к базе данных - по умолчанию DATABASE
+        """
+        self._key = key
+        self._database = DATABASE if database is None else database
+
+    def _connect(self):
+        """Соединение с базой данных - при необходимости создается таблица"""
+        Path(self._database).parent.mkdir(parents=True, exist_ok=True)
+        connection = sqlite3.connect(self._database)
+        connection.execute(f'CREATE TABLE IF NOT EXISTS {TABLE} '
+                           f'(KEY TEXT, POSITIONS TEXT, DATE TEXT, VALS BLOB, RESULT BLOB, CREATED REAL)')
+        return connection
+
+    def load(self, limit: int = MAX_PRIOR_TRIALS):
+        """Сохраненные результаты - начиная с последних
+
+        Returns
+        -------
+        list
+            Кортежи из точки пространства поиска во внутреннем формате hyperopt и результата кросс-валидации
+        """
+        with contextlib.closing(self._connect()) as connection:
+            rows = connection.execute(f'SELECT VALS, RESULT FROM {TABLE} WHERE KEY = ? '
+                                      f'ORDER BY CREATED DESC LIMIT ?', (self._key, limit)).fetchall()
+        return [(pickle.loads(vals), pickle.loads(result)) for vals, result in rows]
+
+    def select(self, positions: tuple, date: pd.Timestamp):
+        """Сохраненные результаты оценки вариантов для тикеров и даты
+
+        Returns
+        -------
+        list
+            Кортежи из точки пространства поиска во внутреннем формате hyperopt и результата кросс-валидации
+        """
+        with contextlib.closing(self._connect()) as connection:
+            rows = connection.execute(f'SELECT VALS, RESULT FROM {TABLE} WHERE KEY = ? AND POSITIONS = ? AND DATE = ? '
+                                      f'ORDER BY CREATED',
+                                      (self._key, repr(tuple(positions)), str(pd.Timestamp(date)))).fetchall()
+        return [(pickle.loads(vals), pickle.loads(result)) for vals, result in rows]
+
+    def save(self, positions: tuple, date: pd.Timestamp, vals: dict, result: dict):
+        """Сохраняет результат оценки варианта"""
+        with contextlib.closing(self._connect()) as connection, connection:
+            connection.execute(f'INSERT INTO {TABLE} VALUES (?, ?, ?, ?, ?, ?)',
+                               (self._key, repr(tuple(positions)), str(pd.Timestamp(date)),
+                                pickle.dumps(vals), pickle.dumps(result), time.time()))
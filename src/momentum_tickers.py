@@ -1,93 +1,128 @@
 """Поиск бумаг высоким momentum и с низкой корреляцией с текущим портфелем"""
-import random
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
 
 import metrics
-from metrics import CASH, Portfolio
+from metrics import Portfolio
 from web import moex
 from web.labels import REG_NUMBER
 
-# Позиция в строке, в которой отображаются результаты проверки бумаг
-RESULT_ALIMENT = 70
+# Количество процессов для оценки бумаг
+MAX_WORKERS = 4
+# Количество бумаг, оцениваемых в одном задании
+CHUNK_SIZE = 50
+# Столбцы отчета об оценке бумаг
+REPORT_COLUMNS = ['MEAN', 'STD', 'BETA', 'GRADIENT', 'DRAW_DOWN', 'STD_AT_DRAW_DOWN', 'VOLUME_FACTOR', 'T_SCORE']
+# Ошибки загрузки и обработки данных отдельных бумаг, при которых бумага пропускается, а оценка продолжается
+DATA_ERRORS = (ValueError, KeyError, OSError)
+
+LOGGER = logging.getLogger(__name__)
 
 
 def all_securities():
-    """Возвращает данные по всем торгуемым бумагам и печатает их количество"""
+    """Возвращает данные по всем торгуемым бумагам и сообщает их количество"""
     df = moex.securities_info()
-    print()
-    print('Общее количество торгуемых бумаг'.ljust(RESULT_ALIMENT), f'{len(df)}')
+    LOGGER.info(f'Общее количество торгуемых бумаг - {len(df)}')
     return df
 
 
 def all_securities_with_reg_number():
-    """Возвращает множество всех бумаг с регистрационным номером и печатает их количество"""
+    """Возвращает множество всех бумаг с регистрационным номером и сообщает их количество"""
     df = all_securities()
     df.dropna(subset=[REG_NUMBER], inplace=True)
-    print('Количество бумаг с регистрационным номером'.ljust(RESULT_ALIMENT), f'{len(df)}')
+    LOGGER.info(f'Количество бумаг с регистрационным номером - {len(df)}')
     return set(df.index)
 
 
 def non_portfolio_securities(portfolio: Portfolio):
-    """Возвращает список бумаг не находящихся в портфеле и печатает их количество"""
+    """Возвращает список бумаг не находящихся в портфеле и сообщает их количество"""
     tickers = all_securities_with_reg_number()
     tickers = tickers - set(portfolio.positions)
-    print('Количество бумаг не в портфеле'.ljust(RESULT_ALIMENT), f'{len(tickers)}')
+    LOGGER.info(f'Количество бумаг не в портфеле - {len(tickers)}')
     return list(tickers)
 
 
-def make_new_portfolio(portfolio: Portfolio, new_ticker: str):
-    """Создает портфель, в который добавлен новый тикер"""
-    date = portfolio.date
-    cash = portfolio.value[CASH]
-    lots = portfolio.lots
-    positions = {ticker: lots[ticker] for ticker in portfolio.positions[:-2]}
-    positions[new_ticker] = 0
-    return Portfolio(date=date,
-                     cash=cash,
-                     positions=positions)
-
+def _screen_chunk(returns_metrics, tickers: tuple):
+    """Метрики для части кандидатов - при ошибке загрузки данных кандидаты оцениваются по одному
 
-def valid_volume(portfolio: Portfolio, ticker: str):
-    """Распечатывает фактор оборота и проверяет, что он больше нуля"""
+    Кандидаты, данные по которым загрузить не удалось, получают пустые значения метрик, а ошибка записывается в лог
+    """
     try:
-        volume = portfolio.volume_factor[ticker]
-    except ValueError as error:
-        if 'Пустой ответ. Проверьте запрос:' in error.args[0]:
-            volume = 0
-        else:
-            raise
-    print('Фактор оборота'.ljust(RESULT_ALIMENT), f'{volume: .4f} - ', end='')
-    if volume > 0:
-        print('OK')
-        return True
-    else:
-        print('Не подходит')
-        return False
-
-
-def valid_return_gradient(portfolio: Portfolio, ticker: str, t_score: float):
-    """Проверяет, что градиент доходности больше t_score СКО в момент просадки с поправкой на оборот"""
-    returns_metrics = metrics.ReturnsMetrics(portfolio)
-    std = returns_metrics.std_at_draw_down
-    gradient = returns_metrics.gradient[ticker]
-    volume = portfolio.volume_factor[ticker]
-    ticker_t_score = gradient / std * volume
-    print('Градиент просадки'.ljust(RESULT_ALIMENT), f'{gradient: .4f} - ', end='')
-    if ticker_t_score > t_score:
-        print(f'OK {ticker_t_score:.2f} > {t_score:.2f} СКО')
-        return True
+        return returns_metrics.what_if(tickers)
+    except DATA_ERRORS as error:
+        if len(tickers) == 1:
+            LOGGER.warning(f'Не удалось оценить {tickers[0]}: {error!r}')
+            return pd.DataFrame(index=pd.Index(tickers))
+        return pd.concat([_screen_chunk(returns_metrics, (ticker,)) for ticker in tickers], sort=False)
+
+
+# Метрики доходности портфеля в процессе оценки - передаются один раз при запуске процесса
+_RETURNS_METRICS = None
+
+
+def _init_worker(returns_metrics):
+    """Сохраняет метрики доходности портфеля в процессе оценки"""
+    global _RETURNS_METRICS
+    _RETURNS_METRICS = returns_metrics
+
+
+def _screen_worker_chunk(tickers: tuple):
+    """Метрики для части кандидатов в процессе оценки"""
+    return _screen_chunk(_RETURNS_METRICS, tickers)
+
+
+def screen_tickers(returns_metrics, tickers: tuple, max_workers: int = MAX_WORKERS):
+    """Оценивает кандидатов на включение в портфель параллельно в нескольких процессах
+
+    Кандидаты разбиваются на части по CHUNK_SIZE тикеров, каждая из которых оценивается в отдельном процессе с помощью
+    what_if метрик доходности портфеля с нулевой долей кандидатов. Метрики доходности портфеля рассчитываются один раз и
+    передаются в каждый процесс только при его запуске
+
+    Parameters
+    ----------
+    returns_metrics
+        Метрики доходности текущего портфеля
+    tickers
+        Кортеж тикеров кандидатов
+    max_workers
+        Количество процессов - при значении 1 расчет ведется в текущем процессе
+
+    Returns
+    -------
+    pd.DataFrame
+        Метрики кандидатов, упорядоченные по убыванию градиента просадки с поправкой на оборот - T_SCORE
+    """
+    start = time.perf_counter()
+    chunks = [tickers[i:i + CHUNK_SIZE] for i in range(0, len(tickers), CHUNK_SIZE)]
+    frames = []
+    if max_workers == 1 or len(chunks) <= 1:
+        for chunk in chunks:
+            frames.append(_screen_chunk(returns_metrics, chunk))
+            LOGGER.info(f'Оценено {sum(len(frame) for frame in frames)} из {len(tickers)} бумаг')
     else:
-        print(f'Не подходит {ticker_t_score:.2f} < {t_score:.2f} СКО')
-        return False
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                 initargs=(returns_metrics,)) as executor:
+            for frame in executor.map(_screen_worker_chunk, chunks):
+                frames.append(frame)
+                LOGGER.info(f'Оценено {sum(len(frame) for frame in frames)} из {len(tickers)} бумаг')
+    df = pd.concat(frames, sort=False).reindex(columns=REPORT_COLUMNS[:-1])
+    df['T_SCORE'] = df['GRADIENT'] / df['STD_AT_DRAW_DOWN'] * df['VOLUME_FACTOR']
+    df.sort_values('T_SCORE', ascending=False, inplace=True)
+    LOGGER.info(f'Оценка {len(tickers)} бумаг заняла {time.perf_counter() - start:.1f} с')
+    return df
 
 
-def find_momentum_tickers(portfolio: Portfolio, t_score: float):
-    """Ищет торгуемый тикер, градиент роста просадки которого больше t_score СКО
+def find_momentum_tickers(portfolio: Portfolio, t_score: float, max_workers: int = MAX_WORKERS):
+    """Оценивает все торгуемые тикеры, не входящие в портфель, по градиенту роста просадки
 
-    Такая бумага имеет хороший momentum и низкую корреляцию с портфелем, и является неплохим претендентом на включение в
-    портфель. Отсеиваются бумаги, которые имеют слишком маленький оборот
+    Бумаги с градиентом больше t_score СКО имеют хороший momentum и низкую корреляцию с портфелем, и являются неплохими
+    претендентами на включение в портфель. Отсеиваются бумаги, которые имеют слишком маленький оборот
 
-    Поиск ведется в случайном порядке по всему перечню торгуемых бумага. Распечатывается информация об анализируемых
-    бумагах. Процесс останавливается после нахождения первой подходящей
+    Оценка ведется метриками доходности из настроек, поэтому градиент совпадает с градиентом, который получит
+    оптимизатор для портфеля с нулевым количеством лотов бумаги. Для ML-метрик модель при этом заново не обучается
 
     Parameters
     ----------
@@ -95,21 +130,27 @@ def find_momentum_tickers(portfolio: Portfolio, t_score: float):
         Портфель, в который потенциально может быть включена еще одна бумага
     t_score
         Требование по минимальной величине градиента просадки
+    max_workers
+        Количество процессов для оценки бумаг
+
+    Returns
+    -------
+    pd.DataFrame
+        Отчет по всем бумагам в порядке убывания градиента просадки с поправкой на оборот. Столбец VALID содержит
+        признак соответствия бумаги требованиям
     """
-    tickers = non_portfolio_securities(portfolio)
-    random.shuffle(tickers)
-    for number, ticker in enumerate(tickers):
-        print(f'\n{number + 1}. {ticker}')
-        new_portfolio = make_new_portfolio(portfolio, ticker)
-        if not valid_volume(new_portfolio, ticker):
-            continue
-        if valid_return_gradient(new_portfolio, ticker, t_score):
-            break
+    tickers = tuple(sorted(non_portfolio_securities(portfolio)))
+    df = screen_tickers(metrics.ReturnsMetrics(portfolio), tickers, max_workers)
+    df['VALID'] = (df['VOLUME_FACTOR'] > 0) & (df['T_SCORE'] > t_score)
+    LOGGER.info(f'Количество подходящих бумаг с градиентом больше {t_score:.2f} СКО - {df["VALID"].sum()}')
+    return df
 
 
 if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
     port = Portfolio(date='2018-03-19',
                      cash=1000.21,
                      positions=dict(GAZP=682, VSMO=145, TTLK=123),
                      value=3_699_111.41)
     print(port.volume_factor)
+    print(find_momentum_tickers(port, 1.73))
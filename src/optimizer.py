@@ -1,14 +1,115 @@
 """Класс проводит оптимизацию по Парето на основе метрик доходности и дивидендов"""
-from functools import lru_cache
-
+import numpy as np
 import pandas as pd
 
+import frontier
 import metrics
+import rebalancing
 from metrics import Portfolio, CASH, PORTFOLIO
 from settings import T_SCORE, MAX_TRADE
+from utils.versioned_cache import versioned_property
+
+# Максимальное количество шагов при поиске полного списка сделок
+MAX_STEPS = 100
+
+
+def growth_matrix(gradient: pd.Series, other_gradient: pd.Series, volume_factor: pd.Series, weight: pd.Series):
+    """Матрица увеличения градиента при замене бумаги в строке на бумагу в столбце
+
+    Рассчитывается одной операцией над массивами: прирост градиента умножается на понижающий коэффициент бумаги в
+    столбце. Замены, не увеличивающие второй градиент, и продажи бумаг с нулевым весом имеют нулевой прирост
+
+    Parameters
+    ----------
+    gradient
+        Градиент оптимизируемой метрики
+    other_gradient
+        Градиент метрики, которая не должна уменьшаться при замене
+    volume_factor
+        Понижающий коэффициент для низколиквидных акций
+    weight
+        Веса позиций в портфеле
+
+    Returns
+    -------
+    pd.DataFrame
+        Квадратная матрица прироста градиента с индексом и столбцами, совпадающими с индексом градиента
+    """
+    index = gradient.index
+    values = gradient.values.astype(float)
+    other_values = other_gradient.reindex(index).values
+    growth = (values[np.newaxis, :] - values[:, np.newaxis]) * volume_factor.reindex(index).values[np.newaxis, :]
+    growth[weight.reindex(index).values == 0] = 0
+    growth *= other_values[np.newaxis, :] > other_values[:, np.newaxis]
+    growth[growth <= 0] = 0
+    return pd.DataFrame(growth, index=index, columns=index)
+
+
+def max_growth(matrix: pd.DataFrame):
+    """Для каждой строки матрицы прироста максимальный прирост - портфель и кэш в последних столбцах не учитываются"""
+    return matrix.iloc[:, :-2].max(axis='columns')
+
+
+def dominating(matrix: pd.DataFrame):
+    """Для каждой строки матрицы прироста бумага с максимальным приростом или пустая строка при его отсутствии
+
+    Портфель и кэш в последних строках и столбцах не доминируют и не доминируются
+    """
+    values = np.nan_to_num(matrix.values[:, :-2], nan=-np.inf)
+    best = matrix.columns[:-2].values[values.argmax(axis=1)].astype(object)
+    best[~(values.max(axis=1) > 0)] = ''
+    best[-2:] = ''
+    return pd.Series(best, index=matrix.index)
+
+
+class PortfolioMoments:
+    """Ключевые метрики портфеля как функции весов позиций
+
+    Статистики отдельных позиций - ожидаемые дивиденды и их СКО, ожидаемые доходности и их ковариационная матрица -
+    берутся из рассчитанных метрик и не меняются, а метрики портфеля, беты и градиенты пересчитываются для новых весов
+    по тем же формулам, что и в метриках дивидендов и доходности. Это позволяет оценивать последовательность сделок без
+    загрузки данных и пересчета метрик после каждой из них
+    """
 
-# На сколько сделок разбивается операция по покупке/продаже акций
-TRADES = 5
+    def __init__(self, portfolio: Portfolio, dividends_metrics, returns_metrics):
+        self._index = pd.Index(portfolio.positions)
+        self._dividends_mean = dividends_metrics.mean.reindex(self._index[:-1]).values
+        self._dividends_var = dividends_metrics.std.reindex(self._index[:-1]).values ** 2
+        self._returns_mean = returns_metrics.mean.reindex(self._index[:-1]).values
+        self._returns_cov = returns_metrics.cov.reindex(index=self._index[:-1], columns=self._index[:-1]).values
+
+    def _series(self, positions, portfolio):
+        """Series по всем позициям, включая значение для портфеля"""
+        return pd.Series(np.append(positions, portfolio), index=self._index)
+
+    def dividends_std(self, weight: pd.Series):
+        """СКО дивидендной доходности портфеля"""
+        weight = weight.reindex(self._index[:-1]).values
+        return (weight ** 2 @ self._dividends_var) ** 0.5
+
+    def dividends_gradient(self, weight: pd.Series):
+        """Производная нижней границы дивидендной доходности по доле позиций в портфеле"""
+        weight = weight.reindex(self._index[:-1]).values
+        mean = weight @ self._dividends_mean
+        std = (weight ** 2 @ self._dividends_var) ** 0.5
+        beta = weight * self._dividends_var / std ** 2
+        gradient = (self._dividends_mean - mean) - T_SCORE * std * (beta - 1)
+        return self._series(gradient, 0.0)
+
+    def std_at_draw_down(self, weight: pd.Series):
+        """СКО стоимости портфеля в момент наибольшей просадки"""
+        weight = weight.reindex(self._index[:-1]).values
+        return (T_SCORE / 2) * (weight @ self._returns_cov @ weight) / (weight @ self._returns_mean)
+
+    def returns_gradient(self, weight: pd.Series):
+        """Производная нижней границы портфеля по доле позиций в портфеле"""
+        weight = weight.reindex(self._index[:-1]).values
+        mean = weight @ self._returns_mean
+        cov = self._returns_cov @ weight
+        var = weight @ cov
+        beta = cov / var
+        gradient = (T_SCORE / 2) ** 2 * (var / mean ** 2) * (self._returns_mean - mean - 2 * mean * (beta - 1))
+        return self._series(gradient, 0.0)
 
 
 class Optimizer:
@@ -21,6 +122,8 @@ class Optimizer:
     Дополнительно производится оценка возможности значимо увеличить (на T_SCORE СКО) -  используется не точный расчет, а
     линейное приближение. Производится выбор, где можно достичь большего увеличения - по величине просадки или
     минимальным дивидендам
+
+    Результаты расчетов кэшируются до изменения количества лотов в портфеле
     """
 
     def __init__(self, portfolio: Portfolio):
@@ -67,10 +170,10 @@ class Optimizer:
         Предпочтение отдается перемене позиций максимально увеличивающих метрику по которой наибольший резерв увеличения
 
         Лучшая позиция на продажу сокращается до нуля, но не более чем на MAX_TRADE от объема портфеля
-        Продажа бьется на 5 сделок минимум по 1 лоту
-
         Лучшая покупка осуществляется на объем доступного кэша, но не более чем на MAX_TRADE от объема портфеля
-        Покупка бьется на 5 сделок минимум по 1 лоту
+
+        Целевые веса переводятся в целое количество лотов с учетом влияния округления на кэш - меняются только лоты
+        продаваемой и покупаемой позиций, а каждая операция бьется на rebalancing.TRADES сделок минимум по 1 лоту
         """
         portfolio = self.portfolio
         if self.t_dividends_growth > self.t_drawdown_growth:
@@ -79,17 +182,16 @@ class Optimizer:
             growth = self.drawdown_gradient_growth
         # Отбрасывается портфель и кэш из рекомендаций
         best_sell = growth.iloc[:-2].idxmax()
-        sell_weight = max(0, min(portfolio.weight[best_sell], MAX_TRADE - portfolio.weight[CASH]))
-        sell_value = sell_weight * portfolio.value[PORTFOLIO]
-        sell_lot_value = portfolio.lot_size[best_sell] * portfolio.price[best_sell]
-        sell_5_lots = max(1, int(sell_value / sell_lot_value / TRADES + 0.5))
         best_buy = self.dominated[best_sell]
-        buy_value = min(portfolio.value[CASH], MAX_TRADE * portfolio.value[PORTFOLIO])
-        buy_lot_value = portfolio.lot_size[best_buy] * portfolio.price[best_buy]
-        buy_5_lots = max(1, int(buy_value / buy_lot_value / TRADES))
+        weight = portfolio.weight.iloc[:-2]
+        weight[best_sell] -= max(0, min(weight[best_sell], MAX_TRADE - portfolio.weight[CASH]))
+        weight[best_buy] += min(portfolio.weight[CASH], MAX_TRADE)
+        plan = rebalancing.lot_plan(portfolio, weight, tradable=(best_sell, best_buy))
+        sell_lots = int(portfolio.lots[best_sell] - plan[best_sell])
+        buy_lots = int(plan[best_buy] - portfolio.lots[best_buy])
         return (f'РЕКОМЕНДУЕТСЯ'
-                f'\nПродать {best_sell} - {TRADES} сделок по {sell_5_lots} лотов'
-                f'\nКупить {best_buy} - {TRADES} сделок по {buy_5_lots} лотов')
+                f'\nПродать {best_sell} - {rebalancing.str_tranches(sell_lots)}'
+                f'\nКупить {best_buy} - {rebalancing.str_tranches(buy_lots)}')
 
     def _str_pareto_metrics(self):
         """Сводная информация об оптимальности по Парето"""
@@ -105,6 +207,11 @@ class Optimizer:
         pareto_metrics.sort_values('D_GRADIENT', ascending=False, inplace=True)
         return pareto_metrics
 
+    @property
+    def version(self):
+        """Версия оптимизатора совпадает с версией портфеля"""
+        return self._portfolio.version
+
     @property
     def portfolio(self):
         """Оптимизируемый портфель"""
@@ -120,39 +227,31 @@ class Optimizer:
         """Метрики доходности, оптимизируемого портфеля"""
         return self._returns_metrics
 
-    @lru_cache(maxsize=1)
+    @versioned_property
     def _dividends_growth_matrix(self):
         """Матрица увеличения градиента дивидендов при замене бумаги в строке на бумагу в столбце
 
         Бумаги с нулевым весом не могут быть проданы, поэтому прирост градиента 0
         Продажи не ведущие к увеличению градиента доходности так же не рассматриваются
         """
-        dividends_gradient = self.dividends_metrics.gradient
-        volume_factor = self.portfolio.volume_factor
-        dividends_growth = dividends_gradient.apply(func=lambda x: (dividends_gradient - x) * volume_factor)
-        dividends_growth.loc[self.portfolio.weight == 0] = 0
-        returns_gradient = self.returns_metrics.gradient
-        dividends_growth = dividends_growth * returns_gradient.apply(func=lambda x: returns_gradient > x)
-        dividends_growth[dividends_growth <= 0] = 0
-        return dividends_growth
-
-    @lru_cache(maxsize=1)
+        return growth_matrix(self.dividends_metrics.gradient,
+                             self.returns_metrics.gradient,
+                             self.portfolio.volume_factor,
+                             self.portfolio.weight)
+
+    @versioned_property
     def _drawdown_growth_matrix(self):
         """Матрица увеличения градиента просадки при замене бумаги в строке на бумагу в столбце
 
         Бумаги с нулевым весом не могут быть проданы, поэтому прирост градиента 0
-        Продажи не ведущие к увеличению градиента доходности так же не рассматриваются
+        Продажи не ведущие к увеличению градиента дивидендов так же не рассматриваются
         """
-        drawdown_gradient = self.returns_metrics.gradient
-        volume_factor = self.portfolio.volume_factor
-        drawdown_growth = drawdown_gradient.apply(func=lambda x: (drawdown_gradient - x) * volume_factor)
-        drawdown_growth.loc[self.portfolio.weight == 0] = 0
-        dividends_gradient = self.dividends_metrics.gradient
-        drawdown_growth = drawdown_growth * dividends_gradient.apply(func=lambda x: dividends_gradient > x)
-        drawdown_growth[drawdown_growth <= 0] = 0
-        return drawdown_growth
+        return growth_matrix(self.returns_metrics.gradient,
+                             self.dividends_metrics.gradient,
+                             self.portfolio.volume_factor,
+                             self.portfolio.weight)
 
-    @property
+    @versioned_property
     def dividends_gradient_growth(self):
         """Для каждой позиции выдает прирост градиента дивидендов при покупке доминирующей
 
@@ -160,10 +259,9 @@ class Optimizer:
         Учитывается понижающий коэффициент для низколиквидных доминирующих акций
         Портфель и кэш не могут доминировать
         """
-        matrix = self._dividends_growth_matrix().iloc[:, :-2]
-        return matrix.apply(func=lambda x: x.max(), axis='columns')
+        return max_growth(self._dividends_growth_matrix)
 
-    @property
+    @versioned_property
     def drawdown_gradient_growth(self):
         """Для каждой позиции выдает прирост градиента просадки при покупке доминирующей
 
@@ -171,10 +269,9 @@ class Optimizer:
         Учитывается понижающий коэффициент для низколиквидных доминирующих акций
         Портфель и кэш не могут доминировать
         """
-        matrix = self._drawdown_growth_matrix().iloc[:, :-2]
-        return matrix.apply(func=lambda x: x.max(), axis='columns')
+        return max_growth(self._drawdown_growth_matrix)
 
-    @property
+    @versioned_property
     def t_dividends_growth(self):
         """Приблизительная оценка потенциального улучшения минимальных дивидендов
 
@@ -185,7 +282,7 @@ class Optimizer:
         weighted_growth = (self.portfolio.weight * self.dividends_gradient_growth)[:-2].sum()
         return weighted_growth / self.dividends_metrics.std[PORTFOLIO]
 
-    @property
+    @versioned_property
     def t_drawdown_growth(self):
         """Приблизительная оценка потенциального улучшения просадки
 
@@ -196,7 +293,68 @@ class Optimizer:
         weighted_growth = (self.portfolio.weight * self.drawdown_gradient_growth)[:-2].sum()
         return weighted_growth / self.returns_metrics.std_at_draw_down
 
-    @property
+    def trades(self, max_steps: int = MAX_STEPS):
+        """Полный список сделок, последовательно улучшающих портфель
+
+        На каждом шаге, как и в рекомендации по одной сделке, выбирается метрика с наибольшим резервом увеличения,
+        позиция, продажа которой дает наибольший прирост градиента, и доминирующая ее позиция. Продается объем,
+        необходимый для наличия MAX_TRADE от объема портфеля в кэше, а покупка осуществляется на доступный кэш, но не
+        более чем на MAX_TRADE. Целевые веса пары переводятся в лоты с помощью rebalancing.lot_plan. Метрики после сделки пересчитываются с помощью PortfolioMoments без загрузки данных.
+        Шаги повторяются, пока оценки потенциального улучшения не станут меньше T_SCORE, отсутствуют доминирующие позиции
+        или количество шагов не достигнет max_steps
+
+        Returns
+        -------
+        pd.DataFrame
+            Сделки в порядке выполнения - продаваемая и покупаемая позиции, количество лотов и оценки потенциального
+            улучшения дивидендов и просадки перед сделкой
+        """
+        portfolio = self.portfolio
+        moments = PortfolioMoments(portfolio, self.dividends_metrics, self.returns_metrics)
+        volume_factor = portfolio.volume_factor
+        portfolio_value = portfolio.value[PORTFOLIO]
+        lot_value = portfolio.lot_size * portfolio.price
+        lot_value[PORTFOLIO] = portfolio_value
+        lots = portfolio.lots.astype(float)
+        rows = []
+        for _ in range(max_steps):
+            weight = lots * lot_value / portfolio_value
+            dividends_gradient = moments.dividends_gradient(weight)
+            returns_gradient = moments.returns_gradient(weight)
+            dividends_matrix = growth_matrix(dividends_gradient, returns_gradient, volume_factor, weight)
+            drawdown_matrix = growth_matrix(returns_gradient, dividends_gradient, volume_factor, weight)
+            t_dividends = (weight * max_growth(dividends_matrix))[:-2].sum() / moments.dividends_std(weight)
+            t_drawdown = (weight * max_growth(drawdown_matrix))[:-2].sum() / moments.std_at_draw_down(weight)
+            if max(t_dividends, t_drawdown) <= T_SCORE:
+                break
+            matrix = dividends_matrix if t_dividends > t_drawdown else drawdown_matrix
+            best_sell = max_growth(matrix).iloc[:-2].idxmax()
+            best_buy = dominating(matrix)[best_sell]
+            if best_buy == '':
+                break
+            sell_weight = max(0, min(weight[best_sell], MAX_TRADE - weight[CASH]))
+            target = weight.copy()
+            target[best_sell] -= sell_weight
+            target[best_buy] += min(weight[CASH] + sell_weight, MAX_TRADE)
+            plan = rebalancing.lot_plan(portfolio, target, tradable=(best_sell, best_buy), lots=lots)
+            sell_lots = int(lots[best_sell] - plan[best_sell])
+            buy_lots = int(plan[best_buy] - lots[best_buy])
+            if buy_lots <= 0 or sell_lots < 0:
+                break
+            lots[best_sell] = plan[best_sell]
+            lots[best_buy] = plan[best_buy]
+            lots[CASH] = plan[CASH]
+            rows.append([best_sell, sell_lots, best_buy, buy_lots, t_dividends, t_drawdown])
+        return pd.DataFrame(rows, columns=['SELL', 'SELL_LOTS', 'BUY', 'BUY_LOTS', 'T_DIVIDENDS', 'T_DRAWDOWN'])
+
+    def frontier(self, points: int = frontier.POINTS, max_trade: float = None):
+        """Граница Парето между нижней границей дивидендов и просадкой с оптимальными весами позиций
+
+        Изменение веса каждой позиции может быть ограничено max_trade, например, MAX_TRADE
+        """
+        return frontier.Frontier(self.portfolio, self.dividends_metrics, self.returns_metrics, points, max_trade)
+
+    @versioned_property
     def dominated(self):
         """Для каждой позиции выдает доминирующую ее по Парето
 
@@ -204,19 +362,16 @@ class Optimizer:
         резерв увеличения. Портфель и кэш не доминируются
         """
         if self.t_dividends_growth > self.t_drawdown_growth:
-            matrix = self._dividends_growth_matrix().iloc[:, :-2]
+            matrix = self._dividends_growth_matrix
         else:
-            matrix = self._drawdown_growth_matrix().iloc[:, :-2]
-        df = matrix.apply(func=lambda x: x.idxmax() if x.max() > 0 else "",
-                          axis='columns')
-        df[-2:] = ""
-        return df
+            matrix = self._drawdown_growth_matrix
+        return dominating(matrix)
 
     @property
     def cash_out(self):
         """Рекомендация по выводу средств
 
-        Доминируемая акция с минимальной дивидендной доходностью
+        Доминируемая акция с минимальной дивидендной доходностью. Количество лотов остальных позиций не меняется
         """
         frames = [self.dividends_metrics.gradient,
                   self.dominated,
@@ -229,10 +384,12 @@ class Optimizer:
         weight = min(df.iloc[-1, 2], MAX_TRADE - portfolio.weight[CASH])
         if weight < 0:
             return 'Средств достаточно для вывода'
-        sell_value = portfolio.value[PORTFOLIO] * weight
-        one_lot_value = portfolio.lot_size[ticker] * portfolio.price[ticker]
-        amount = int(sell_value / TRADES / one_lot_value) + 1
-        return f'Для вывода средств продать {ticker} - {TRADES} сделок по {amount} лотов'
+        target = portfolio.weight.iloc[:-2]
+        target[ticker] -= weight
+        min_cash = (portfolio.weight[CASH] + weight) * portfolio.value[PORTFOLIO]
+        plan = rebalancing.lot_plan(portfolio, target, min_cash, tradable=(ticker,))
+        lots = int(portfolio.lots[ticker] - plan[ticker])
+        return f'Для вывода средств продать {ticker} - {rebalancing.str_tranches(lots)}'
 
 
 if __name__ == '__main__':
@@ -246,6 +403,8 @@ if __name__ == '__main__':
                      positions=POSITIONS)
     optimizer = Optimizer(port)
     print(optimizer)
+    print(optimizer.trades())
+    print(optimizer.frontier().metrics)
     dfs = [optimizer.dividends_metrics.gradient,
            optimizer.returns_metrics.gradient,
            optimizer.portfolio.weight,
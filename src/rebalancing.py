@@ -0,0 +1,143 @@
+"""Перевод целевых весов портфеля в целое количество лотов и план сделок"""
+import numpy as np
+import pandas as pd
+
+from metrics import Portfolio, CASH, PORTFOLIO
+from metrics.portfolio import LOTS
+
+# На сколько сделок разбивается операция по покупке/продаже акций
+TRADES = 5
+# Относительная точность расчетов, чтобы текущее количество лотов не уменьшалось из-за ошибок округления
+TOLERANCE = 1e-9
+# Названия столбцов плана сделок
+TRANCHE = 'TRANCHE'
+TICKER = 'TICKER'
+VALUE = 'VALUE'
+
+
+def lot_plan(portfolio: Portfolio, weight: pd.Series, min_cash: float = 0.0, tradable: tuple = None,
+             lots: pd.Series = None):
+    """Целое количество лотов, наиболее близкое к целевым весам позиций
+
+    Минимизируется сумма квадратов отклонений стоимости позиций и кэша от целевых значений при условии, что после
+    сделок в кэше остается не меньше min_cash. Начальное решение - округление вниз количества лотов для каждой позиции,
+    при котором вся неточность округления попадает в кэш. Если кэша меньше min_cash, то продаются лоты с наименьшим
+    увеличением ошибки. Далее жадно покупается или продается по одному лоту с наибольшим уменьшением ошибки, пока это
+    возможно, поэтому учитывается влияние округления каждой позиции на остальные через кэш. Каждый шаг - одна векторная
+    операция, а после округления вниз каждая позиция обычно меняется не более чем на пару лотов, поэтому расчет быстр и
+    для сотен позиций
+
+    Если задан перечень тикеров для торговли, то количество лотов остальных тикеров не меняется, а вся неточность
+    округления торгуемых позиций попадает в кэш
+
+    Parameters
+    ----------
+    portfolio
+        Текущий портфель, из которого берутся размеры лотов, цены и стоимость
+    weight
+        Целевые веса тикеров - отсутствующие тикеры имеют нулевой вес, а целевой вес кэша дополняет сумму до 1
+    min_cash
+        Минимальное количество денежных средств после сделок
+    tradable
+        Тикеры, количество лотов которых может меняться - по умолчанию все
+    lots
+        Текущее количество лотов тикеров, которое сохраняется для неторгуемых тикеров - по умолчанию из портфеля.
+        Стоимость портфеля при этом не меняется, поэтому подходит для последовательных сделок по текущим ценам
+
+    Returns
+    -------
+    pd.Series
+        Количество лотов для тикеров и количество денежных средств для CASH
+    """
+    tickers = pd.Index(portfolio.positions[:-2])
+    total = portfolio.value[PORTFOLIO]
+    lot_value = (portfolio.lot_size * portfolio.price)[tickers].values
+    target = weight.reindex(tickers).fillna(0).values * total
+    fixed = np.zeros(len(tickers), dtype=bool) if tradable is None else ~tickers.isin(tradable)
+    current = (portfolio.lots if lots is None else lots)[tickers].values
+    target = np.where(fixed, current * lot_value, target)
+    target_cash = total - target.sum()
+    lots = np.floor(target / lot_value + TOLERANCE)
+    cash = total - lots @ lot_value
+    min_cash -= TOLERANCE * total
+    # Отклонение от целевых значений - недостаток стоимости позиций и избыток кэша
+    deficit = target - lots * lot_value
+    excess = cash - target_cash
+    while cash < min_cash:
+        if not lots[~fixed].any():
+            raise ValueError(f'Стоимость портфеля {total} меньше необходимых денежных средств {min_cash}')
+        loss = np.where((lots > 0) & ~fixed, lot_value * (deficit + excess + lot_value), np.inf)
+        ticker = loss.argmin()
+        lots[ticker] -= 1
+        deficit[ticker] += lot_value[ticker]
+        cash += lot_value[ticker]
+        excess += lot_value[ticker]
+    while True:
+        # Уменьшение ошибки при покупке и продаже одного лота
+        buy = np.where((cash - lot_value >= min_cash) & ~fixed, lot_value * (deficit + excess - lot_value), -np.inf)
+        sell = np.where((lots > 0) & ~fixed, -lot_value * (deficit + excess + lot_value), -np.inf)
+        ticker = np.argmax(np.maximum(buy, sell))
+        if not max(buy[ticker], sell[ticker]) > 0:
+            break
+        change = lot_value[ticker] if buy[ticker] >= sell[ticker] else -lot_value[ticker]
+        lots[ticker] += np.sign(change)
+        deficit[ticker] -= change
+        cash -= change
+        excess -= change
+    plan = pd.Series(lots, index=tickers, name=LOTS)
+    plan[CASH] = cash
+    return plan
+
+
+def tranches(lots: int, trades: int = TRADES):
+    """Разбивка количества лотов на не более чем trades сделок минимум по одному лоту
+
+    Размеры сделок отличаются не более чем на один лот, более крупные идут первыми
+    """
+    count = min(trades, lots)
+    if not count:
+        return []
+    size, remainder = divmod(lots, count)
+    return [size + 1] * remainder + [size] * (count - remainder)
+
+
+def str_tranches(lots: int, trades: int = TRADES):
+    """Описание разбивки операции на сделки"""
+    sizes = tranches(lots, trades)
+    if not sizes:
+        return 'сделки не требуются'
+    if sizes[0] == sizes[-1]:
+        return f'{len(sizes)} сделок по {sizes[0]} лотов'
+    return f'{len(sizes)} сделок по {sizes[-1]}-{sizes[0]} лотов'
+
+
+def orders(portfolio: Portfolio, plan: pd.Series, trades: int = TRADES):
+    """План сделок для перехода от текущего портфеля к заданному количеству лотов
+
+    Изменение каждой позиции разбивается на не более чем trades сделок. В каждой очереди сначала идут продажи, чтобы
+    высвободить денежные средства для покупок
+
+    Parameters
+    ----------
+    portfolio
+        Текущий портфель
+    plan
+        Целевое количество лотов для тикеров
+    trades
+        Максимальное количество сделок по каждой позиции
+
+    Returns
+    -------
+    pd.DataFrame
+        Очередь сделки, тикер, количество лотов (отрицательное для продаж) и стоимость сделки
+    """
+    tickers = pd.Index(portfolio.positions[:-2])
+    change = (plan.reindex(tickers).fillna(0) - portfolio.lots[tickers]).astype(int)
+    lot_value = portfolio.lot_size * portfolio.price
+    rows = []
+    for ticker, lots in change[change != 0].items():
+        for tranche, size in enumerate(tranches(abs(lots), trades), 1):
+            size = int(np.sign(lots)) * size
+            rows.append([tranche, ticker, size, size * lot_value[ticker]])
+    df = pd.DataFrame(rows, columns=[TRANCHE, TICKER, LOTS, VALUE])
+    return df.sort_values([TRANCHE, LOTS], kind='mergesort').reset_index(drop=True)
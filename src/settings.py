@@ -11,6 +11,13 @@ pd.set_option('display.width', None)
 # Путь к данным - данные состоящие из нескольких серий хранятся в отдельных директориях внутри базовой директории
 DATA_PATH = Path(__file__).parents[1] / 'data'
 
+# Режим обновления устаревших локальных данных:
+# 'sync' - синхронно при обращении к данным
+# 'background' - в отдельном потоке, а до завершения обновления используются последние сохраненные данные
+# 'offline' - не обновляются, используются последние сохраненные данные
+# Отсутствующие локальные данные во всех режимах создаются синхронно
+UPDATE_MODE = 'sync'
+
 # Путь к отчетам
 REPORTS_PATH = Path(__file__).parents[1] / 'reports'
 
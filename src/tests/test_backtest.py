@@ -0,0 +1,81 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import backtest
+import frontier
+import optimizer
+from metrics import CASH, dividends_metrics, returns_metrics
+import settings
+from ml.manager_ml import MLDataManager
+from ml.tests.test_manager_ml import FakeManager, ML_NAME
+from settings import AFTER_TAX, T_SCORE, MAX_TRADE
+
+
+def test_step_dates():
+    calendar = pd.bdate_range('2018-01-01', '2018-06-30')
+    dates = backtest.step_dates(calendar, '2018-01-31', '2018-05-31')
+    assert list(dates) == list(pd.to_datetime(['2018-01-31', '2018-02-28', '2018-03-30', '2018-04-30',
+                                               '2018-05-31']))
+    assert backtest.step_dates(calendar, '2018-05-15')[-1] == pd.Timestamp('2018-06-15')
+
+
+def test_apply_trades():
+    lots = pd.Series([10, 5, 100.0], index=['A', 'B', CASH])
+    lot_value = pd.Series([20.0, 30.0], index=['A', 'B'])
+    trades = pd.DataFrame([['A', 3, 'B', 2, 3.0, 1.0], ['A', 1, 'B', 1, 2.5, 1.0]],
+                          columns=['SELL', 'SELL_LOTS', 'BUY', 'BUY_LOTS', 'T_DIVIDENDS', 'T_DRAWDOWN'])
+    result = backtest.apply_trades(lots, trades, lot_value)
+    assert result.to_dict() == dict(A=6, B=8, CASH=100 + 4 * 20 - 3 * 30)
+    assert (result * lot_value.reindex(result.index, fill_value=1)).sum() == (lots * lot_value.reindex(
+        lots.index, fill_value=1)).sum()
+
+
+def test_received_dividends():
+    panel = pd.DataFrame({'A': [1.0, np.nan, 2.0], 'C': [5.0, 5.0, 5.0]},
+                         index=pd.to_datetime(['2018-01-31', '2018-02-15', '2018-02-28']))
+    shares = pd.Series([100.0, 10.0], index=['A', 'B'])
+    assert backtest.received_dividends(panel, shares, '2018-01-31', '2018-02-28') == pytest.approx(200 * AFTER_TAX)
+    assert backtest.received_dividends(panel, shares, '2018-02-28', '2018-03-30') == 0
+
+
+def test_summary():
+    result = pd.DataFrame({backtest.VALUE: [100.0, 120.0, 90.0, 110.0],
+                           backtest.DIVIDENDS: [0.0, 1.0, 2.0, 0.0],
+                           backtest.INDEX: [100.0, 105.0, 100.0, 115.0],
+                           backtest.TRADES: [1, 0, 2, 0]})
+    summary = backtest.summary(result)
+    assert summary[backtest.TOTAL_RETURN] == pytest.approx(0.1)
+    assert summary[backtest.INDEX_RETURN] == pytest.approx(0.15)
+    assert summary[backtest.TOTAL_DIVIDENDS] == pytest.approx(3.0)
+    assert summary[backtest.MAX_DRAW_DOWN] == pytest.approx(-0.25)
+
+
+def test_optimization_params(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, 'DATA_PATH', tmp_path)
+    with backtest._optimization_params(1.5, 0.05, 3):
+        for module in (optimizer, frontier, dividends_metrics, returns_metrics):
+            assert module.T_SCORE == 1.5
+        assert optimizer.MAX_TRADE == 0.05
+        assert MLDataManager.cv_months == 3
+        manager = FakeManager(('A',), pd.Timestamp('2018-01-31'))
+        assert manager.data_name == f'{ML_NAME}{backtest.ML_NAME_SUFFIX}_{os.getpid()}'
+        assert list(tmp_path.glob(f'*{manager.data_name}*'))
+    assert not list(tmp_path.glob(f'*{backtest.ML_NAME_SUFFIX}*'))
+    assert FakeManager(('A',), pd.Timestamp('2018-01-31')).data_name == ML_NAME
+    for module in (optimizer, frontier, dividends_metrics, returns_metrics):
+        assert module.T_SCORE == T_SCORE
+    assert optimizer.MAX_TRADE == MAX_TRADE
+    assert MLDataManager.cv_months == 0
+
+
+def test_backtest():
+    positions = dict(CHMF=173, LSRG=1341, MTSS=1264, MVID=141, UPRO=1272)
+    test = backtest.Backtest(positions, 2_262, '2018-05-01', '2018-08-01', max_steps=3)
+    result = test.run()
+    assert list(result.index) == list(test.dates)
+    assert len(result) == 4
+    assert result[backtest.INDEX].iloc[0] == pytest.approx(result[backtest.VALUE].iloc[0])
+    assert (result[backtest.TRADES] <= 3).all()
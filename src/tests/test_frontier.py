@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+import frontier
+from metrics import CASH, PORTFOLIO
+from tests.test_optimizer import make_fake_optimizer  # noqa: F401
+
+POINTS = 10
+
+
+def test_metrics_at_current_weights(fake_optimizer):
+    opt = fake_optimizer
+    result = opt.frontier(POINTS)
+    weight = opt.portfolio.weight[:-1].values
+    assert result._lower_bound(weight)[0] == pytest.approx(opt.dividends_metrics.lower_bound[PORTFOLIO])
+    assert result._draw_down(weight) == pytest.approx(opt.returns_metrics.draw_down[PORTFOLIO])
+
+
+def test_frontier(fake_optimizer):
+    opt = fake_optimizer
+    result = opt.frontier(POINTS)
+    weights = result.weights
+    assert weights.shape == (POINTS, len(opt.portfolio.positions) - 1)
+    assert weights.sum(axis=1).values == pytest.approx(1)
+    assert (weights.values >= 0).all()
+    df = result.metrics
+    assert list(df.columns) == ['LOWER_BOUND', 'DRAW_DOWN']
+    assert (np.diff(df['LOWER_BOUND']) > 0).all()
+    assert (np.diff(df['DRAW_DOWN']) <= 1e-9).all()
+    # Крайние точки не хуже текущего портфеля по соответствующим метрикам
+    assert df['DRAW_DOWN'].iloc[0] >= opt.returns_metrics.draw_down[PORTFOLIO]
+    assert df['LOWER_BOUND'].iloc[-1] >= opt.dividends_metrics.lower_bound[PORTFOLIO]
+    # Промежуточные точки эффективнее текущего портфеля, если он внутри границы
+    for lower_bound, draw_down in df.values[1:-1]:
+        assert not (lower_bound < opt.dividends_metrics.lower_bound[PORTFOLIO]
+                    and draw_down < opt.returns_metrics.draw_down[PORTFOLIO])
+
+
+def test_volume_factor_bounds(fake_optimizer):
+    opt = fake_optimizer
+    ticker = opt.portfolio.weight[:-2].idxmax()
+    opt.portfolio.volume_factor[ticker] = 0
+    weights = opt.frontier(POINTS).weights
+    assert (weights[ticker] <= opt.portfolio.weight[ticker] + 1e-9).all()
+
+
+def test_lots(fake_optimizer):
+    opt = fake_optimizer
+    result = opt.frontier(POINTS)
+    portfolio = opt.portfolio
+    for point in (0, POINTS - 1):
+        lots = result.lots(point)
+        value = (lots.drop(CASH) * portfolio.lot_size * portfolio.price).sum() + lots[CASH]
+        assert value == pytest.approx(portfolio.value[PORTFOLIO])
+        assert lots[CASH] >= 0
+        assert (lots.drop(CASH) >= 0).all()
+
+
+def test_max_trade(fake_optimizer):
+    opt = fake_optimizer
+    max_trade = 0.02
+    weights = opt.frontier(POINTS, max_trade).weights
+    current = opt.portfolio.weight[:-1]
+    assert ((weights - current).abs().values <= max_trade + 1e-9).all()
+    assert weights.sum(axis=1).values == pytest.approx(1)
+
+
+def test_not_converged(fake_optimizer, monkeypatch, caplog):
+    monkeypatch.setattr(frontier, 'MAX_ITER', 1)
+    opt = fake_optimizer
+    result = opt.frontier(POINTS)
+    assert 'Оптимизация не сошлась' in caplog.text
+    weights = result.weights
+    assert weights.shape == (POINTS, len(opt.portfolio.positions) - 1)
+    assert (weights.values >= 0).all()
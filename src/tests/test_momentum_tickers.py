@@ -1,15 +1,24 @@
+from types import SimpleNamespace
+from urllib.error import URLError
+
 import pandas as pd
 import pytest
 
 import metrics
 import momentum_tickers
+from metrics import returns_metrics_ml
 from metrics.portfolio import CASH, Portfolio
 from metrics.returns_metrics_base import BaseReturnsMetrics
+from metrics.returns_metrics_ml import MLReturnsMetrics
+from metrics.tests.test_returns_metrics import portfolio_returns, returns_data
+from metrics.tests.test_returns_metrics_ml import FakeMLReturnsMetrics
 from momentum_tickers import all_securities, all_securities_with_reg_number
-from momentum_tickers import non_portfolio_securities, make_new_portfolio, valid_volume
-from momentum_tickers import valid_return_gradient
+from momentum_tickers import non_portfolio_securities
 from web.labels import REG_NUMBER
 
+# Класс метрик доходности из настроек - фикстура портфеля на время тестов заменяет его базовым
+CONFIGURED_RETURNS_METRICS = metrics.ReturnsMetrics
+
 
 @pytest.fixture(scope='module', autouse=True, name='port')
 def make_test_portfolio():
@@ -59,51 +68,84 @@ def test_non_portfolio_securities(port):
     assert 'TTLK' not in tickers_list
 
 
-def test_make_new_portfolio(port):
-    new_port = make_new_portfolio(port, 'AKRN')
-    assert isinstance(new_port, Portfolio)
-    assert 'AKRN' in new_port.positions
-    assert 'GAZP' in new_port.positions
-    assert 'VSMO' in new_port.positions
-    assert 'TTLK' in new_port.positions
-    assert len(new_port.positions) == 6
-    assert new_port.date == pd.Timestamp('2018-03-19').date()
-    assert new_port.lots[CASH] == pytest.approx(1000.21)
-    assert new_port.lots['AKRN'] == pytest.approx(0)
-    assert new_port.lots['VSMO'] == pytest.approx(145)
-    assert new_port.lots['TTLK'] == pytest.approx(123)
-    assert new_port.lots['GAZP'] == pytest.approx(682)
-
-
-def test_valid_volume(port):
-    assert valid_volume(port, 'GAZP')
-    assert valid_volume(port, 'VSMO')
-    assert not valid_volume(port, 'TTLK')
-    assert not valid_volume(make_new_portfolio(port, 'KRSB'), 'KRSB')
-
-
-def test_valid_return_gradient(port):
-    assert not valid_return_gradient(port, 'TTLK', 2)
-    assert not valid_return_gradient(port, 'GAZP', 2)
-    assert not valid_return_gradient(port, 'VSMO', 0)
-    assert valid_return_gradient(port, 'TTLK', -1)
-
-
 TICKER_CASES = ['ARSA', 'SNGSP', 'ALNU']
 
 
 @pytest.mark.parametrize('cases', TICKER_CASES)
-def test_find_momentum_tickers(port, capsys, monkeypatch, cases):
+def test_find_momentum_tickers(port, monkeypatch, cases):
     monkeypatch.setattr(momentum_tickers, 'non_portfolio_securities', lambda x: [cases])
-    momentum_tickers.find_momentum_tickers(port, 1.73)
-    captured_string = capsys.readouterr().out
-    assert '1. ' in captured_string
-    assert ((' 1.73 СКО' in captured_string) or
-            ('Фактор оборота                                                          0.0000' in captured_string))
+    report = momentum_tickers.find_momentum_tickers(port, 1.73, max_workers=1)
+    assert list(report.index) == [cases]
+    assert list(report.columns) == momentum_tickers.REPORT_COLUMNS + ['VALID']
+    assert report['VALID'].iloc[0] == (report['VOLUME_FACTOR'].iloc[0] > 0 and report['T_SCORE'].iloc[0] > 1.73)
 
 
-def test_find_momentum_tickers_find(port, capsys, monkeypatch):
+def test_find_momentum_tickers_find(port, monkeypatch):
     monkeypatch.setattr(momentum_tickers, 'non_portfolio_securities', lambda x: ['ARSA', 'SNGSP', 'ALNU'])
-    momentum_tickers.find_momentum_tickers(port, -100.0)
-    captured_string = capsys.readouterr().out
-    assert '1. ' in captured_string
+    report = momentum_tickers.find_momentum_tickers(port, -100.0, max_workers=2)
+    assert sorted(report.index) == ['ALNU', 'ARSA', 'SNGSP']
+    assert report['VALID'].any()
+
+
+class FakeReturnsMetrics:
+    @staticmethod
+    def what_if(tickers):
+        if 'BAD' in tickers:
+            raise ValueError('Пустой ответ. Проверьте запрос:')
+        if 'MISSING' in tickers:
+            raise KeyError(pd.Timestamp('2018-03-19'))
+        if 'OFFLINE' in tickers:
+            raise URLError('Name or service not known')
+        numbers = [int(ticker[1:]) for ticker in tickers]
+        return pd.DataFrame(dict(GRADIENT=numbers,
+                                 STD_AT_DRAW_DOWN=2.0,
+                                 VOLUME_FACTOR=[number % 2 for number in numbers]),
+                            index=pd.Index(tickers))
+
+
+@pytest.mark.parametrize('max_workers', [1, 3])
+def test_screen_tickers(monkeypatch, max_workers):
+    monkeypatch.setattr(momentum_tickers, 'CHUNK_SIZE', 4)
+    tickers = tuple(f'T{number}' for number in range(10)) + ('BAD', 'MISSING', 'OFFLINE')
+    report = momentum_tickers.screen_tickers(FakeReturnsMetrics(), tickers, max_workers)
+    assert list(report.columns) == momentum_tickers.REPORT_COLUMNS
+    assert list(report.index[:5]) == ['T9', 'T7', 'T5', 'T3', 'T1']
+    assert report.loc['T9', 'T_SCORE'] == 4.5
+    assert report.loc['T8', 'T_SCORE'] == 0
+    assert set(report.index[-3:]) == {'BAD', 'MISSING', 'OFFLINE'}
+    assert report.loc[['BAD', 'MISSING', 'OFFLINE'], 'T_SCORE'].isna().all()
+
+
+def test_screen_ml_matches_new_portfolio():
+    tickers, weight, candidates = returns_data()
+    report = momentum_tickers.screen_tickers(FakeMLReturnsMetrics(weight, portfolio_returns(tickers, weight),
+                                                                  candidates), ('NEW1',), 1)
+    new_weight = weight.append(pd.Series({'NEW1': 0.0}))
+    expected = FakeMLReturnsMetrics(new_weight, portfolio_returns(tickers, new_weight, candidates['NEW1']), candidates)
+    assert report.loc['NEW1', 'GRADIENT'] == pytest.approx(expected.gradient['NEW1'])
+    assert report.loc['NEW1', 'T_SCORE'] == pytest.approx(expected.gradient['NEW1'] / expected.std_at_draw_down * 0.5)
+
+
+class PortfolioModel:
+    """ML-модель исходного портфеля, используемая для портфеля с кандидатом без повторного обучения"""
+
+    def __init__(self, model, positions):
+        self.prediction_mean = model.tickers_prediction_mean(positions)
+        self.std = model.std
+        self.params = model.params
+        self.tickers_prediction_mean = model.tickers_prediction_mean
+
+
+def test_screen_matches_new_portfolio(port, monkeypatch):
+    monkeypatch.setattr(metrics, 'ReturnsMetrics', CONFIGURED_RETURNS_METRICS)
+    returns_metrics = metrics.ReturnsMetrics(port)
+    if isinstance(returns_metrics, MLReturnsMetrics):
+        model = returns_metrics._ml_data
+        monkeypatch.setattr(returns_metrics_ml, 'ReturnsMLDataManager',
+                            lambda positions, date: SimpleNamespace(value=PortfolioModel(model, positions)))
+    row = momentum_tickers.screen_tickers(returns_metrics, ('AKRN',), 1).loc['AKRN']
+    new_port = Portfolio(date=port.date, cash=port.lots[CASH], positions=dict(port.lots.iloc[:-2], AKRN=0))
+    new_metrics = metrics.ReturnsMetrics(new_port)
+    assert row['GRADIENT'] == pytest.approx(new_metrics.gradient['AKRN'])
+    assert row['T_SCORE'] == pytest.approx(new_metrics.gradient['AKRN'] / new_metrics.std_at_draw_down
+                                           * new_port.volume_factor['AKRN'])
@@ -1,13 +1,18 @@
+import numpy as np
+import pandas as pd
 import pytest
 
+import frontier
 import metrics
 import optimizer
-from metrics import portfolio
+from metrics import dividends_metrics, portfolio, returns_metrics
+from metrics.dividends_metrics import AbstractDividendsMetrics
 from metrics.dividends_metrics_base import BaseDividendsMetrics
-from metrics.portfolio import Portfolio
+from metrics.portfolio import Portfolio, CASH, PORTFOLIO
+from metrics.returns_metrics import AbstractReturnsMetrics
 from metrics.returns_metrics_base import BaseReturnsMetrics
 from optimizer import Optimizer
-from settings import AFTER_TAX
+from settings import AFTER_TAX, MAX_TRADE
 
 
 @pytest.fixture(scope='module', name='opt')
@@ -121,3 +126,148 @@ def test_cash_out(opt):
 def test_cash_out_enough(opt, monkeypatch):
     monkeypatch.setattr(optimizer, 'MAX_TRADE', 0.0)
     assert 'Средств достаточно для вывода' == opt.cash_out
+
+
+def legacy_growth_matrix(gradient, other_gradient, volume_factor, weight):
+    growth = gradient.apply(func=lambda x: (gradient - x) * volume_factor)
+    growth.loc[weight == 0] = 0
+    growth = growth * other_gradient.apply(func=lambda x: other_gradient > x)
+    growth[growth <= 0] = 0
+    return growth
+
+
+def legacy_dominating(matrix):
+    df = matrix.iloc[:, :-2].apply(func=lambda x: x.idxmax() if x.max() > 0 else "", axis='columns')
+    df[-2:] = ""
+    return df
+
+
+@pytest.fixture(name='gradients', params=[0, 1, 2])
+def case_gradients(request):
+    rng = np.random.RandomState(request.param)
+    size = 300
+    index = [f'T{i:03}' for i in range(size - 2)] + [CASH, PORTFOLIO]
+    gradient = pd.Series(rng.normal(size=size), index=index)
+    other_gradient = pd.Series(rng.normal(size=size), index=index)
+    # Совпадающие значения градиентов для проверки выбора первого из равных
+    other_gradient.iloc[10:20] = other_gradient.iloc[0]
+    volume_factor = pd.Series(rng.uniform(size=size), index=index)
+    weight = pd.Series(rng.uniform(size=size), index=index)
+    weight[rng.uniform(size=size) < 0.3] = 0
+    return gradient, other_gradient, volume_factor, weight
+
+
+def test_growth_matrix_equivalence(gradients):
+    matrix = optimizer.growth_matrix(*gradients)
+    pd.testing.assert_frame_equal(matrix, legacy_growth_matrix(*gradients), check_dtype=False)
+
+
+def test_max_growth_equivalence(gradients):
+    matrix = optimizer.growth_matrix(*gradients)
+    expected = matrix.iloc[:, :-2].apply(func=lambda x: x.max(), axis='columns')
+    pd.testing.assert_series_equal(optimizer.max_growth(matrix), expected)
+
+
+def test_dominating_equivalence(gradients):
+    matrix = optimizer.growth_matrix(*gradients)
+    result = optimizer.dominating(matrix)
+    pd.testing.assert_series_equal(result, legacy_dominating(matrix), check_dtype=False)
+    assert (result != '').any()
+    assert (result == '').any()
+
+
+class FakePortfolio:
+    version = 0
+
+    def __init__(self, rng, size):
+        tickers = tuple(f'T{i:02}' for i in range(size))
+        self.positions = tickers + (CASH, PORTFOLIO)
+        self.lot_size = pd.Series([10.0] * size + [1.0, 1.0], index=self.positions)
+        self.price = pd.Series(list(rng.uniform(50, 150, size=size)) + [1.0, 0.0], index=self.positions)
+        lots = list(rng.randint(0, 40, size=size)) + [1000.0, 1]
+        self.lots = pd.Series(lots, index=self.positions)
+        value = self.lots * self.lot_size * self.price
+        value[PORTFOLIO] = value.iloc[:-1].sum()
+        self.price[PORTFOLIO] = value[PORTFOLIO]
+        self.value = value
+        self.weight = value / value[PORTFOLIO]
+        self.volume_factor = pd.Series(list(rng.uniform(0.5, 1, size=size)) + [1.0, 1.0], index=self.positions)
+
+
+class FakeDividendsMetrics(AbstractDividendsMetrics):
+    def __init__(self, port):
+        super().__init__(port)
+        rng = np.random.RandomState(len(port.positions))
+        tickers = list(port.positions[:-2])
+        self._fake_mean = pd.Series(rng.uniform(0.02, 0.1, size=len(tickers)), index=tickers)
+        self._fake_std = pd.Series(rng.uniform(0.01, 0.05, size=len(tickers)), index=tickers)
+
+    @property
+    def _tickers_real_after_tax_mean(self):
+        return self._fake_mean.copy()
+
+    @property
+    def _tickers_real_after_tax_std(self):
+        return self._fake_std.copy()
+
+
+class FakeReturnsMetrics(AbstractReturnsMetrics):
+    def __init__(self, port):
+        super().__init__(port)
+        rng = np.random.RandomState(len(port.positions))
+        tickers = list(port.positions[:-2])
+        index = pd.date_range('2010-01-31', periods=100, freq='M')
+        market = rng.normal(0.01, 0.04, size=(100, 1))
+        returns = pd.DataFrame(market + rng.normal(0.005, 0.05, size=(100, len(tickers))), index=index, columns=tickers)
+        returns[CASH] = 0.0
+        returns[PORTFOLIO] = returns.multiply(port.weight.iloc[:-1]).sum(axis=1)
+        self._returns = returns
+
+    @property
+    def returns(self):
+        return self._returns
+
+    def tickers_returns(self, tickers):
+        raise NotImplementedError
+
+    @property
+    def decay(self):
+        return 0.9
+
+
+@pytest.fixture(name='fake_optimizer')
+def make_fake_optimizer(monkeypatch):
+    monkeypatch.setattr(metrics, 'DividendsMetrics', FakeDividendsMetrics)
+    monkeypatch.setattr(metrics, 'ReturnsMetrics', FakeReturnsMetrics)
+    for module in (optimizer, frontier, dividends_metrics, returns_metrics):
+        monkeypatch.setattr(module, 'T_SCORE', 0.5)
+    # Фикстура с реальным портфелем не восстанавливает ограничение на сделку, если загрузка данных прервана
+    monkeypatch.setattr(optimizer, 'MAX_TRADE', MAX_TRADE)
+    return Optimizer(FakePortfolio(np.random.RandomState(3), 12))
+
+
+def test_portfolio_moments(fake_optimizer):
+    opt = fake_optimizer
+    moments = optimizer.PortfolioMoments(opt.portfolio, opt.dividends_metrics, opt.returns_metrics)
+    weight = opt.portfolio.weight
+    assert moments.dividends_gradient(weight).values == pytest.approx(opt.dividends_metrics.gradient.values)
+    assert moments.returns_gradient(weight).values == pytest.approx(opt.returns_metrics.gradient.values)
+    assert moments.dividends_std(weight) == pytest.approx(opt.dividends_metrics.std[PORTFOLIO])
+    assert moments.std_at_draw_down(weight) == pytest.approx(opt.returns_metrics.std_at_draw_down)
+
+
+def test_trades(fake_optimizer):
+    opt = fake_optimizer
+    trades = opt.trades()
+    assert len(trades) > 1
+    assert list(trades.columns) == ['SELL', 'SELL_LOTS', 'BUY', 'BUY_LOTS', 'T_DIVIDENDS', 'T_DRAWDOWN']
+    assert trades['T_DIVIDENDS'].iloc[0] == pytest.approx(opt.t_dividends_growth)
+    assert trades['T_DRAWDOWN'].iloc[0] == pytest.approx(opt.t_drawdown_growth)
+    assert trades['BUY'].iloc[0] == opt.dominated[trades['SELL'].iloc[0]]
+    assert (trades[['T_DIVIDENDS', 'T_DRAWDOWN']].max(axis=1) > optimizer.T_SCORE).all()
+    lots = opt.portfolio.lots.astype(float)
+    for sell, sell_lots, buy, buy_lots, *_ in trades.itertuples(index=False):
+        assert 0 <= sell_lots <= lots[sell]
+        lots[sell] -= sell_lots
+        lots[buy] += buy_lots
+    assert len(opt.trades(max_steps=1)) == 1
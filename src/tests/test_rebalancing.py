@@ -0,0 +1,123 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import rebalancing
+from metrics import CASH, PORTFOLIO
+from tests.test_optimizer import FakePortfolio, make_fake_optimizer  # noqa: F401
+
+
+def error(portfolio, weight, plan):
+    """Сумма квадратов отклонений стоимости позиций и кэша от целевых значений"""
+    total = portfolio.value[PORTFOLIO]
+    tickers = list(portfolio.positions[:-2])
+    target = weight.reindex(tickers).fillna(0) * total
+    value = plan[tickers] * (portfolio.lot_size * portfolio.price)[tickers]
+    return ((target - value) ** 2).sum() + (total - target.sum() - plan[CASH]) ** 2
+
+
+@pytest.fixture(name='port', params=[0, 1, 2])
+def make_portfolio(request):
+    return FakePortfolio(np.random.RandomState(request.param), 30)
+
+
+@pytest.fixture(name='weight')
+def make_weight(port):
+    rng = np.random.RandomState(len(port.positions))
+    weight = pd.Series(rng.uniform(size=len(port.positions) - 2), index=port.positions[:-2])
+    return weight / weight.sum() * 0.95
+
+
+def test_current_weights(port):
+    plan = rebalancing.lot_plan(port, port.weight)
+    assert plan.values == pytest.approx(port.lots.values[:-1])
+
+
+def test_lot_plan(port, weight):
+    plan = rebalancing.lot_plan(port, weight)
+    lot_value = (port.lot_size * port.price)[plan.index[:-1]]
+    assert (plan[:-1] == np.round(plan[:-1])).all()
+    assert (plan[:-1] >= 0).all()
+    assert plan[CASH] >= 0
+    assert (plan[:-1] * lot_value).sum() + plan[CASH] == pytest.approx(port.value[PORTFOLIO])
+    floor = np.floor(weight * port.value[PORTFOLIO] / lot_value)
+    floor[CASH] = port.value[PORTFOLIO] - (floor * lot_value).sum()
+    assert error(port, weight, plan) <= error(port, weight, floor)
+    # Ни одна допустимая покупка или продажа одного лота не уменьшает ошибку
+    base = error(port, weight, plan)
+    for ticker in plan.index[:-1]:
+        for change in (-1, 1):
+            other = plan.copy()
+            other[ticker] += change
+            other[CASH] -= change * lot_value[ticker]
+            if other[ticker] >= 0 and other[CASH] >= 0:
+                assert error(port, weight, other) >= base - 1e-6
+
+
+def test_lot_plan_min_cash(port, weight):
+    min_cash = 0.2 * port.value[PORTFOLIO]
+    plan = rebalancing.lot_plan(port, weight, min_cash)
+    assert plan[CASH] >= min_cash
+    with pytest.raises(ValueError):
+        rebalancing.lot_plan(port, weight, 2 * port.value[PORTFOLIO])
+
+
+def test_lot_plan_tradable(port, weight):
+    tradable = tuple(port.positions[:3])
+    plan = rebalancing.lot_plan(port, weight, tradable=tradable)
+    fixed = plan.index[:-1].difference(tradable)
+    assert (plan[fixed] == port.lots[fixed]).all()
+    assert (plan[list(tradable)] != port.lots[list(tradable)]).any()
+    lot_value = (port.lot_size * port.price)[plan.index[:-1]]
+    assert (plan[:-1] * lot_value).sum() + plan[CASH] == pytest.approx(port.value[PORTFOLIO])
+    assert plan[CASH] >= 0
+
+
+@pytest.mark.parametrize('lots, trades, expected', [(0, 5, []),
+                                                    (3, 5, [1, 1, 1]),
+                                                    (10, 5, [2, 2, 2, 2, 2]),
+                                                    (13, 5, [3, 3, 3, 2, 2])])
+def test_tranches(lots, trades, expected):
+    assert rebalancing.tranches(lots, trades) == expected
+
+
+def test_str_tranches():
+    assert rebalancing.str_tranches(0) == 'сделки не требуются'
+    assert rebalancing.str_tranches(10) == '5 сделок по 2 лотов'
+    assert rebalancing.str_tranches(13) == '5 сделок по 2-3 лотов'
+
+
+def test_orders(port, weight):
+    plan = rebalancing.lot_plan(port, weight)
+    df = rebalancing.orders(port, plan)
+    assert list(df.columns) == ['TRANCHE', 'TICKER', 'LOTS', 'VALUE']
+    assert df['TRANCHE'].max() <= rebalancing.TRADES
+    lots = port.lots[:-2] + df.groupby('TICKER')['LOTS'].sum().reindex(port.positions[:-2]).fillna(0)
+    assert lots.values == pytest.approx(plan[:-1].values)
+    assert port.lots[CASH] - df['VALUE'].sum() == pytest.approx(plan[CASH])
+    for _, tranche in df.groupby('TRANCHE'):
+        assert tranche['LOTS'].is_monotonic_increasing
+
+
+def test_cash_out(fake_optimizer, monkeypatch):
+    opt = fake_optimizer
+    monkeypatch.setattr(opt.portfolio, 'weight', opt.portfolio.weight.copy())
+    # Дешевые лоты других позиций, на которые можно было бы потратить остаток от округления продажи
+    for ticker in ('T00', 'T01'):
+        opt.portfolio.lots[ticker] *= 10
+        opt.portfolio.lot_size[ticker] = 1.0
+    plans = []
+    lot_plan = rebalancing.lot_plan
+
+    def spy_lot_plan(*args, **kwargs):
+        plans.append(lot_plan(*args, **kwargs))
+        return plans[-1]
+
+    monkeypatch.setattr(rebalancing, 'lot_plan', spy_lot_plan)
+    cash_out = opt.cash_out
+    assert cash_out.startswith('Для вывода средств продать ')
+    ticker = cash_out.split()[4]
+    plan = plans[0].drop([ticker, CASH])
+    assert (plan == opt.portfolio.lots[plan.index]).all()
+    monkeypatch.setattr(rebalancing, 'lot_plan', lot_plan)
+    assert opt._str_best_trade().startswith('РЕКОМЕНДУЕТСЯ')
@@ -0,0 +1,120 @@
+"""Атомарная запись файлов и блокировки для совместного использования каталога данных несколькими процессами"""
+import contextlib
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    # На платформах без fcntl блокировки действуют только между потоками одного процесса
+    fcntl = None
+
+# Расширения служебных файлов - имена начинаются с точки, чтобы не совпадать с шаблонами имен файлов данных
+LOCK_EXTENSION = '.lock'
+TEMP_EXTENSION = '.tmp'
+
+
+def _fsync_dir(folder):
+    """Сохраняет на диск изменения каталога - на платформах без поддержки пропускается"""
+    try:
+        fd = os.open(folder, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+@contextlib.contextmanager
+def atomic_write(path, mode: str = 'wb'):
+    """Открывает временный файл для записи, который при успешном завершении заменяет исходный
+
+    Данные сбрасываются на диск до замены, поэтому при прерывании записи исходный файл остается неизменным, а читатели
+    всегда видят либо старую, либо новую версию файла целиком
+
+    Parameters
+    ----------
+    path : pathlib.Path
+        Путь к файлу
+    mode
+        Режим открытия файла для записи
+    """
+    temp_path = path.with_name(f'.{path.name}.{os.getpid()}.{threading.get_ident()}{TEMP_EXTENSION}')
+    try:
+        with open(temp_path, mode) as file:
+            yield file
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, path)
+    finally:
+        if temp_path.exists():
+            temp_path.unlink()
+    _fsync_dir(path.parent)
+
+
+class _PathLock:
+    """Реентерабельная блокировка файла между потоками и процессами"""
+
+    def __init__(self, path):
+        self._path = path
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._file = None
+
+    def acquire(self):
+        self._thread_lock.acquire()
+        if self._depth == 0:
+            try:
+                self._file = open(self._path, 'a+b')
+                if fcntl is not None:
+                    fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+            except BaseException:
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+                self._thread_lock.release()
+                raise
+        self._depth += 1
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0:
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+        self._thread_lock.release()
+
+
+_LOCKS = {}
+_LOCKS_GUARD = threading.Lock()
+
+
+def lock_path(path):
+    """Путь к файлу блокировки для файла или каталога"""
+    return path.with_name(f'.{path.name}{LOCK_EXTENSION}')
+
+
+@contextlib.contextmanager
+def file_lock(path):
+    """Исключительная рекомендательная блокировка файла или каталога
+
+    Блокировка реентерабельна в пределах потока и исключает одновременную запись из других потоков и процессов.
+    Читатели блокировку не используют - согласованность чтения обеспечивается атомарной заменой файлов
+
+    Parameters
+    ----------
+    path : pathlib.Path
+        Путь к защищаемому файлу или каталогу
+    """
+    key = lock_path(path)
+    with _LOCKS_GUARD:
+        lock = _LOCKS.setdefault(key, _PathLock(key))
+    lock.acquire()
+    try:
+        yield
+    finally:
+        lock.release()
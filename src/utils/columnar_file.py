@@ -0,0 +1,445 @@
+"""Колоночное хранение однородных табличных данных для множества серий"""
+import contextlib
+import copy
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+import settings
+from utils.atomic_file import atomic_write, file_lock
+from utils.data_file import load_data
+
+STORE_EXTENSION = '.columns'
+HEADER_FILE = 'header.json'
+COLUMN_EXTENSION = '.bin'
+# Служебное имя файла для хранения индекса
+INDEX_FILE = '_index'
+# Доля не используемых строк и среднее количество сегментов на серию, при превышении которых хранилище сжимается
+MAX_DEAD_SHARE = 0.5
+MAX_SEGMENTS = 8
+# Значения колонок хранятся в виде float64, а индекс - в виде datetime64[ns], записанного как int64
+VALUES_DTYPE = np.dtype('<f8')
+INDEX_DTYPE = np.dtype('<i8')
+
+
+class ColumnarStore:
+    """Хранилище однородных DataFrame для множества серий одной категории в виде набора колонок
+
+    Строки всех серий дописываются в конец общих файлов - по одному файлу на каждую колонку и на индекс. Индекс должен
+    быть датами. В заголовке хранятся колонки, количество зафиксированных строк, а для каждой серии - перечень ее
+    сегментов строк, типы колонок и время обновления. Строки за пределами зафиксированного в заголовке количества
+    игнорируются, поэтому прерванная запись не портит сохраненные ранее данные
+
+    Файлы колонок отображаются в память и читаются без полной загрузки. Запись из нескольких потоков и процессов
+    выполняется последовательно под блокировкой хранилища. Заголовок заменяется атомарно и перечитывается при его
+    изменении другим процессом, а строки в пределах зафиксированного количества никогда не перезаписываются, поэтому
+    читатели блокировку не используют. Запись изменяет копию заголовка, которая заменяет кэшированный заголовок только
+    после сохранения, поэтому читатели в том же процессе тоже не видят промежуточных состояний
+    """
+
+    def __init__(self, data_category: str):
+        """
+        Parameters
+        ----------
+        data_category
+            Категория данных - все серии категории хранятся в одном каталоге внутри глобального каталога данных
+        """
+        self._data_category = data_category
+        self._header_stat = None
+        self._cached_header = None
+        self._arrays = None
+
+    def __str__(self):
+        return (f'{self.__class__.__name__}('
+                f'data_category={self._data_category}, '
+                f'series={len(self._header["series"])}, '
+                f'rows={self.rows})')
+
+    @property
+    def data_category(self):
+        """Категория данных"""
+        return self._data_category
+
+    @property
+    def path(self):
+        """Каталог хранилища - при необходимости создается в глобальной директории данных"""
+        folder = settings.DATA_PATH / f'{self._data_category}{STORE_EXTENSION}'
+        if not folder.exists():
+            folder.mkdir(parents=True)
+        return folder
+
+    def _stat_header(self):
+        """Признаки версии файла заголовка - меняются при каждой его замене"""
+        try:
+            stat = os.stat(self.path / HEADER_FILE)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    @property
+    def _header(self):
+        """Актуальный заголовок - перечитывается, если файл был заменен другим процессом"""
+        stat = self._stat_header()
+        if self._cached_header is None or stat != self._header_stat:
+            self._cached_header = self._load_header()
+            self._header_stat = stat
+        return self._cached_header
+
+    def _load_header(self):
+        """Загружает заголовок или создает пустой"""
+        path = self.path / HEADER_FILE
+        if path.exists():
+            with open(path, 'r') as file:
+                return json.load(file)
+        return dict(columns=None, rows=0, series={})
+
+    def _save_header(self, header: dict):
+        """Сохраняет измененную копию заголовка и делает ее актуальной"""
+        with atomic_write(self.path / HEADER_FILE, 'w') as file:
+            json.dump(header, file)
+        self._cached_header = header
+        self._header_stat = self._stat_header()
+
+    @contextlib.contextmanager
+    def lock(self):
+        """Блокирует запись в хранилище другими потоками и процессами"""
+        with file_lock(self.path):
+            yield
+
+    def _column_path(self, column: str, generation: int = None):
+        """Путь к файлу колонки - после каждого сжатия хранилища используются файлы нового поколения"""
+        if generation is None:
+            generation = self.generation
+        if generation:
+            return self.path / f'{column}.{generation}{COLUMN_EXTENSION}'
+        return self.path / f'{column}{COLUMN_EXTENSION}'
+
+    @property
+    def generation(self):
+        """Номер поколения файлов колонок - увеличивается при каждом сжатии"""
+        return self._header.get('generation', 0)
+
+    @property
+    def version(self):
+        """Версия данных хранилища - меняется при любом изменении строк"""
+        return self.generation, self.rows
+
+    @property
+    def rows(self):
+        """Количество зафиксированных строк во всех сериях с учетом замененных"""
+        return self._header['rows']
+
+    @property
+    def columns(self):
+        """Колонки хранилища - устанавливаются при первой записи не пустых данных"""
+        return self._header['columns']
+
+    @property
+    def names(self):
+        """Кортеж названий серий в хранилище"""
+        return tuple(self._header['series'])
+
+    def last_update(self, name: str):
+        """Время обновления серии - epoch. Если серии нет, то None"""
+        series = self._header['series'].get(name)
+        if series is None:
+            return None
+        return series['last_update']
+
+    def index_name(self, name: str):
+        """Название индекса серии"""
+        return self._header['series'][name]['index_name']
+
+    def segments(self, name: str):
+        """Список пар (начало, конец) строк серии в файлах колонок"""
+        return [tuple(segment) for segment in self._header['series'][name]['segments']]
+
+    def last_index(self, name: str):
+        """Последнее значение индекса серии без загрузки всей серии. Если серии или строк нет, то None"""
+        series = self._header['series'].get(name)
+        if series is None or not series['segments']:
+            return None
+        _, stop = series['segments'][-1]
+        return pd.Timestamp(self.arrays()[INDEX_FILE][stop - 1])
+
+    def arrays(self):
+        """Словарь отображенных в память колонок и индекса с зафиксированными строками
+
+        Ключами являются названия колонок и INDEX_FILE для индекса
+        """
+        version = self.version
+        if self._arrays is None or self._arrays[0] != version:
+            generation, rows = version
+            arrays = {}
+            if rows:
+                arrays[INDEX_FILE] = np.memmap(self._column_path(INDEX_FILE, generation), dtype=INDEX_DTYPE,
+                                               mode='r', shape=(rows,))
+                for column in self.columns:
+                    arrays[column] = np.memmap(self._column_path(column, generation), dtype=VALUES_DTYPE, mode='r',
+                                               shape=(rows,))
+            self._arrays = (version, arrays)
+        return self._arrays[1]
+
+    def read(self, name: str):
+        """Загружает серию. Если серии нет, то None"""
+        series = self._header['series'].get(name)
+        if series is None:
+            return None
+        segments = series['segments']
+        arrays = self.arrays()
+        columns = self.columns or []
+
+        def gather(array):
+            if not segments:
+                return np.array([], dtype=array.dtype if array is not None else VALUES_DTYPE)
+            return np.concatenate([array[start:stop] for start, stop in segments])
+
+        index = pd.DatetimeIndex(gather(arrays.get(INDEX_FILE)).view('datetime64[ns]'), name=series['index_name'])
+        data = {column: gather(arrays.get(column)).astype(series['dtypes'].get(column, VALUES_DTYPE))
+                for column in columns}
+        return pd.DataFrame(data, index=index, columns=columns)
+
+    def _validate_frame(self, df: pd.DataFrame):
+        """Проверяет, что данные соответствуют формату хранилища"""
+        if not isinstance(df, pd.DataFrame):
+            raise TypeError(f'В колоночном хранилище могут храниться только DataFrame, а не {type(df)}')
+        if len(df) == 0:
+            return
+        if not isinstance(df.index, pd.DatetimeIndex):
+            raise TypeError('Индекс данных для колоночного хранилища должен состоять из дат')
+        columns = [str(column) for column in df.columns]
+        if self.columns is not None and columns != self.columns:
+            raise ValueError(f'Колонки {columns} не соответствуют колонкам хранилища {self.columns}')
+
+    def _write_rows(self, header: dict, df: pd.DataFrame):
+        """Дописывает строки в файлы колонок и фиксирует их в копии заголовка - возвращает сегмент строк"""
+        start = header['rows']
+        stop = start + len(df)
+        if header['columns'] is None:
+            header['columns'] = [str(column) for column in df.columns]
+        columns = [(INDEX_FILE, df.index.values.astype('datetime64[ns]').view(INDEX_DTYPE))]
+        columns += [(str(column), df[column].values.astype(VALUES_DTYPE)) for column in df.columns]
+        for column, values in columns:
+            path = self._column_path(column, header.get('generation', 0))
+            # Запись ведется с позиции зафиксированных строк, чтобы отбросить остатки прерванных записей
+            with open(path, 'r+b' if path.exists() else 'wb') as file:
+                file.seek(start * values.dtype.itemsize)
+                file.write(np.ascontiguousarray(values).tobytes())
+                file.truncate()
+                file.flush()
+                os.fsync(file.fileno())
+        header['rows'] = stop
+        return [start, stop]
+
+    @staticmethod
+    def _series_header(header: dict, name: str, df: pd.DataFrame):
+        """Описание серии в копии заголовка - при отсутствии создается"""
+        series = header['series'].get(name)
+        if series is None or not series['dtypes']:
+            series = dict(segments=[],
+                          dtypes={str(column): str(dtype) for column, dtype in df.dtypes.items()},
+                          index_name=df.index.name,
+                          last_update=None)
+            header['series'][name] = series
+        return series
+
+    def write(self, name: str, df: pd.DataFrame, last_update: float = None):
+        """Записывает серию с нуля - ранее записанные строки серии перестают использоваться
+
+        Время обновления может быть задано явно, например, при переносе данных из других хранилищ
+        """
+        self._validate_frame(df)
+        with self.lock():
+            header = copy.deepcopy(self._header)
+            series = self._series_header(header, name, df)
+            series['segments'] = []
+            series['dtypes'] = {str(column): str(dtype) for column, dtype in df.dtypes.items()}
+            series['index_name'] = df.index.name
+            self._append_rows(header, series, df, last_update)
+
+    def append(self, name: str, df: pd.DataFrame):
+        """Дописывает строки в конец серии без перезаписи существующих"""
+        self._validate_frame(df)
+        with self.lock():
+            header = copy.deepcopy(self._header)
+            series = self._series_header(header, name, df)
+            self._append_rows(header, series, df)
+
+    def _append_rows(self, header: dict, series: dict, df: pd.DataFrame, last_update: float = None):
+        if len(df):
+            series['segments'].append(self._write_rows(header, df))
+        series['last_update'] = time.time() if last_update is None else last_update
+        self._save_header(header)
+        if self._need_compaction():
+            self.compact()
+
+    def _need_compaction(self):
+        """Много ли в хранилище не используемых строк или фрагментированных серий"""
+        series = self._header['series'].values()
+        if not series:
+            return False
+        used = sum(stop - start for one_series in series for start, stop in one_series['segments'])
+        segments = sum(len(one_series['segments']) for one_series in series)
+        return self.rows - used > self.rows * MAX_DEAD_SHARE or segments > MAX_SEGMENTS * len(series)
+
+    def compact(self):
+        """Переписывает строки всех серий подряд в файлы нового поколения и удаляет не используемые строки
+
+        Новый заголовок заменяет старый атомарно после записи файлов колонок, поэтому читатели видят либо старое, либо
+        новое поколение целиком. Читатели в других процессах могут прочитать старый заголовок и отобразить в память
+        файлы его поколения уже после замены заголовка, поэтому файлы старого поколения сохраняются до следующего
+        сжатия, при котором удаляются файлы поколения, замененного предыдущим сжатием
+        """
+        with self.lock():
+            arrays = self.arrays()
+            header = copy.deepcopy(self._header)
+            old_generation = header.get('generation', 0)
+            generation = old_generation + 1
+            old_segments = {name: series['segments'] for name, series in header['series'].items()}
+            new_segments = {}
+            rows = 0
+            for name, segments in old_segments.items():
+                length = sum(stop - start for start, stop in segments)
+                new_segments[name] = [[rows, rows + length]] if length else []
+                rows += length
+            columns = [INDEX_FILE] + (header['columns'] or [])
+            for column in columns:
+                dtype = INDEX_DTYPE if column == INDEX_FILE else VALUES_DTYPE
+                parts = [arrays[column][start:stop] for segments in old_segments.values() for start, stop in segments]
+                values = np.concatenate(parts) if parts else np.array([], dtype=dtype)
+                with atomic_write(self._column_path(column, generation)) as file:
+                    file.write(np.ascontiguousarray(values).tobytes())
+            for name, series in header['series'].items():
+                series['segments'] = new_segments[name]
+            header['rows'] = rows
+            header['generation'] = generation
+            self._save_header(header)
+            if old_generation:
+                for column in columns:
+                    try:
+                        self._column_path(column, old_generation - 1).unlink()
+                    except FileNotFoundError:
+                        pass
+
+
+# Открытые хранилища в разрезе каталогов данных
+_STORES = {}
+
+
+def columnar_store(data_category: str):
+    """Возвращает хранилище для категории данных в текущем глобальном каталоге данных"""
+    key = (settings.DATA_PATH, data_category)
+    if key not in _STORES:
+        _STORES[key] = ColumnarStore(data_category)
+    return _STORES[key]
+
+
+class ColumnarDataFile:
+    """Обеспечивает функционал DataFile для серии из колоночного хранилища
+
+    Данные всех серий одной категории хранятся в общем колоночном хранилище. Значение загружается при первом обращении,
+    а новые данные могут дописываться в конец серии без перезаписи существующих
+    """
+
+    def __init__(self, data_category: str, data_name: str):
+        """
+        Parameters
+        ----------
+        data_category
+            Категория данных - определяет хранилище
+        data_name
+            Название серии данных
+        """
+        self._data_category = data_category
+        self._data_name = data_name
+        self._value = None
+
+    def __str__(self):
+        return (f'{self.__class__.__name__}('
+                f'data_category={self.data_category}, '
+                f'data_name={self.data_name}, '
+                f'last_update={self.last_update})')
+
+    @property
+    def _store(self):
+        return columnar_store(self._data_category)
+
+    @property
+    def data_category(self):
+        """Категория данных"""
+        return self._data_category
+
+    @property
+    def data_name(self):
+        """Название данных"""
+        return self._data_name
+
+    @property
+    def data_path(self):
+        """Путь к каталогу хранилища с данными"""
+        return self._store.path
+
+    @property
+    def value(self):
+        """Возвращает сохраненное значение данных. Если сохраненного значения нет, то None"""
+        if self._value is None:
+            self._value = self._store.read(self._data_name)
+        return self._value
+
+    @value.setter
+    def value(self, value):
+        """Сохраняет новое значение данных"""
+        self._store.write(self._data_name, value)
+        self._value = None
+
+    def append(self, value):
+        """Дописывает новые строки в конец данных"""
+        self._store.append(self._data_name, value)
+        self._value = None
+
+    @contextlib.contextmanager
+    def lock(self):
+        """Блокирует изменение хранилища другими потоками и процессами и сбрасывает загруженное значение"""
+        with self._store.lock():
+            self._value = None
+            yield
+
+    @property
+    def last_update(self):
+        """Время обновления данных - epoch. Если сохраненного значения нет, то None"""
+        return self._store.last_update(self._data_name)
+
+
+def migrate(data_category: str):
+    """Переносит данные категории из отдельных файлов Pickle в колоночное хранилище
+
+    Сохраняется время последнего обновления данных. Файлы Pickle не удаляются
+
+    Parameters
+    ----------
+    data_category
+        Категория данных, файлы которой хранятся в подкаталогах глобального каталога данных
+
+    Returns
+    -------
+    tuple
+        Кортеж названий перенесенных серий
+    """
+    store = columnar_store(data_category)
+    names = []
+    for path in sorted(settings.DATA_PATH.glob(f'*/{data_category}.pickle*')):
+        data = load_data(path)
+        if data.value is None:
+            continue
+        name = path.parent.name
+        store.write(name, data.value, data.last_update)
+        names.append(name)
+    return tuple(names)
+
+
+if __name__ == '__main__':
+    print(migrate('quotes'))
+    print(migrate('quotes_t2'))
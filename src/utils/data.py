@@ -9,14 +9,17 @@ class Data:
     Поддерживается операция присвоения значения с  оператором =
     Время хранится в формате epoch
     Если значение не присвоено при создании, значение и время обновления None
+    Время обновления может быть задано явно, например, при сборке данных из нескольких частей
     """
 
-    def __init__(self, value=None):
+    def __init__(self, value=None, last_update: float = None):
         self._value = value
         if value is None:
             self._last_update = None
-        else:
+        elif last_update is None:
             self._last_update = time.time()
+        else:
+            self._last_update = last_update
 
     def __str__(self):
         last_update = None if self._last_update is None else time.ctime(self._last_update)
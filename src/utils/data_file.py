@@ -1,13 +1,111 @@
 """Хранение локальных данных"""
 
+import contextlib
+import hashlib
+import json
+import os
 import pickle
+import zlib
+
+import pandas as pd
 
 import settings
+from utils.atomic_file import atomic_write, file_lock
 from utils.data import Data
 
 PICKLE_VERSION = pickle.HIGHEST_PROTOCOL
 DATA_FILE_EXTENSION = f'.pickle{PICKLE_VERSION}'
 
+# Признак файла с заголовком - файлы без него являются Pickle объекта Data в старом формате
+MAGIC = b'DATAFILE'
+# Размер блока заголовка в байтах - блок состоит из двух ячеек, которые перезаписываются по очереди
+HEADER_SIZE = 4096
+SLOT_SIZE = HEADER_SIZE // 2
+# Начало данных в файле
+BODY_START = len(MAGIC) + HEADER_SIZE
+# Количество дописанных частей, при превышении которого файл перезаписывается целиком
+MAX_DELTAS = 16
+
+
+def make_header(data: Data):
+    """Заголовок с описанием данных - время обновления, количество строк, границы индекса и хэш схемы
+
+    Количество строк, границы индекса и схема заполняются только для Series и DataFrame, для остальных объектов
+    схема определяется их типом
+    """
+    value = data.value
+    header = dict(last_update=data.last_update, rows=None, index_start=None, index_stop=None)
+    schema = [type(value).__name__]
+    if isinstance(value, (pd.Series, pd.DataFrame)):
+        header['rows'] = len(value)
+        if len(value):
+            header['index_start'] = str(value.index[0])
+            header['index_stop'] = str(value.index[-1])
+        schema.extend([str(value.index.name), str(value.index.dtype)])
+        if isinstance(value, pd.Series):
+            schema.extend([str(value.name), str(value.dtype)])
+        else:
+            schema.extend(f'{column}:{dtype}' for column, dtype in value.dtypes.items())
+    header['schema'] = hashlib.sha1('|'.join(schema).encode()).hexdigest()
+    return header
+
+
+def _dump_slot(header: dict):
+    """Ячейка заголовка - контрольная сумма и json, дополненные пробелами до размера ячейки"""
+    raw_header = json.dumps(header).encode()
+    slot = f'{zlib.crc32(raw_header):08x}'.encode() + raw_header
+    if len(slot) > SLOT_SIZE:
+        raise ValueError(f'Размер заголовка {len(slot)} превышает {SLOT_SIZE} байт')
+    return slot.ljust(SLOT_SIZE)
+
+
+def _load_slot(slot: bytes):
+    """Заголовок из ячейки - None для пустой или поврежденной прерванной записью ячейки"""
+    raw_header = slot[8:].rstrip()
+    try:
+        if int(slot[:8], 16) != zlib.crc32(raw_header):
+            return None
+        return json.loads(raw_header)
+    except ValueError:
+        return None
+
+
+def read_header(data_file):
+    """Заголовок из открытого файла - из двух ячеек выбирается корректная с наибольшим порядковым номером
+
+    Для файлов в старом формате без заголовка возвращается None. Если обе ячейки повреждены, то файл испорчен и
+    вызывается ValueError с его названием
+    """
+    data_file.seek(0)
+    if data_file.read(len(MAGIC)) != MAGIC:
+        return None
+    slots = data_file.read(HEADER_SIZE)
+    headers = [_load_slot(slots[start:start + SLOT_SIZE]) for start in range(0, HEADER_SIZE, SLOT_SIZE)]
+    headers = [header for header in headers if header is not None]
+    if not headers:
+        raise ValueError(f'Файл данных {data_file.name} поврежден - обе ячейки заголовка не прошли проверку')
+    return max(headers, key=lambda header: header['sequence'])
+
+
+def load_data(path):
+    """Загружает объект Data из файла в новом формате с заголовком или в старом формате без него
+
+    В новом формате к основным данным добавляются все зафиксированные в заголовке дописанные части
+    """
+    with open(path, 'rb') as data_file:
+        header = read_header(data_file)
+        if header is None:
+            data_file.seek(0)
+            return pickle.load(data_file)
+        data_file.seek(BODY_START)
+        data = pickle.load(data_file)
+        deltas = []
+        while data_file.tell() < header['length']:
+            deltas.append(pickle.load(data_file))
+    if deltas:
+        data = Data(pd.concat([data.value, *deltas]), header['last_update'])
+    return data
+
 
 class DataFile:
     """Обеспечивает функционал сохранения и загрузки объектов Data
@@ -15,6 +113,16 @@ class DataFile:
     Данные хранятся в каталоге установленном в глобальных настройках
     Каждая наименование данных в отдельной подкаталоге
     Каждый категория данных в отдельном файле в формате Pickle
+
+    В начале файла хранится заголовок фиксированного размера с временем обновления и описанием данных, поэтому для
+    проверки необходимости обновления достаточно прочитать только его, а сами данные загружаются при первом обращении.
+    Файлы в старом формате без заголовка загружаются целиком и перезаписываются в новом формате при сохранении
+
+    Новые значения записываются во временный файл, который атомарно заменяет существующий. Новые строки дописываются
+    в конец файла отдельными частями, а длина зафиксированных данных сохраняется в заголовке. Заголовок хранится в двух
+    ячейках с контрольными суммами, которые перезаписываются по очереди, поэтому прерванная запись не портит данные, а
+    читатели из других процессов всегда видят согласованную версию. При большом количестве частей файл сжимается -
+    перезаписывается целиком. Запись защищена блокировкой файла
     """
 
     def __init__(self, data_category, data_name: str):
@@ -29,17 +137,50 @@ class DataFile:
         """
         self._data_category = data_category
         self._data_name = data_name
+        self._data = None
+        self._header = None
         if self.data_path.exists():
-            with open(self.data_path, 'rb') as data_file:
-                self._data = pickle.load(data_file)
+            self._load_header()
         else:
             self._data = Data()
+            self._header = make_header(self._data)
+
+    def _load_header(self):
+        """Загружает заголовок, а для файлов в старом формате - данные целиком"""
+        with open(self.data_path, 'rb') as data_file:
+            header = read_header(data_file)
+        if header is None:
+            self._data = load_data(self.data_path)
+            self._header = make_header(self._data)
+            return
+        self._header = header
+        if self._data is not None and self._data.last_update != header['last_update']:
+            self._data = None
+
+    def _load_data(self):
+        """Загружает данные при первом обращении
+
+        Если файл был изменен другим процессом после чтения заголовка, то заголовок перечитывается
+        """
+        if self._data is None:
+            self._data = load_data(self.data_path)
+            if self._data.last_update != self._header['last_update']:
+                self._load_header()
+        return self._data
+
+    @contextlib.contextmanager
+    def lock(self):
+        """Блокирует изменение данных другими потоками и процессами и перечитывает их актуальную версию"""
+        with file_lock(self.data_path):
+            if self.data_path.exists():
+                self._load_header()
+            yield
 
     def __str__(self):
         return (f'{self.__class__.__name__}('
                 f'data_category={self.data_category}, '
                 f'data_name={self.data_name}, '
-                f'data={self._data})')
+                f'data={self._load_data()})')
 
     @property
     def data_category(self):
@@ -68,22 +209,75 @@ class DataFile:
             file = f'{self._data_name}{DATA_FILE_EXTENSION}'
         return folder / file
 
+    @property
+    def header(self):
+        """Заголовок с временем обновления, количеством строк, границами индекса и хэшем схемы данных"""
+        return dict(self._header)
+
     @property
     def value(self):
         """Возвращает сохраненное значение данных. Если сохраненного значения нет, то None"""
-        return self._data.value
+        return self._load_data().value
 
     @value.setter
     def value(self, value):
         """Сохраняет новое значение данных"""
-        self._data.value = value
-        with open(self.data_path, 'wb') as data_file:
-            pickle.dump(self._data, data_file, protocol=PICKLE_VERSION)
+        data = Data()
+        data.value = value
+        self._write(data)
+
+    def _write(self, data: Data):
+        """Перезаписывает файл целиком"""
+        header = dict(make_header(data), sequence=0, deltas=0)
+        with file_lock(self.data_path), atomic_write(self.data_path) as data_file:
+            data_file.write(MAGIC)
+            data_file.seek(BODY_START)
+            pickle.dump(data, data_file, protocol=PICKLE_VERSION)
+            header['length'] = data_file.tell()
+            data_file.seek(len(MAGIC))
+            data_file.write(_dump_slot(header))
+            data_file.write(b' ' * SLOT_SIZE)
+        self._data = data
+        self._header = header
+
+    def append(self, value):
+        """Дописывает новые строки в конец данных
+
+        Строки сохраняются отдельной частью в конце файла без перезаписи существующих данных. Если частей слишком много
+        или файл в старом формате, то данные перезаписываются целиком
+        """
+        with self.lock():
+            data = Data(pd.concat([self.value, value]))
+            if 'sequence' not in self._header or self._header['deltas'] >= MAX_DELTAS:
+                self._write(data)
+                return
+            header = dict(make_header(data),
+                          sequence=self._header['sequence'] + 1,
+                          deltas=self._header['deltas'] + 1)
+            with open(self.data_path, 'r+b') as data_file:
+                data_file.seek(self._header['length'])
+                pickle.dump(value, data_file, protocol=PICKLE_VERSION)
+                header['length'] = data_file.tell()
+                data_file.truncate()
+                data_file.flush()
+                os.fsync(data_file.fileno())
+                # Заголовок записывается в ячейку, не содержащую текущую версию
+                data_file.seek(len(MAGIC) + SLOT_SIZE * (header['sequence'] % 2))
+                data_file.write(_dump_slot(header))
+                data_file.flush()
+                os.fsync(data_file.fileno())
+            self._data = data
+            self._header = header
+
+    def compact(self):
+        """Перезаписывает файл целиком, объединяя дописанные части, без изменения времени обновления"""
+        with self.lock():
+            self._write(self._load_data())
 
     @property
     def last_update(self):
         """Время обновления данных - epoch. Если сохраненного значения нет, то None"""
-        return self._data.last_update
+        return self._header['last_update']
 
 
 if __name__ == '__main__':
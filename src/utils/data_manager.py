@@ -1,17 +1,50 @@
 """Абстрактный класс менеджера создания, обновления и предоставления локальных данных"""
 
+import contextlib
 from abc import ABC, abstractmethod
 
 import arrow
 import numpy as np
 import pandas as pd
 
+import settings
 from utils.data_file import DataFile
+from utils.refresher import background_refresher
 
 # Часовой пояс MOEX
 MARKET_TIME_ZONE = 'Europe/Moscow'
 # Торги заканчиваются в 19.00, но данные публикуются 19.45
 END_OF_TRADING_DAY = dict(hour=19, minute=45, second=0, microsecond=0)
+# Допустимые режимы обновления данных settings.UPDATE_MODE
+UPDATE_MODES = ('sync', 'background', 'offline')
+
+
+def next_update(last_update: float):
+    """Время следующего планового обновления данных с заданным временем обновления - arrow в часовом поясе MOEX
+
+    Parameters
+    ----------
+    last_update
+        Время последнего обновления - epoch
+    """
+    last_update = arrow.get(last_update).to(MARKET_TIME_ZONE)
+    end_of_trading_day = last_update.replace(**END_OF_TRADING_DAY)
+    if last_update > end_of_trading_day:
+        return end_of_trading_day.shift(days=1)
+    return end_of_trading_day
+
+
+@contextlib.contextmanager
+def update_mode(mode: str):
+    """Временная установка режима обновления settings.UPDATE_MODE для создаваемых менеджеров данных"""
+    if mode not in UPDATE_MODES:
+        raise ValueError(f'Некорректный режим обновления данных {mode}')
+    saved_mode = settings.UPDATE_MODE
+    settings.UPDATE_MODE = mode
+    try:
+        yield
+    finally:
+        settings.UPDATE_MODE = saved_mode
 
 
 class AbstractDataManager(ABC):
@@ -22,6 +55,10 @@ class AbstractDataManager(ABC):
     is_monotonic = True
     # Нужно ли перезаписать новыми данными с нуля при обновлении
     update_from_scratch = False
+    # Класс для хранения данных - DataFile или ColumnarDataFile
+    data_file_class = DataFile
+    # Можно ли использовать устаревшие данные до обновления в режимах 'background' и 'offline'
+    deferred_update = True
 
     def __init__(self, data_category, data_name: str):
         """
@@ -33,11 +70,23 @@ class AbstractDataManager(ABC):
         data_name
             Название серии данных
         """
-        self._data = DataFile(data_category, data_name)
+        self._data = self.data_file_class(data_category, data_name)
+        # Время обновления данных, на основе которого принималось решение об их обновлении
+        self._seen_update = self._data.last_update
         if self._data.last_update is None:
             self.create()
         elif self.next_update < arrow.now():
+            self._update_stale()
+
+    def _update_stale(self):
+        """Обновляет устаревшие данные в соответствии с режимом settings.UPDATE_MODE"""
+        mode = settings.UPDATE_MODE
+        if mode not in UPDATE_MODES:
+            raise ValueError(f'Некорректный режим обновления данных {mode}')
+        if mode == 'sync' or not self.deferred_update:
             self.update()
+        elif mode == 'background':
+            background_refresher().submit(self)
 
     def __str__(self):
         return (f'Последнее обновление - {self.last_update}\n'
@@ -68,11 +117,7 @@ class AbstractDataManager(ABC):
     @property
     def next_update(self):
         """Время следующего планового обновления данных - arrow в часовом поясе MOEX"""
-        last_update = self.last_update
-        end_of_trading_day = last_update.replace(**END_OF_TRADING_DAY)
-        if last_update > end_of_trading_day:
-            return end_of_trading_day.shift(days=1)
-        return end_of_trading_day
+        return next_update(self._data.last_update)
 
     @abstractmethod
     def download_all(self):
@@ -95,13 +140,16 @@ class AbstractDataManager(ABC):
         """
         print(f'Создание локальных данных с нуля {self._data.data_category} -> {self._data.data_name}')
         df = self.download_all()
-        self._validate_index(df)
+        # Данные без требований к индексу могут быть произвольным объектом, например, ML-моделью
+        if self.is_unique or self.is_monotonic:
+            self._validate_index(df.index)
         self._data.value = df
+        self._seen_update = self._data.last_update
 
-    def _validate_index(self, df):
-        if self.is_unique and not df.index.is_unique:
+    def _validate_index(self, index):
+        if self.is_unique and not index.is_unique:
             raise ValueError(f'У новых данных индекс не уникальный')
-        if self.is_monotonic and not df.index.is_monotonic_increasing:
+        if self.is_monotonic and not index.is_monotonic_increasing:
             raise ValueError(f'У новых данных индекс не возрастает монотонно')
 
     def update(self):
@@ -110,22 +158,39 @@ class AbstractDataManager(ABC):
         При наличии флага перезапись с нуля используется метод создания новых данных
         При отсутствии реализации функции частичной загрузки данных будет осуществлена их полная загрузка
         Во время обновления проверяется совпадение новых данных со существующими
-        Индекс всех данных проверяется на уникальность и монотонность
+        Индекс всех данных проверяется на уникальность и монотонность - для монотонных данных проверки проводятся
+        только для окна существующих данных, начинающегося с первой новой даты
+        В хранилище дописываются только отсутствующие в существующих данных строки
+        Обновление выполняется под блокировкой данных и пропускается, если их уже обновил другой процесс
         """
         if self.update_from_scratch:
             self.create()
             return
-        print(f'Обновление локальных данных {self._data.data_category} -> {self._data.data_name}')
-        df_old = self.value
-        try:
-            df_new = self.download_update()
-        except NotImplementedError:
-            df_new = self.download_all()
-        self._validate_new(df_old, df_new)
-        old_elements = df_old.index.difference(df_new.index)
-        df = df_old.loc[old_elements].append(df_new)
-        self._validate_index(df)
-        self._data.value = df
+        with self._data.lock():
+            if self._data.last_update != self._seen_update:
+                self._seen_update = self._data.last_update
+                return
+            print(f'Обновление локальных данных {self._data.data_category} -> {self._data.data_name}')
+            try:
+                df_new = self.download_update()
+            except NotImplementedError:
+                df_new = self.download_all()
+            df_old = self._overlap(self.value, df_new)
+            self._validate_new(df_old, df_new)
+            df_append = df_new[~df_new.index.isin(df_old.index)]
+            self._validate_index(df_old.index.append(df_append.index))
+            self._data.append(df_append)
+            self._seen_update = self._data.last_update
+
+    def _overlap(self, df_old, df_new):
+        """Часть существующих данных, которая может пересекаться с новыми
+
+        Для монотонных данных - строки начиная с минимального индекса новых данных, для остальных - все данные
+        """
+        if not self.is_monotonic or len(df_new) == 0:
+            return df_old
+        start = df_old.index.searchsorted(df_new.index.min())
+        return df_old.iloc[start:]
 
     def _validate_new(self, df_old, df_new):
         """Проверяет соответствие новых данных существующим"""
@@ -0,0 +1,73 @@
+"""Фоновое обновление устаревших локальных данных"""
+import queue
+import threading
+
+
+class BackgroundRefresher:
+    """Очередь обновления устаревших данных, обрабатываемая в отдельном потоке
+
+    Менеджеры данных добавляются в очередь вместо синхронного обновления, а до его завершения предоставляют последнюю
+    сохраненную версию данных. Повторное добавление данных, ожидающих обновления, игнорируется. Ошибки обновления не
+    прерывают работу потока - данные остаются в прежнем состоянии, а ошибка сохраняется в errors
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.errors = []
+
+    @staticmethod
+    def _key(manager):
+        return manager.data_category, manager.data_name
+
+    def submit(self, manager):
+        """Добавляет менеджер данных в очередь на обновление
+
+        Returns
+        -------
+        bool
+            Добавлены ли данные в очередь - False, если они уже ожидают обновления
+        """
+        key = self._key(manager)
+        with self._lock:
+            if key in self._pending:
+                return False
+            self._pending.add(key)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='BackgroundRefresher', daemon=True)
+                self._thread.start()
+        self._queue.put(manager)
+        return True
+
+    @property
+    def pending(self):
+        """Кортеж категорий и названий данных, ожидающих обновления"""
+        with self._lock:
+            return tuple(self._pending)
+
+    def _run(self):
+        while True:
+            manager = self._queue.get()
+            try:
+                manager.update()
+            except Exception as error:
+                print(f'Ошибка фонового обновления {manager.data_category} -> {manager.data_name}: {error}')
+                self.errors.append((self._key(manager), error))
+            finally:
+                with self._lock:
+                    self._pending.discard(self._key(manager))
+                self._queue.task_done()
+
+    def join(self):
+        """Ожидает завершения обновления всех данных в очереди"""
+        self._queue.join()
+
+
+_REFRESHER = BackgroundRefresher()
+
+
+def background_refresher():
+    """Общий для всех менеджеров данных фоновый обработчик обновлений"""
+    return _REFRESHER
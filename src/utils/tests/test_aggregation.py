@@ -1,8 +1,9 @@
 import pandas as pd
+import pytest
 
 from utils.aggregation import monthly_aggregator, monthly_aggregation_func, quarterly_aggregator, \
     quarterly_aggregation_func
-from utils.aggregation import yearly_aggregator, yearly_aggregation_func
+from utils.aggregation import yearly_aggregator, yearly_aggregation_func, Freq
 
 
 def test_yearly_aggregator():
@@ -68,3 +69,16 @@ def test_monthly_aggregation_func():
     assert result(pd.Timestamp('2014-01-31')) == pd.Timestamp('2014-02-11')
     assert result(pd.Timestamp('2012-02-28')) == pd.Timestamp('2012-03-11')
     assert result(pd.Timestamp('2015-09-13')) == pd.Timestamp('2015-10-11')
+
+
+END_DATES = ['2011-03-11', '2014-01-31', '2014-07-31', '2013-02-28', '2012-02-29', '2014-09-13', '2018-12-31']
+
+
+@pytest.mark.parametrize('end', END_DATES)
+@pytest.mark.parametrize('freq', list(Freq))
+def test_aggregation_index(freq, end):
+    dates = pd.date_range('2011-01-01', '2013-12-31').append(pd.DatetimeIndex(['2014-05-05 18:45'])).rename('DATE')
+    end = pd.Timestamp(end)
+    result = freq.aggregation_index(dates, end)
+    expected = pd.DatetimeIndex([freq.aggregation_func(end)(date) for date in dates], name='DATE')
+    pd.testing.assert_index_equal(result, expected)
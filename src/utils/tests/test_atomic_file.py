@@ -0,0 +1,48 @@
+import multiprocessing
+import time
+from pathlib import Path
+
+import pytest
+
+from utils import atomic_file
+
+
+def test_atomic_write(tmpdir):
+    path = Path(tmpdir) / 'data.bin'
+    with atomic_file.atomic_write(path) as file:
+        file.write(b'old')
+    with pytest.raises(RuntimeError):
+        with atomic_file.atomic_write(path) as file:
+            file.write(b'new')
+            raise RuntimeError
+    assert path.read_bytes() == b'old'
+    assert [file.name for file in Path(tmpdir).iterdir()] == ['data.bin']
+
+
+def test_reentrant_lock(tmpdir):
+    path = Path(tmpdir) / 'data.bin'
+    with atomic_file.file_lock(path):
+        with atomic_file.file_lock(path):
+            pass
+    assert atomic_file.lock_path(path).name == '.data.bin.lock'
+
+
+def hold_lock(path, started):
+    with atomic_file.file_lock(path):
+        started.set()
+        time.sleep(0.5)
+
+
+def test_process_lock(tmpdir):
+    if atomic_file.fcntl is None:
+        pytest.skip('Блокировки между процессами не поддерживаются')
+    path = Path(tmpdir) / 'data.bin'
+    context = multiprocessing.get_context('fork')
+    started = context.Event()
+    process = context.Process(target=hold_lock, args=(path, started))
+    process.start()
+    started.wait()
+    time0 = time.time()
+    with atomic_file.file_lock(path):
+        assert time.time() - time0 > 0.2
+    process.join()
@@ -0,0 +1,207 @@
+import pickle
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import settings
+from utils import columnar_file
+from utils.columnar_file import ColumnarDataFile, columnar_store, migrate
+from utils.data import Data
+from utils.data_manager import AbstractDataManager
+
+
+@pytest.fixture(autouse=True)
+def make_temp_dir(tmpdir):
+    saved_path = settings.DATA_PATH
+    settings.DATA_PATH = Path(tmpdir)
+    yield
+    settings.DATA_PATH = saved_path
+
+
+def make_df(start, periods, volume_start=0):
+    index = pd.DatetimeIndex(pd.date_range(start, periods=periods, freq='B').values, name='DATE')
+    return pd.DataFrame(data={'CLOSE_PRICE': np.arange(periods) + 0.5,
+                              'VOLUME': np.arange(volume_start, volume_start + periods)},
+                        index=index)
+
+
+def test_no_data():
+    data = ColumnarDataFile('quotes', 'AKRN')
+    assert data.value is None
+    assert data.last_update is None
+    assert data.data_path == settings.DATA_PATH / 'quotes.columns'
+
+
+def test_write_read():
+    df = make_df('2018-01-01', 10)
+    time0 = time.time()
+    data = ColumnarDataFile('quotes', 'AKRN')
+    data.value = df
+    assert data.last_update >= time0
+    pd.testing.assert_frame_equal(ColumnarDataFile('quotes', 'AKRN').value, df)
+    assert ColumnarDataFile('quotes', 'AKRN').value['VOLUME'].dtype == np.int64
+
+
+def test_append_and_rewrite():
+    data = ColumnarDataFile('quotes', 'AKRN')
+    data.value = make_df('2018-01-01', 10)
+    other = ColumnarDataFile('quotes', 'GMKN')
+    other.value = make_df('2017-01-02', 3, 100)
+    data.append(make_df('2018-01-15', 2, 7))
+    store = columnar_store('quotes')
+    assert store.segments('AKRN') == [(0, 10), (13, 15)]
+    expected = pd.concat([make_df('2018-01-01', 10), make_df('2018-01-15', 2, 7)])
+    pd.testing.assert_frame_equal(data.value, expected)
+    data.value = make_df('2018-02-01', 3)
+    pd.testing.assert_frame_equal(data.value, make_df('2018-02-01', 3))
+    pd.testing.assert_frame_equal(other.value, make_df('2017-01-02', 3, 100))
+    # Перезапись оставила 12 не используемых строк из 18, поэтому хранилище сжато
+    assert store.rows == 6
+    assert store.generation == 1
+    assert store.segments('AKRN') == [(0, 3)]
+    assert store.segments('GMKN') == [(3, 6)]
+    # Файлы предыдущего поколения сохраняются для читателей со старым заголовком до следующего сжатия
+    assert sorted(file.name for file in store.path.glob(f'*{columnar_file.COLUMN_EXTENSION}')) == [
+        'CLOSE_PRICE.1.bin', 'CLOSE_PRICE.bin', 'VOLUME.1.bin', 'VOLUME.bin', '_index.1.bin', '_index.bin']
+    store.compact()
+    assert store.generation == 2
+    pd.testing.assert_frame_equal(data.value, make_df('2018-02-01', 3))
+    assert sorted(file.name for file in store.path.glob(f'*{columnar_file.COLUMN_EXTENSION}')) == [
+        'CLOSE_PRICE.1.bin', 'CLOSE_PRICE.2.bin', 'VOLUME.1.bin', 'VOLUME.2.bin', '_index.1.bin', '_index.2.bin']
+
+
+def test_write_keeps_header_until_saved(monkeypatch):
+    store = columnar_store('quotes')
+    store.write('AKRN', make_df('2018-01-01', 10))
+    seen = []
+    write_rows = store._write_rows
+
+    def read_during_write(header, df):
+        seen.append(store.read('AKRN'))
+        return write_rows(header, df)
+
+    monkeypatch.setattr(store, '_write_rows', read_during_write)
+    store.write('AKRN', make_df('2018-02-01', 3))
+    pd.testing.assert_frame_equal(seen[0], make_df('2018-01-01', 10))
+    pd.testing.assert_frame_equal(store.read('AKRN'), make_df('2018-02-01', 3))
+
+
+def test_compact_by_segments(monkeypatch):
+    monkeypatch.setattr(columnar_file, 'MAX_SEGMENTS', 2)
+    data = ColumnarDataFile('quotes', 'AKRN')
+    data.value = make_df('2018-01-01', 1)
+    version = columnar_store('quotes').version
+    for day in range(2, 5):
+        data.append(make_df(f'2018-02-0{day}', 1, day))
+    store = columnar_store('quotes')
+    assert store.segments('AKRN') == [(0, 3), (3, 4)]
+    assert store.version != version
+    assert data.value['VOLUME'].tolist() == [0, 2, 3, 4]
+
+
+def test_uncommitted_rows_ignored():
+    data = ColumnarDataFile('quotes', 'AKRN')
+    data.value = make_df('2018-01-01', 5)
+    store = columnar_store('quotes')
+    with open(store.path / 'CLOSE_PRICE.bin', 'ab') as file:
+        file.write(b'garbage')
+    data.append(make_df('2018-01-08', 1, 5))
+    assert (store.path / 'CLOSE_PRICE.bin').stat().st_size == 6 * 8
+    assert data.value['CLOSE_PRICE'].tolist() == [0.5, 1.5, 2.5, 3.5, 4.5, 0.5]
+
+
+def test_empty_frame():
+    data = ColumnarDataFile('quotes', 'AKRN')
+    data.value = make_df('2018-01-01', 5)
+    empty = ColumnarDataFile('quotes', 'KUNF')
+    empty.value = pd.DataFrame()
+    assert empty.last_update is not None
+    assert empty.value.empty
+    assert list(empty.value.columns) == ['CLOSE_PRICE', 'VOLUME']
+
+
+def test_wrong_columns():
+    ColumnarDataFile('quotes', 'AKRN').value = make_df('2018-01-01', 5)
+    with pytest.raises(ValueError) as error_info:
+        ColumnarDataFile('quotes', 'GMKN').value = make_df('2018-01-01', 5)[['VOLUME']]
+    assert 'не соответствуют колонкам хранилища' in str(error_info.value)
+
+
+def test_migrate():
+    for name, df in [('AKRN', make_df('2018-01-01', 5)), ('GMKN', make_df('2018-01-03', 3, 10))]:
+        folder = settings.DATA_PATH / name
+        folder.mkdir()
+        data = Data(df)
+        with open(folder / 'quotes.pickle4', 'wb') as file:
+            pickle.dump(data, file)
+    assert migrate('quotes') == ('AKRN', 'GMKN')
+    columnar_file._STORES.clear()
+    data = ColumnarDataFile('quotes', 'GMKN')
+    pd.testing.assert_frame_equal(data.value, make_df('2018-01-03', 3, 10))
+    assert data.last_update < time.time()
+
+
+def test_data_manager_update_appends():
+    class DataManager(AbstractDataManager):
+        data_file_class = ColumnarDataFile
+
+        def download_all(self):
+            return make_df('2018-01-01', 5)
+
+        def download_update(self):
+            return make_df('2018-01-05', 3, 4).assign(CLOSE_PRICE=[4.5, 5.5, 6.5])
+
+    data = DataManager('quotes', 'AKRN')
+    data.update()
+    assert columnar_store('quotes').segments('AKRN') == [(0, 5), (5, 7)]
+    assert data.value['CLOSE_PRICE'].tolist() == [0.5, 1.5, 2.5, 3.5, 4.5, 5.5, 6.5]
+    assert data.value.index.is_monotonic_increasing
+
+
+def test_header_reloaded_from_other_process():
+    data = ColumnarDataFile('quotes', 'AKRN')
+    data.value = make_df('2018-01-01', 5)
+    other = columnar_file.ColumnarStore('quotes')
+    other.append('AKRN', make_df('2018-01-08', 2, 5))
+    assert columnar_store('quotes').rows == 7
+    assert len(ColumnarDataFile('quotes', 'AKRN').value) == 7
+    assert [file.name for file in data.data_path.iterdir() if file.name.startswith('.')] == []
+
+
+def test_update_skipped_if_updated_by_other_process():
+    updates = []
+
+    class DataManager(AbstractDataManager):
+        data_file_class = ColumnarDataFile
+
+        def download_all(self):
+            return make_df('2018-01-01', 5)
+
+        def download_update(self):
+            updates.append(self.data_name)
+            return make_df('2018-01-05', 3, 4).assign(CLOSE_PRICE=[4.5, 5.5, 6.5])
+
+    data = DataManager('quotes', 'AKRN')
+    columnar_file.ColumnarStore('quotes').append('AKRN', make_df('2018-01-08', 2, 5))
+    data.update()
+    assert updates == []
+    assert len(data.value) == 7
+
+
+def test_data_manager_validates_overlap_only():
+    class DataManager(AbstractDataManager):
+        data_file_class = ColumnarDataFile
+
+        def download_all(self):
+            return make_df('2018-01-01', 5)
+
+        def download_update(self):
+            return make_df('2018-01-05', 2, 4).assign(CLOSE_PRICE=[4.5, 5.5])
+
+    data = DataManager('quotes', 'AKRN')
+    assert data._overlap(data.value, make_df('2018-01-05', 2)).index.tolist() == [pd.Timestamp('2018-01-05')]
+    data.update()
+    assert data.value['VOLUME'].tolist() == [0, 1, 2, 3, 4, 5]
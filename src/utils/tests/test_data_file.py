@@ -1,9 +1,13 @@
+import pickle
 import time
 from pathlib import Path
 
+import pandas as pd
 import pytest
 
 import settings
+from utils import data_file
+from utils.data import Data
 from utils.data_file import DataFile
 
 DATA_SPEC = (None, 'test')
@@ -53,3 +57,101 @@ def test_data_path_no_cat():
 def test_str():
     result = 'DataFile(data_category=cat2, data_name=data3, data=Data(value=None, last_update=None))'
     assert str(DataFile('cat2', 'data3')) == result
+
+
+def test_header():
+    data = DataFile('cat3', 'data4')
+    df = pd.DataFrame({'col': [1.0, 2.0]}, index=pd.DatetimeIndex(['2018-03-01', '2018-03-05'], name='DATE'))
+    data.value = df
+    header = DataFile('cat3', 'data4').header
+    assert header['rows'] == 2
+    assert header['index_start'] == '2018-03-01 00:00:00'
+    assert header['index_stop'] == '2018-03-05 00:00:00'
+    assert header['last_update'] == data.last_update
+    data.value = df * 2
+    assert data.header['schema'] == header['schema']
+    data.value = df.astype(int)
+    assert data.header['schema'] != header['schema']
+
+
+def test_lazy_value():
+    data = DataFile('cat3', 'data5')
+    data.value = pd.Series([1, 2])
+    last_update = data.last_update
+    with open(data.data_path, 'r+b') as file:
+        file.seek(data_file.BODY_START)
+        file.truncate()
+    data = DataFile('cat3', 'data5')
+    assert data.last_update == last_update
+    with pytest.raises(EOFError):
+        print(data.value)
+
+
+def test_legacy_file():
+    path = DataFile('cat3', 'data6').data_path
+    legacy = Data(42)
+    with open(path, 'wb') as file:
+        pickle.dump(legacy, file)
+    data = DataFile('cat3', 'data6')
+    assert data.value == 42
+    assert data.last_update == legacy.last_update
+    data.value = 24
+    with open(path, 'rb') as file:
+        assert file.read(len(data_file.MAGIC)) == data_file.MAGIC
+    assert DataFile('cat3', 'data6').value == 24
+
+
+def make_df(start, periods):
+    return pd.DataFrame({'col': range(periods)}, index=pd.date_range(start, periods=periods, name='DATE'))
+
+
+def test_append_delta():
+    data = DataFile('cat4', 'data1')
+    data.value = make_df('2018-03-01', 3)
+    size = data.data_path.stat().st_size
+    data.append(make_df('2018-03-04', 2))
+    header = data.header
+    assert header['deltas'] == 1
+    assert header['rows'] == 5
+    assert header['index_stop'] == '2018-03-05 00:00:00'
+    assert size < header['length'] == data.data_path.stat().st_size
+    loaded = DataFile('cat4', 'data1')
+    assert loaded.last_update == data.last_update
+    assert loaded.value.equals(pd.concat([make_df('2018-03-01', 3), make_df('2018-03-04', 2)]))
+
+
+def test_append_compaction(monkeypatch):
+    monkeypatch.setattr(data_file, 'MAX_DELTAS', 2)
+    data = DataFile('cat4', 'data2')
+    data.value = make_df('2018-03-01', 1)
+    for day in range(2, 6):
+        data.append(make_df(f'2018-03-0{day}', 1))
+    assert data.header['deltas'] == 1
+    assert DataFile('cat4', 'data2').value['col'].tolist() == [0] * 5
+    last_update = data.last_update
+    data.compact()
+    assert data.header['deltas'] == 0
+    assert DataFile('cat4', 'data2').last_update == last_update
+
+
+def test_torn_header_write():
+    data = DataFile('cat4', 'data3')
+    data.value = make_df('2018-03-01', 3)
+    data.append(make_df('2018-03-04', 1))
+    with open(data.data_path, 'r+b') as file:
+        file.seek(len(data_file.MAGIC) + data_file.SLOT_SIZE + 20)
+        file.write(b'garbage')
+    loaded = DataFile('cat4', 'data3')
+    assert loaded.header['deltas'] == 0
+    assert loaded.value.equals(make_df('2018-03-01', 3))
+
+
+def test_corrupted_header():
+    data = DataFile('cat4', 'data4')
+    data.value = make_df('2018-03-01', 3)
+    with open(data.data_path, 'r+b') as file:
+        for start in (0, data_file.SLOT_SIZE):
+            file.seek(len(data_file.MAGIC) + start + 20)
+            file.write(b'garbage')
+    with pytest.raises(ValueError, match=str(data.data_path)):
+        DataFile('cat4', 'data4').header
@@ -143,3 +143,47 @@ def test_utcoffset(data_manager_class):
     data = data_manager_class('cat8', 'data5')
     assert data.last_update.utcoffset().seconds == 10800
     assert data.next_update.utcoffset().seconds == 10800
+
+
+def test_update_modes(monkeypatch):
+    class DataManager(data_manager.AbstractDataManager):
+        def download_all(self):
+            return pd.Series(data=[1, 2], index=[1, 2])
+
+        def download_update(self):
+            return pd.Series(data=[2, 3], index=[2, 3])
+
+    DataManager('cat9', 'data1')
+    time = arrow.now().shift(days=1).replace(hour=20)
+    monkeypatch.setattr(arrow, 'now', lambda: time)
+
+    monkeypatch.setattr(settings, 'UPDATE_MODE', 'offline')
+    assert DataManager('cat9', 'data1').value.tolist() == [1, 2]
+    assert DataManager('cat9', 'data2').value.tolist() == [1, 2]
+
+    monkeypatch.setattr(settings, 'UPDATE_MODE', 'background')
+    DataManager('cat9', 'data1')
+    data_manager.background_refresher().join()
+    assert DataManager('cat9', 'data1').value.tolist() == [1, 2, 3]
+
+    monkeypatch.setattr(settings, 'UPDATE_MODE', 'async')
+    with pytest.raises(ValueError) as error_info:
+        DataManager('cat9', 'data2')
+    assert 'Некорректный режим обновления данных async' == str(error_info.value)
+
+
+def test_not_deferred_update(monkeypatch):
+    class DataManager(data_manager.AbstractDataManager):
+        deferred_update = False
+
+        def download_all(self):
+            return pd.Series(data=[1, 2], index=[1, 2])
+
+        def download_update(self):
+            return pd.Series(data=[2, 3], index=[2, 3])
+
+    DataManager('cat9', 'data3')
+    time = arrow.now().shift(days=1).replace(hour=20)
+    monkeypatch.setattr(arrow, 'now', lambda: time)
+    monkeypatch.setattr(settings, 'UPDATE_MODE', 'offline')
+    assert DataManager('cat9', 'data3').value.tolist() == [1, 2, 3]
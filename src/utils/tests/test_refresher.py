@@ -0,0 +1,46 @@
+import threading
+
+from utils.refresher import BackgroundRefresher
+
+
+class Manager:
+    def __init__(self, name, event=None, error=None):
+        self.data_category = 'cat'
+        self.data_name = name
+        self.updates = 0
+        self._event = event
+        self._error = error
+
+    def update(self):
+        if self._event is not None:
+            self._event.wait()
+        if self._error is not None:
+            raise self._error
+        self.updates += 1
+
+
+def test_submit_once():
+    refresher = BackgroundRefresher()
+    event = threading.Event()
+    manager = Manager('data1', event)
+    assert refresher.submit(manager)
+    assert not refresher.submit(Manager('data1'))
+    assert refresher.pending == (('cat', 'data1'),)
+    event.set()
+    refresher.join()
+    assert manager.updates == 1
+    assert refresher.pending == ()
+    assert refresher.submit(manager)
+    refresher.join()
+    assert manager.updates == 2
+
+
+def test_errors():
+    refresher = BackgroundRefresher()
+    error = ValueError('Нет данных')
+    refresher.submit(Manager('data2', error=error))
+    manager = Manager('data3')
+    refresher.submit(manager)
+    refresher.join()
+    assert refresher.errors == [(('cat', 'data2'), error)]
+    assert manager.updates == 1
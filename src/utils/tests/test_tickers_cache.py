@@ -0,0 +1,106 @@
+import pandas as pd
+import pytest
+
+from utils.tickers_cache import TickersCache, tickers_cache
+
+HISTORY = {'AKRN': pd.Series([1.0, 2.0], index=[1, 2]),
+           'GMKN': pd.Series([3.0], index=[3]),
+           'MTSS': pd.Series([4.0, 5.0], index=[2, 3])}
+
+
+def test_columns_cache_equals_function():
+    calls = []
+
+    def wide(tickers):
+        calls.append(tickers)
+        df = pd.concat([HISTORY[ticker] for ticker in tickers], axis=1)
+        df.columns = tickers
+        return df
+
+    cached = TickersCache(wide)
+    for tickers in [('AKRN', 'GMKN'), ('AKRN', 'GMKN', 'MTSS'), ('MTSS', 'AKRN', 'MTSS')]:
+        pd.testing.assert_frame_equal(cached(tickers), wide(tickers))
+    assert calls.count(('MTSS',)) == 1
+    assert calls.count(('AKRN',)) == 1
+    info = cached.cache_info()
+    assert info.misses == 3
+    assert info.column_misses == 3
+    assert info.column_hits == 4
+    cached(('AKRN', 'GMKN'))
+    assert cached.cache_info().hits == 1
+
+
+def test_index_cache():
+    calls = []
+
+    @tickers_cache(axis='index')
+    def lot_size(tickers):
+        calls.append(tickers)
+        return pd.Series([len(ticker) for ticker in tickers], index=list(tickers), name='LOT_SIZE')
+
+    assert lot_size(('AKRN', 'GMKN')).tolist() == [4, 4]
+    result = lot_size(('GMKN', 'MOEX'))
+    assert result.index.tolist() == ['GMKN', 'MOEX']
+    assert result.name == 'LOT_SIZE'
+    assert calls == [('AKRN', 'GMKN'), ('MOEX',)]
+
+
+def test_eviction():
+    cached = TickersCache(lambda tickers: pd.Series(range(1000), name=tickers[0]).to_frame(), max_bytes=20000)
+    cached(('AKRN',))
+    cached(('GMKN',))
+    info = cached.cache_info()
+    assert info.currsize <= 20000
+    cached(('AKRN',))
+    assert cached.cache_info().column_misses == 3
+
+
+def test_cache_clear():
+    cached = TickersCache(lambda tickers: pd.DataFrame({tickers[0]: [1]}))
+    cached(('AKRN',))
+    cached.cache_clear()
+    assert cached.cache_info() == (0, 0, 0, 0, 0, cached.cache_info().maxsize)
+
+
+def test_wrong_axis():
+    with pytest.raises(ValueError):
+        TickersCache(len, axis='rows')
+
+
+def test_batch_columns():
+    calls = []
+
+    @tickers_cache(batch=True)
+    def wide(tickers):
+        calls.append(tickers)
+        df = pd.concat([HISTORY[ticker] for ticker in tickers], axis=1)
+        df.columns = tickers
+        return df
+
+    pd.testing.assert_frame_equal(wide(('AKRN', 'GMKN')), pd.concat([HISTORY['AKRN'], HISTORY['GMKN']], axis=1,
+                                                                    keys=['AKRN', 'GMKN']))
+    result = wide(('MTSS', 'AKRN'))
+    assert sorted(result.index) == [1, 2, 3]
+    assert result['AKRN'].dropna().sort_index().tolist() == [1.0, 2.0]
+    assert calls == [('AKRN', 'GMKN'), ('MTSS',)]
+
+
+def test_batch_full_result_and_version():
+    calls = []
+    version = [0]
+    frames = []
+
+    @tickers_cache(batch=True, version=lambda: version[0])
+    def wide(tickers):
+        calls.append(tickers)
+        df = pd.concat([HISTORY[ticker] for ticker in tickers], axis=1)
+        df.columns = tickers
+        frames.append(df)
+        return df
+
+    assert wide(('AKRN', 'MTSS')) is frames[-1]
+    wide(('AKRN', 'MTSS'))
+    assert calls == [('AKRN', 'MTSS')]
+    version[0] = 1
+    wide(('AKRN', 'MTSS'))
+    assert calls == [('AKRN', 'MTSS')] * 2
@@ -0,0 +1,79 @@
+import pandas as pd
+
+from utils.versioned_cache import versioned_property, cache_clear
+
+
+class Versioned:
+    def __init__(self):
+        self.version = 0
+        self.calls = 0
+
+    @versioned_property
+    def value(self):
+        """Значение"""
+        self.calls += 1
+        return pd.Series([self.version, self.calls])
+
+
+class Child(Versioned):
+    @versioned_property
+    def value(self):
+        return super().value * 10
+
+
+def test_versioned_property():
+    obj = Versioned()
+    assert obj.value.tolist() == [0, 1]
+    assert obj.value.tolist() == [0, 1]
+    assert obj.calls == 1
+    obj.version += 1
+    assert obj.value.tolist() == [1, 2]
+    assert obj.calls == 2
+    assert Versioned.value.__doc__ == 'Значение'
+
+
+def test_instances_are_independent():
+    first = Versioned()
+    second = Versioned()
+    for _ in range(3):
+        assert first.value.tolist() == [0, 1]
+        assert second.value.tolist() == [0, 1]
+    assert first.calls == second.calls == 1
+
+
+def test_copy_on_access():
+    obj = Versioned()
+    obj.value[0] = 100
+    assert obj.value[0] == 0
+
+
+def test_override():
+    obj = Child()
+    assert obj.value.tolist() == [0, 10]
+    assert obj.value.tolist() == [0, 10]
+    assert obj.calls == 1
+
+
+def test_cache_clear():
+    obj = Versioned()
+    assert obj.value[1] == 1
+    cache_clear(obj)
+    assert obj.value[1] == 2
+
+
+class PartlyVersioned(Versioned):
+    data_version = 0
+
+    @versioned_property(version='data_version')
+    def data(self):
+        self.calls += 1
+        return self.calls
+
+
+def test_version_attribute():
+    obj = PartlyVersioned()
+    assert obj.data == 1
+    obj.version += 1
+    assert obj.data == 1
+    obj.data_version += 1
+    assert obj.data == 2
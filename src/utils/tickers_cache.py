@@ -0,0 +1,167 @@
+"""Кэш функций, принимающих кортеж тикеров и возвращающих данные по каждому тикеру"""
+import collections
+import functools
+
+import pandas as pd
+
+# Максимальный объем памяти, занимаемый одним кэшем, в байтах
+MAX_BYTES = 2 ** 28
+
+CacheInfo = collections.namedtuple('CacheInfo', 'hits misses column_hits column_misses currsize maxsize')
+
+
+def _nbytes(value):
+    """Объем памяти, занимаемый Series или DataFrame"""
+    usage = value.memory_usage(deep=True)
+    if isinstance(usage, pd.Series):
+        return int(usage.sum())
+    return int(usage)
+
+
+class TickersCache:
+    """Кэш для функции от кортежа тикеров с вытеснением давно не используемых данных при превышении объема памяти
+
+    Хранятся как готовые результаты для кортежей тикеров, так и данные по отдельным тикерам. При отсутствии результата
+    для кортежа он собирается из данных отдельных тикеров, а исходная функция вызывается только для тикеров, данных по
+    которым нет в кэше. Поэтому разные наборы тикеров, например, портфели с одним добавленным тикером, не приводят к
+    повторному расчету данных для всех тикеров
+
+    Функция должна возвращать DataFrame с тикерами в столбцах (axis='columns') или Series с тикерами в индексе
+    (axis='index'). Для DataFrame функция вызывается для каждого тикера отдельно, чтобы данные тикера содержали только
+    его строки и сборка совпадала с результатом для всего кортежа. Если функция эффективно загружает данные сразу для
+    многих тикеров, а строками тикера являются строки с его значениями (batch=True), то она вызывается один раз для всех
+    недостающих тикеров, а если в кэше нет ни одного тикера, то ее результат возвращается без пересборки
+
+    Если задана функция версии исходных данных, то при изменении версии кэш очищается
+    """
+
+    @staticmethod
+    def _split(result, ticker):
+        """Данные тикера из результата для многих тикеров по умолчанию - строки с его значениями"""
+        return result[[ticker]].dropna(how='all')
+
+
+    def __init__(self, func, axis: str = 'columns', max_bytes: int = MAX_BYTES, batch: bool = False, version=None,
+                 split=None):
+        """
+        Parameters
+        ----------
+        func
+            Кэшируемая функция от кортежа тикеров
+        axis
+            'columns' - тикеры в столбцах DataFrame, 'index' - тикеры в индексе Series
+        max_bytes
+            Максимальный объем памяти, занимаемый кэшем
+        batch
+            Вызывать ли функцию для DataFrame один раз для всех недостающих тикеров
+        version
+            Функция без аргументов, возвращающая версию исходных данных - по умолчанию данные не меняются
+        split
+            Функция от результата для многих тикеров и тикера, возвращающая данные тикера в режиме batch - по
+            умолчанию строки с его значениями
+        """
+        if axis not in ('columns', 'index'):
+            raise ValueError(f'Некорректная ось {axis}')
+        self._func = func
+        self._axis = axis
+        self._max_bytes = max_bytes
+        self._batch = batch
+        self._version = version
+        if split is not None:
+            self._split = split
+        self._seen_version = None
+        self._entries = collections.OrderedDict()
+        self._size = 0
+        self._hits = self._misses = self._column_hits = self._column_misses = 0
+        functools.update_wrapper(self, func)
+
+    def _check_version(self):
+        """Очищает кэш, если изменилась версия исходных данных"""
+        if self._version is None:
+            return
+        version = self._version()
+        if version != self._seen_version:
+            self._entries.clear()
+            self._size = 0
+            self._seen_version = version
+
+    def __call__(self, tickers: tuple):
+        self._check_version()
+        key = ('result', tuple(tickers))
+        if key in self._entries:
+            self._hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key][0]
+        self._misses += 1
+        pieces, result = self._pieces(tuple(tickers))
+        if result is not None:
+            result = result[list(tickers)] if list(result.columns) != list(tickers) else result
+        elif self._axis == 'columns':
+            result = pd.concat([pieces[ticker] for ticker in tickers], axis='columns')
+        else:
+            result = pd.concat([pieces[ticker] for ticker in tickers])
+        if self._version is not None:
+            # Функция могла обновить исходные данные только для запрошенных тикеров
+            self._seen_version = self._version()
+        self._put(key, result)
+        return result
+
+    def _pieces(self, tickers: tuple):
+        """Словарь с данными для отдельных тикеров - недостающие рассчитываются
+
+        Вторым значением возвращается результат функции, если он получен сразу для всех тикеров в режиме batch, иначе
+        None
+        """
+        pieces = {}
+        full_result = None
+        missing = []
+        for ticker in dict.fromkeys(tickers):
+            key = ('ticker', ticker)
+            if key in self._entries:
+                self._column_hits += 1
+                self._entries.move_to_end(key)
+                pieces[ticker] = self._entries[key][0]
+            else:
+                self._column_misses += 1
+                missing.append(ticker)
+        if missing and self._axis == 'columns' and self._batch:
+            result = self._func(tuple(missing))
+            for ticker in missing:
+                pieces[ticker] = self._split(result, ticker)
+            if len(missing) == len(pieces):
+                full_result = result
+        elif missing and self._axis == 'columns':
+            for ticker in missing:
+                pieces[ticker] = self._func((ticker,))
+        elif missing:
+            result = self._func(tuple(missing))
+            for ticker in missing:
+                pieces[ticker] = result.loc[[ticker]]
+        for ticker in missing:
+            self._put(('ticker', ticker), pieces[ticker])
+        return pieces, full_result
+
+    def _put(self, key, value):
+        """Добавляет значение в кэш и вытесняет давно не используемые при превышении объема"""
+        size = _nbytes(value)
+        self._entries[key] = (value, size)
+        self._size += size
+        while self._size > self._max_bytes and len(self._entries) > 1:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self._size -= evicted_size
+
+    def cache_info(self):
+        """Статистика использования кэша"""
+        return CacheInfo(self._hits, self._misses, self._column_hits, self._column_misses, self._size,
+                         self._max_bytes)
+
+    def cache_clear(self):
+        """Очищает кэш и статистику"""
+        self._entries.clear()
+        self._size = 0
+        self._hits = self._misses = self._column_hits = self._column_misses = 0
+
+
+def tickers_cache(axis: str = 'columns', max_bytes: int = MAX_BYTES, batch: bool = False, version=None, split=None):
+    """Декоратор для кэширования функции от кортежа тикеров с помощью TickersCache"""
+    return functools.partial(TickersCache, axis=axis, max_bytes=max_bytes, batch=batch, version=version, split=split)
@@ -0,0 +1,51 @@
+"""Кэширование свойств объектов, зависящих от изменяемых данных"""
+import pandas as pd
+
+# Атрибут экземпляра, в котором хранятся кэшированные значения
+CACHE_ATTRIBUTE = '_versioned_cache'
+
+
+class versioned_property:
+    """Свойство, значение которого вычисляется один раз для каждой версии данных экземпляра
+
+    Экземпляр должен иметь атрибут version, который изменяется при изменении данных, влияющих на значения свойств.
+    Кэш хранится в самом экземпляре, поэтому удаляется вместе с ним и не вытесняется при одновременной работе с многими
+    объектами одного класса, в отличие от lru_cache на методах. Для Series и DataFrame возвращается копия значения,
+    чтобы его изменение вызывающим кодом не портило кэш
+
+    Если свойство зависит только от части данных, то можно указать другой атрибут версии:
+    @versioned_property(version='portfolio_version')
+    """
+
+    def __init__(self, func=None, *, version: str = 'version'):
+        self._version = version
+        self._func = None
+        self._name = None
+        if func is not None:
+            self(func)
+
+    def __call__(self, func):
+        self._func = func
+        # Ключ включает имя класса, чтобы переопределенное свойство и свойство базового класса не смешивались
+        self._name = func.__qualname__
+        self.__doc__ = func.__doc__
+        return self
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        version = getattr(instance, self._version)
+        cache = instance.__dict__.setdefault(CACHE_ATTRIBUTE, {})
+        if self._name in cache and cache[self._name][0] == version:
+            value = cache[self._name][1]
+        else:
+            value = self._func(instance)
+            cache[self._name] = (version, value)
+        if isinstance(value, (pd.Series, pd.DataFrame)):
+            return value.copy()
+        return value
+
+
+def cache_clear(instance):
+    """Удаляет все кэшированные значения свойств экземпляра"""
+    instance.__dict__.pop(CACHE_ATTRIBUTE, None)
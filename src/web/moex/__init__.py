@@ -4,3 +4,4 @@ from web.moex.iss_quotes import quotes
 from web.moex.iss_quotes_t2 import quotes_t2
 from web.moex.iss_securities_info import securities_info
 from web.moex.iss_tickers import reg_number_tickers
+from web.moex.iss_bulk import BulkDownloader
@@ -0,0 +1,259 @@
+"""Параллельная загрузка данных с http://iss.moex.com с переиспользованием соединений"""
+import http.client
+import json
+import ssl
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib import parse
+
+import pandas as pd
+
+from web.labels import CLOSE_PRICE, DATE, TICKER, VOLUME
+from web.moex import iss_quotes, iss_quotes_t2, iss_tickers
+
+ISS_URL = 'https://iss.moex.com/iss/'
+
+# Максимальное количество одновременных запросов к серверу
+MAX_WORKERS = 8
+# Количество попыток загрузки и задержка перед первой повторной попыткой в секундах - далее удваивается
+RETRIES = 5
+BACKOFF = 1.0
+# Время ожидания ответа сервера в секундах
+TIMEOUT = 60
+
+# Сертификаты не проверяются, как и при постраничной загрузке котировок
+SSL_CONTEXT = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+SSL_CONTEXT.check_hostname = False
+SSL_CONTEXT.verify_mode = ssl.CERT_NONE
+
+QUOTES_PATH = 'history/engines/stock/markets/shares/securities/{ticker}.json'
+QUOTES_T2_PATH = 'history/engines/stock/markets/shares/boards/TQBR/securities/{ticker}.json'
+REG_NUMBER_PATH = 'securities.json'
+# История торгов всех бумаг за одну дату
+QUOTES_BY_DATE_PATH = 'history/engines/stock/markets/shares/securities.json'
+QUOTES_T2_BY_DATE_PATH = 'history/engines/stock/markets/shares/boards/TQBR/securities.json'
+
+
+class ConnectionPool:
+    """Пул keep-alive соединений с сервером
+
+    У каждого потока свое соединение, которое используется для всех его запросов. При ошибках соединение
+    пересоздается, а запрос повторяется с экспоненциально растущей задержкой
+    """
+
+    def __init__(self, base_url: str = ISS_URL):
+        url = parse.urlsplit(base_url)
+        self._scheme = url.scheme
+        self._host = url.netloc
+        self._base_path = url.path
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            if self._scheme == 'https':
+                connection = http.client.HTTPSConnection(self._host, timeout=TIMEOUT, context=SSL_CONTEXT)
+            else:
+                connection = http.client.HTTPConnection(self._host, timeout=TIMEOUT)
+            self._local.connection = connection
+        return connection
+
+    def _close(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    def get_json(self, path: str, **query):
+        """Загружает json по пути относительно базового url с параметрами запроса"""
+        url = self._base_path + path
+        if query:
+            url += '?' + parse.urlencode(query)
+        delay = BACKOFF
+        for attempt in range(RETRIES):
+            try:
+                connection = self._connection()
+                connection.request('GET', url, headers={'Connection': 'keep-alive'})
+                response = connection.getresponse()
+                body = response.read()
+                if response.status >= 500:
+                    raise http.client.HTTPException(f'Ошибка сервера {response.status} для {url}')
+                if response.status != 200:
+                    raise ValueError(f'Некорректный ответ {response.status} для {url}')
+                return json.loads(body)
+            except (OSError, http.client.HTTPException) as error:
+                self._close()
+                if attempt == RETRIES - 1:
+                    raise error
+                time.sleep(delay)
+                delay *= 2
+
+
+class BulkDownloader:
+    """Параллельная загрузка историй котировок для множества тикеров
+
+    Сначала одновременно загружаются первые страницы всех тикеров, из которых определяется общее количество
+    страниц, после чего одновременно загружаются все оставшиеся страницы. Количество одновременных запросов
+    ограничено количеством потоков. Потоки и их соединения используются повторно между загрузками до вызова close
+    """
+
+    def __init__(self, base_url: str = ISS_URL, max_workers: int = MAX_WORKERS):
+        self._pool = ConnectionPool(base_url)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """Завершает потоки загрузки"""
+        self._executor.shutdown()
+
+    def map(self, func, *iterables):
+        """Применяет функцию к элементам с ограничением количества одновременных вызовов"""
+        return list(self._executor.map(func, *iterables))
+
+    def get_json(self, path: str, **query):
+        """Загружает json через пул соединений"""
+        return self._pool.get_json(path, **query)
+
+    def _page(self, path: str, query: dict, start: int):
+        return self.get_json(path, start=start, **query)
+
+    def history(self, paths: list, query: dict = None):
+        """Загружает все страницы блока history для каждого пути
+
+        Returns
+        -------
+        list
+            Для каждого пути список страниц в формате словарей с ключами 'data' и 'columns'
+        """
+        query = query or {}
+        return self._history([(path, query) for path in paths])
+
+    def _history(self, requests: list):
+        """Загружает все страницы блока history для каждой пары из пути и параметров запроса"""
+        first_pages = self.map(lambda request: self._page(*request, 0), requests)
+        tasks = []
+        for number, (request, page) in enumerate(zip(requests, first_pages)):
+            total, page_size = _cursor(page)
+            if page_size:
+                tasks.extend((number, start) for start in range(page_size, total, page_size))
+        other_pages = self.map(lambda task: self._page(*requests[task[0]], task[1]), tasks)
+        blocks = [[_history_block(page)] for page in first_pages]
+        for (number, start), page in zip(tasks, other_pages):
+            blocks[number].append(_history_block(page))
+        for number, (request, page) in enumerate(zip(requests, first_pages)):
+            if _cursor(page)[1] is None:
+                blocks[number].extend(self._sequential_pages(*request, len(page['history']['data'])))
+        return [[block for block in request_blocks if block['data']] for request_blocks in blocks]
+
+    def _sequential_pages(self, path, query, start):
+        """Последовательная загрузка страниц при отсутствии в ответе информации о их количестве"""
+        while start:
+            block = _history_block(self._page(path, query, start))
+            if not block['data']:
+                break
+            start += len(block['data'])
+            yield block
+
+    def quotes(self, tickers: tuple, start=None):
+        """Истории котировок для тикеров
+
+        Parameters
+        ----------
+        tickers
+            Кортеж тикеров
+        start : pd.Timestamp or None
+            Начальная дата котировок. Если None, то загружается вся доступная история
+
+        Returns
+        -------
+        dict
+            Для каждого тикера pandas.DataFrame аналогичный web.moex.quotes
+        """
+        paths = [QUOTES_PATH.format(ticker=ticker) for ticker in tickers]
+        blocks = self.history(paths, _from_query(start))
+        for path, ticker_blocks in zip(paths, blocks):
+            if not ticker_blocks:
+                raise ValueError(f'Пустой ответ. Проверьте запрос: {path}')
+        return {ticker: iss_quotes.concat_blocks(map(iss_quotes.make_df, ticker_blocks))
+                for ticker, ticker_blocks in zip(tickers, blocks)}
+
+    def quotes_t2(self, tickers: tuple, start=None):
+        """Истории котировок в режиме TQBR T+2 для тикеров - словарь аналогичный quotes"""
+        blocks = self.history([QUOTES_T2_PATH.format(ticker=ticker) for ticker in tickers], _from_query(start))
+        return {ticker: iss_quotes_t2.concat_blocks(map(iss_quotes.make_df, ticker_blocks))
+                for ticker, ticker_blocks in zip(tickers, blocks)}
+
+    def quotes_by_date(self, dates: tuple):
+        """Котировки всех бумаг рынка акций во всех режимах торгов за даты
+
+        Один постраничный запрос на каждую дату вместо запроса на каждый тикер
+
+        Parameters
+        ----------
+        dates
+            Кортеж дат pd.Timestamp
+
+        Returns
+        -------
+        pandas.DataFrame
+            В строках результаты торгов, в столбцах [TICKER, DATE, CLOSE_PRICE, VOLUME]
+        """
+        return self._by_date(QUOTES_BY_DATE_PATH, dates)
+
+    def quotes_t2_by_date(self, dates: tuple):
+        """Котировки всех бумаг в режиме TQBR T+2 за даты - DataFrame аналогичный quotes_by_date"""
+        return self._by_date(QUOTES_T2_BY_DATE_PATH, dates)
+
+    def _by_date(self, path: str, dates: tuple):
+        blocks = self._history([(path, {'date': f'{date:%Y-%m-%d}'}) for date in dates])
+        return _tickers_quotes([block for date_blocks in blocks for block in date_blocks])
+
+    def reg_number_tickers(self, reg_numbers: tuple):
+        """Кортежи тикеров для регистрационных номеров - словарь аналогичный web.moex.reg_number_tickers"""
+        responses = self.map(lambda reg_number: self.get_json(REG_NUMBER_PATH, q=reg_number), reg_numbers)
+        result = {}
+        for reg_number, raw_json in zip(reg_numbers, responses):
+            tickers = tuple(iss_tickers.yield_parsed_tickers(raw_json, reg_number))
+            iss_tickers.validate(reg_number, tickers)
+            result[reg_number] = tickers
+        return result
+
+
+def _from_query(start):
+    if start is None:
+        return {}
+    return {'from': f'{start:%Y-%m-%d}'}
+
+
+def _history_block(json_data):
+    return {key: json_data['history'][key] for key in ['data', 'columns']}
+
+
+def _tickers_quotes(blocks: list):
+    """Объединяет блоки с котировками разных тикеров - в отличие от iss_quotes.make_df сохраняется тикер"""
+    if not blocks:
+        return pd.DataFrame(columns=[TICKER, DATE, CLOSE_PRICE, VOLUME])
+    df = pd.concat([pd.DataFrame(**block) for block in blocks], ignore_index=True)
+    quotes = iss_quotes.make_df(dict(data=df))
+    quotes.insert(0, TICKER, df['SECID'])
+    return quotes
+
+
+def _cursor(json_data):
+    """Общее количество строк и размер страницы из блока history.cursor - None, если блока нет"""
+    cursor = json_data.get('history.cursor')
+    if not cursor or not cursor['data']:
+        return None, None
+    row = dict(zip(cursor['columns'], cursor['data'][0]))
+    return row['TOTAL'], row['PAGESIZE']
+
+
+if __name__ == '__main__':
+    with BulkDownloader() as downloader:
+        print(downloader.quotes(('MSTT', 'AKRN')))
@@ -69,11 +69,23 @@ class Quotes:
     def get_df(self, block_position):
         """Формирует DataFrame и выбирает необходимые колонки - даты, цены закрытия и объемы"""
         json_data = self.get_json_data(block_position)
-        df = pd.DataFrame(**json_data)
-        df[DATE] = pd.to_datetime(df['TRADEDATE'])
-        df[CLOSE_PRICE] = pd.to_numeric(df['CLOSE'])
-        df[VOLUME] = pd.to_numeric(df['VOLUME'])
-        return df[[DATE, CLOSE_PRICE, VOLUME]]
+        return make_df(json_data)
+
+
+def make_df(json_data):
+    """Формирует DataFrame из блока данных ответа и выбирает необходимые колонки - даты, цены закрытия и объемы"""
+    df = pd.DataFrame(**json_data)
+    df[DATE] = pd.to_datetime(df['TRADEDATE'])
+    df[CLOSE_PRICE] = pd.to_numeric(df['CLOSE'])
+    df[VOLUME] = pd.to_numeric(df['VOLUME'])
+    return df[[DATE, CLOSE_PRICE, VOLUME]]
+
+
+def concat_blocks(blocks):
+    """Объединяет блоки котировок и для каждой даты выбирает режим торгов с максимальным оборотом"""
+    df = pd.concat(blocks, ignore_index=True)
+    df = df.loc[df.groupby(DATE)[VOLUME].idxmax()]
+    return df.set_index(DATE)
 
 
 def quotes(ticker, start=None):
@@ -97,11 +109,7 @@ def quotes(ticker, start=None):
         В столбцах [CLOSE, VOLUME] цена закрытия и оборот в штуках
     """
     gen = Quotes(ticker, start)
-    df = pd.concat(gen, ignore_index=True)
-    # Для каждой даты выбирается режим торгов с максимальным оборотом
-    df = df.loc[df.groupby(DATE)[VOLUME].idxmax()]
-    df = df.set_index(DATE)
-    return df
+    return concat_blocks(gen)
 
 
 if __name__ == '__main__':
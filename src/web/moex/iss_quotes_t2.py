@@ -39,8 +39,13 @@ def quotes_t2(ticker, start=None):
         В столбцах [CLOSE, VOLUME] цена закрытия и оборот в штуках
     """
     gen = QuotesT2(ticker, start)
+    return concat_blocks(gen)
+
+
+def concat_blocks(blocks):
+    """Объединяет блоки котировок - при отсутствии данных возвращается пустой DataFrame"""
     try:
-        df = pd.concat(gen, ignore_index=True)
+        df = pd.concat(blocks, ignore_index=True)
     except ValueError:
         return pd.DataFrame()
     else:
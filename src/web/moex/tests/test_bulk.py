@@ -0,0 +1,140 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib import parse
+
+import pandas as pd
+import pytest
+
+from web.labels import CLOSE_PRICE, DATE, TICKER, VOLUME
+from web.moex import iss_bulk
+
+COLUMNS = ['BOARDID', 'TRADEDATE', 'CLOSE', 'VOLUME']
+PAGE_SIZE = 3
+HISTORY = {'AKRN': [['TQBR', f'2018-03-{day:02}', 100.0 + day, 10 * day] for day in range(1, 9)],
+           'KUNF': []}
+HISTORY['AKRN'].insert(2, ['EQNE', '2018-03-02', 1.0, 1])
+BY_DATE = {'2018-03-05': [['TQBR', 'AKRN', '2018-03-05', 105.0, 50], ['TQBR', 'GMKN', '2018-03-05', 1.0, 2],
+                          ['EQNE', 'GMKN', '2018-03-05', 2.0, 3], ['TQBR', 'MTSS', '2018-03-05', 3.0, 4]],
+           '2018-03-06': [['TQBR', 'AKRN', '2018-03-06', 106.0, 60]],
+           '2018-03-10': []}
+
+
+class ISSHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    requests = []
+    fail_once = set()
+    cursor = True
+
+    def do_GET(self):
+        url = parse.urlsplit(self.path)
+        query = dict(parse.parse_qsl(url.query))
+        self.requests.append((self.client_address, url.path, query))
+        if url.path in self.fail_once:
+            self.fail_once.discard(url.path)
+            return self._send(500, {})
+        if 'date' in query:
+            return self._send(200, {'history': {'columns': ['BOARDID', 'SECID', 'TRADEDATE', 'CLOSE', 'VOLUME'],
+                                                'data': BY_DATE[query['date']][int(query.get('start', 0)):]}})
+        if url.path.endswith('securities.json'):
+            data = {'securities': {'columns': ['secid', 'regnumber'],
+                                   'data': [['AKRN', query['q']], ['AKRN-old', query['q']]]}}
+            return self._send(200, data)
+        ticker = url.path.split('/')[-1][:-len('.json')]
+        rows = HISTORY[ticker]
+        start = int(query.get('start', 0))
+        data = {'history': {'columns': COLUMNS, 'data': rows[start:start + PAGE_SIZE]}}
+        if self.cursor:
+            data['history.cursor'] = {'columns': ['INDEX', 'TOTAL', 'PAGESIZE'],
+                                      'data': [[start, len(rows), PAGE_SIZE]]}
+        return self._send(200, data)
+
+    def _send(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture()
+def downloader(monkeypatch):
+    monkeypatch.setattr(iss_bulk, 'BACKOFF', 0)
+    ISSHandler.requests = []
+    ISSHandler.fail_once = set()
+    ISSHandler.cursor = True
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ISSHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    with iss_bulk.BulkDownloader(f'http://127.0.0.1:{server.server_address[1]}/iss/', max_workers=2) as bulk:
+        yield bulk
+    server.shutdown()
+    server.server_close()
+
+
+def expected_quotes():
+    df = pd.DataFrame(HISTORY['AKRN'], columns=COLUMNS)
+    df = df.loc[df.groupby('TRADEDATE')['VOLUME'].idxmax()]
+    df = df.rename(columns={'TRADEDATE': DATE, 'CLOSE': CLOSE_PRICE})
+    df[DATE] = pd.to_datetime(df[DATE])
+    return df.set_index(DATE)[[CLOSE_PRICE, VOLUME]]
+
+
+def test_quotes(downloader):
+    result = downloader.quotes(('AKRN',))
+    pd.testing.assert_frame_equal(result['AKRN'], expected_quotes(), check_dtype=False)
+    downloader.quotes(('AKRN',))
+    assert len(ISSHandler.requests) == 6
+    assert len({address for address, *_ in ISSHandler.requests}) <= 2
+
+
+def test_quotes_without_cursor(downloader):
+    ISSHandler.cursor = False
+    result = downloader.quotes(('AKRN',))
+    pd.testing.assert_frame_equal(result['AKRN'], expected_quotes(), check_dtype=False)
+
+
+def test_quotes_start(downloader):
+    downloader.quotes(('AKRN',), pd.Timestamp('2018-03-05'))
+    assert all(query['from'] == '2018-03-05' for *_, query in ISSHandler.requests)
+
+
+def test_quotes_retry(downloader):
+    ISSHandler.fail_once = {'/iss/' + iss_bulk.QUOTES_PATH.format(ticker='AKRN')}
+    result = downloader.quotes(('AKRN',))
+    assert len(result['AKRN']) == 8
+
+
+def test_quotes_empty(downloader):
+    with pytest.raises(ValueError) as error:
+        downloader.quotes(('AKRN', 'KUNF'))
+    assert 'KUNF' in str(error.value)
+
+
+def test_quotes_t2(downloader):
+    result = downloader.quotes_t2(('AKRN', 'KUNF'))
+    assert len(result['AKRN']) == 9
+    assert result['KUNF'].empty
+
+
+def test_reg_number_tickers(downloader):
+    result = downloader.reg_number_tickers(('1-02-65104-D',))
+    assert result == {'1-02-65104-D': ('AKRN', 'AKRN-old')}
+
+
+def test_quotes_by_date(downloader):
+    dates = tuple(pd.DatetimeIndex(list(BY_DATE)))
+    df = downloader.quotes_by_date(dates)
+    assert list(df.columns) == [TICKER, DATE, CLOSE_PRICE, VOLUME]
+    assert df[TICKER].tolist() == ['AKRN', 'GMKN', 'GMKN', 'MTSS', 'AKRN']
+    assert df[DATE].iloc[-1] == pd.Timestamp('2018-03-06')
+    assert {query['date'] for *_, query in ISSHandler.requests} == set(BY_DATE)
+
+
+def test_quotes_by_date_empty(downloader):
+    df = downloader.quotes_t2_by_date((pd.Timestamp('2018-03-10'),))
+    assert df.empty
+    assert list(df.columns) == [TICKER, DATE, CLOSE_PRICE, VOLUME]